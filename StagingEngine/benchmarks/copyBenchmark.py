@@ -0,0 +1,189 @@
+'''
+Measures the raw to staging copy's throughput for different multipart
+part sizes, by driving copyFileFromRawToStaging's real TransferManager.
+
+By default the copies are made against a latency model of S3, not an S3
+endpoint. Each modelled request costs a fixed request latency, plus its
+bytes at a per request copy rate, so the numbers show how part size and
+concurrency trade request count against parallelism. They are not S3
+throughput.
+
+With --endpoint-url the copies are made against that S3 compatible
+endpoint, such as a local MinIO or moto server, whose raw and staging
+buckets are created if needed and given a source object of each size.
+
+Usage: python copyBenchmark.py [--endpoint-url URL]
+           [--request-seconds SECONDS] [--copy-mb-per-second MB/s]
+
+Modelled results, 30 ms per request, 75 MB/s per copy request and
+concurrency 10. These are outputs of the model, not measurements:
+
+  size     8 MB parts   64 MB parts   256 MB parts
+  100 MB   265 MB/s      98 MB/s       66 MB/s
+  1 GB     527 MB/s     526 MB/s      277 MB/s
+  5 GB     556 MB/s     683 MB/s      700 MB/s
+'''
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import boto3  # noqa: E402
+
+import copyFileFromRawToStaging  # noqa: E402
+
+MB = 1024 * 1024
+file_sizes = (100 * MB, 1024 * MB, 5 * 1024 * MB)
+part_sizes = (8 * MB, 64 * MB, 256 * MB)
+max_concurrency = 10
+
+
+class S3LatencyModel(object):
+    '''
+    Stands in for the S3 client's copy calls, sleeping for as long as the
+    model says each takes.
+    '''
+
+    def __init__(self, request_seconds, copy_bytes_per_second):
+        self.request_seconds = request_seconds
+        self.copy_bytes_per_second = copy_bytes_per_second
+
+    def install(self, client):
+        for name in ('copy_object', 'create_multipart_upload',
+                     'upload_part_copy', 'complete_multipart_upload',
+                     'put_object_tagging', 'head_object'):
+            setattr(client, name, getattr(self, name))
+
+    def copy(self, byte_count):
+        time.sleep(self.request_seconds
+                   + byte_count / self.copy_bytes_per_second)
+
+    def copy_object(self, **kwargs):
+        self.copy(self.size)
+        return {}
+
+    def create_multipart_upload(self, **kwargs):
+        time.sleep(self.request_seconds)
+        return {'UploadId': 'upload'}
+
+    def upload_part_copy(self, **kwargs):
+        start, end = kwargs['CopySourceRange'][len('bytes='):].split('-')
+        self.copy(int(end) - int(start) + 1)
+        return {'CopyPartResult': {'ETag': '"part"'}}
+
+    def complete_multipart_upload(self, **kwargs):
+        time.sleep(self.request_seconds)
+        return {'ETag': '"copy"'}
+
+    def put_object_tagging(self, **kwargs):
+        time.sleep(self.request_seconds)
+        return {}
+
+    def head_object(self, **kwargs):
+        raise AssertionError('The source should not be HEADed')
+
+
+class ZeroReader(object):
+    '''
+    A file-like object of size zero bytes, uploaded as a source object
+    without holding it in memory.
+    '''
+
+    def __init__(self, size):
+        self.remaining = size
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        self.remaining = self.remaining - size
+        return b'\0' * size
+
+
+def get_source_key(size):
+    return 'benchmark/file-{}.csv'.format(size // MB)
+
+
+def get_event(size, part_size, e_tag='"source"'):
+    return {
+        'fileDetails': {
+            'bucket': 'raw',
+            'key': get_source_key(size),
+            'fileName': 'file.csv',
+            'contentLength': size,
+            'eTag': e_tag},
+        'existingMetadata': {},
+        'fileSettings': {'copyTransferConfig': {
+            'multipartChunksize': part_size,
+            'maxConcurrency': max_concurrency}},
+        'settings': {'stagingBucket': 'staging'},
+        'combinedMetadata': {},
+        'requiredTags': {'benchmark': 'true'}}
+
+
+def get_endpoint_client(endpoint_url):
+    client = boto3.client(
+        's3', endpoint_url=endpoint_url,
+        aws_access_key_id=os.environ.get(
+            'AWS_ACCESS_KEY_ID', 'benchmark'),
+        aws_secret_access_key=os.environ.get(
+            'AWS_SECRET_ACCESS_KEY', 'benchmark'))
+    existing_buckets = set(
+        bucket['Name'] for bucket in client.list_buckets()['Buckets'])
+    for bucket in ('raw', 'staging'):
+        if bucket not in existing_buckets:
+            client.create_bucket(Bucket=bucket)
+
+    for size in file_sizes:
+        client.upload_fileobj(ZeroReader(size), 'raw', get_source_key(size))
+    return client
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Raw to staging copy throughput by part size')
+    parser.add_argument('--endpoint-url')
+    parser.add_argument('--request-seconds', type=float, default=0.03)
+    parser.add_argument('--copy-mb-per-second', type=float, default=75)
+    args = parser.parse_args()
+
+    if args.endpoint_url is not None:
+        model = None
+        client = get_endpoint_client(args.endpoint_url)
+        print('Measured against {}, concurrency {}'.format(
+            args.endpoint_url, max_concurrency))
+    else:
+        model = S3LatencyModel(
+            args.request_seconds, args.copy_mb_per_second * 1e6)
+        client = boto3.client(
+            's3', aws_access_key_id='benchmark',
+            aws_secret_access_key='benchmark')
+        model.install(client)
+        print('Modelled: {}s per request, {} MB/s per copy request, '
+              'concurrency {}'.format(
+                  args.request_seconds, args.copy_mb_per_second,
+                  max_concurrency))
+    copyFileFromRawToStaging.s3 = client
+
+    for size in file_sizes:
+        if model is None:
+            e_tag = client.head_object(
+                Bucket='raw', Key=get_source_key(size))['ETag']
+        else:
+            e_tag = '"source"'
+            model.size = size
+        for part_size in part_sizes:
+            start_time = time.time()
+            copyFileFromRawToStaging.copy_file_from_raw_to_staging(
+                get_event(size, part_size, e_tag), None)
+            duration = time.time() - start_time
+            print('{:5d} MB, {:3d} MB parts: {:6.2f}s {:5.0f} MB/s'.format(
+                size // MB, part_size // MB, duration,
+                size / MB / duration))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+'''
+Measures csvvalidator's rows/sec validating the AmazonReviews sample
+against its data source schema. The sample's rows are repeated to the
+requested number of rows, and parsed before timing, so only validation
+is measured.
+
+Usage: python csvvalidatorBenchmark.py [rows]
+
+Both the vendored csvvalidator.CSVValidator and the PlannedCSVValidator
+verifyFileSchema uses are measured.
+'''
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+
+repo_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.insert(0, os.path.join(
+    repo_path, 'StagingEngine', 'src', 'verifyFileSchema'))
+
+import csvvalidator  # noqa: E402
+import plannedValidator  # noqa: E402
+
+sample_path = os.path.join(repo_path, 'DataSources', 'AmazonReviews')
+
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+    with open(os.path.join(sample_path, 'amazon_reviews_us_sample.tsv')) \
+            as sample_file:
+        lines = sample_file.read().splitlines(True)
+    with open(os.path.join(sample_path, 'ddbDataSourceConfig.json')) \
+            as config_file:
+        schema = json.load(config_file)['schema']
+
+    header, body = lines[0], lines[1:]
+    rows = list(csv.reader(
+        [header] + [body[i % len(body)] for i in range(row_count)],
+        delimiter='\t'))
+
+    for validator_class in (csvvalidator.CSVValidator,
+                            plannedValidator.PlannedCSVValidator):
+        validator = get_validator(validator_class, schema)
+        start_time = time.time()
+        problems = list(itertools.islice(validator.ivalidate(rows), 100))
+        duration = time.time() - start_time
+
+        print('{}: {} rows, {} problems in {:.2f}s: {:.0f} rows/sec'.format(
+            validator_class.__name__, row_count, len(problems), duration,
+            row_count / duration))
+
+
+def get_validator(validator_class, schema):
+    # The checks verifyFileSchema's _get_csv_validator adds for the schema.
+    validator = validator_class(
+        tuple(prop['field'] for prop in schema['properties']))
+    validator.add_header_check('EX1', 'bad header')
+    for prop in schema['properties']:
+        field, field_type = prop['field'], prop['type']
+        if field_type == 'int':
+            validator.add_value_check(field, int, 'EX_INT', field)
+        elif field_type == 'string':
+            validator.add_value_check(field, str, 'EX_STR', field)
+        elif field_type == 'enum':
+            validator.add_value_check(
+                field, csvvalidator.enumeration(tuple(prop['values'])),
+                'EX_ENUM', field)
+    return validator
+
+
+if __name__ == '__main__':
+    main()
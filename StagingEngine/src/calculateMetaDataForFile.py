@@ -1,16 +1,27 @@
 import base64
-import hashlib
+import binascii
+import itertools
+import os
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
-import boto3
+import metadataCalculators
+import s3ObjectHeader
 
 
 class CalculateMetaDataForFileException(Exception):
     pass
 
 
-s3 = boto3.client('s3')
+# Bytes read from S3 at a time when calculating metadata.
+read_chunk_size = int(
+    os.environ.get('READ_CHUNK_SIZE', str(8 * 1024 * 1024)))
+# Objects at least this size are read with parallel ranged GETs.
+parallel_read_min_bytes = int(
+    os.environ.get('PARALLEL_READ_MIN_BYTES', str(64 * 1024 * 1024)))
+# Max ranged GETs in flight. Each holds read_chunk_size bytes in memory.
+read_concurrency = int(os.environ.get('READ_CONCURRENCY', '4'))
 
 
 def lambda_handler(event, context):
@@ -47,61 +58,174 @@ def calculate_additional_metadata(event, context):
     :raises CalculateMetaDataForFileException: On any error or exception
     '''
     try:
-        bucket = event['fileDetails']['bucket']
-        key = event['fileDetails']['key']
+        file_header = s3ObjectHeader.get_object_header(event)
+        created_date = get_created_date(file_header)
+        calculators = metadataCalculators.get_metadata_calculators(
+            event['fileSettings'])
+        calculated_metadata = {}
+
+        if 'md5FromETag' in event['fileSettings'] \
+                and event['fileSettings']['md5FromETag'] == 'True' \
+                and any(c.name == 'md5' for c in calculators):
+            md5 = _get_md5_from_etag(file_header)
+            if md5 is not None:
+                calculated_metadata['staged_md5'] = md5
+                calculators = [c for c in calculators if c.name != 'md5']
+
+        if calculators:
+            calculated_metadata.update(
+                calculate_metadata(event, file_header, calculators))
+
+        return add_metadata_to_event(event, created_date, calculated_metadata)
 
-        existing_metadata = event['existingMetadata']
-        required_metadata = event['requiredMetadata']
-        required_metadata.update({'staging_time': str(int(time.time() * 1000))})
-        required_metadata.update({'created_date': get_created_date(bucket, key)})
+    except Exception as e:
+        traceback.print_exc()
+        raise CalculateMetaDataForFileException(e)
 
-        if 'calculateMD5' in event['fileSettings'] \
-                and event['fileSettings']['calculateMD5'] == 'True':
-            required_metadata.update({'staged_md5': get_md5(bucket, key)})
 
-        combinedMetadata = {}
-        combinedMetadata.update(existing_metadata)
-        combinedMetadata.update(required_metadata)
+def add_metadata_to_event(event, created_date, calculated_metadata=None):
+    '''
+    add_metadata_to_event Adds the calculated metadata to the event's
+    required metadata, and combines it with the file's existing metadata.
+
+    :param event: The event passed to the staging step function
+    :type event: Python Dict
+    :param created_date: The created date of the file
+    :type created_date: Python String
+    :param calculated_metadata: The metadata calculated from the content
+    :type calculated_metadata: Python Dict, optional
+    :return: The event, with combinedMetadata added
+    :rtype: Python Dict
+    '''
+    existing_metadata = event['existingMetadata']
+    required_metadata = event['requiredMetadata']
+    required_metadata.update({'staging_time': str(int(time.time() * 1000))})
+    required_metadata.update({'created_date': created_date})
 
-        event.update({'combinedMetadata': combinedMetadata})
+    if calculated_metadata is not None:
+        required_metadata.update(calculated_metadata)
 
-        return event
+    combinedMetadata = {}
+    combinedMetadata.update(existing_metadata)
+    combinedMetadata.update(required_metadata)
 
-    except Exception as e:
-        traceback.print_exc()
-        raise CalculateMetaDataForFileException(e)
+    event.update({'combinedMetadata': combinedMetadata})
+
+    return event
 
 
-def get_created_date(bucket, key):
+def get_created_date(file_header):
     '''
     get_created_date Gets the LastModified date (in this case, the
     created date) of the file.
 
-    :param bucket:  The S3 bucket name
-    :type bucket: Python String
-    :param key: The S3 object key
-    :type key: Python String
+    :param file_header: The head_object response for the file
+    :type file_header: Python Dict
     :return: The created date
     :rtype: Python String
     '''
-    file_header = s3.head_object(Bucket=bucket, Key=key)
     return str(file_header['LastModified'])
 
 
-def get_md5(bucket, key):
+def calculate_metadata(event, file_header, calculators):
+    '''
+    calculate_metadata Reads the new file once, passing its content to
+    every metadata calculator in order. The object is read
+    read_chunk_size bytes at a time, so objects of any size can be read.
+    Large objects are read with parallel ranged GETs.
+
+    :param event: The event passed to the staging step function
+    :type event: Python Dict
+    :param file_header: The head_object response for the file
+    :type file_header: Python Dict
+    :param calculators: The metadata calculators to update
+    :type calculators: Python List
+    :return: The calculated metadata
+    :rtype: Python Dict
+    '''
+    content_length = file_header['ContentLength']
+    if content_length >= parallel_read_min_bytes and read_concurrency > 1:
+        chunks = _iterate_ranges(event, content_length)
+    else:
+        chunks = _iterate_object(event)
+
+    for chunk in chunks:
+        for calculator in calculators:
+            calculator.update(chunk)
+
+    return metadataCalculators.get_calculated_metadata(calculators)
+
+
+def _iterate_object(event):
+    '''
+    _iterate_object Streams the object read_chunk_size bytes at a time.
+
+    :param event: The event passed to the staging step function
+    :type event: Python Dict
+    :return: Iterator over the content of the object
+    :rtype: Python Generator
+    '''
+    s3_object = s3ObjectHeader.get_object(event)
+    while True:
+        chunk = s3_object['Body'].read(read_chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def _get_md5_from_etag(file_header):
     '''
-    get_md5 Returns the MDS of the given S3 object
+    _get_md5_from_etag Returns the MD5 of the object from its ETag.
+    The ETag is only the MD5 for objects uploaded in a single part, and
+    encrypted with SSE-S3 or not at all.
 
-    :param bucket:  The S3 bucket name
-    :type bucket: Python String
-    :param key: The S3 object key
-    :type key: Python String
-    :return: The MD5 of the file contents
+    :param file_header: The head_object response for the file
+    :type file_header: Python Dict
+    :return: The base64 encoded MD5, or None if the ETag is not the MD5
     :rtype: Python String
     '''
-    s3_object = s3.get_object(Bucket=bucket, Key=key)
-    content = s3_object['Body'].read()
-    md5_bytes = hashlib.md5(content).digest()
-    md5_base64 = base64.b64encode(md5_bytes).decode('ascii')
+    etag = file_header['ETag'].strip('"')
+    if '-' in etag \
+            or file_header.get('ServerSideEncryption', 'AES256') != 'AES256' \
+            or 'SSECustomerAlgorithm' in file_header:
+        return None
 
-    return md5_base64
+    try:
+        md5_bytes = binascii.unhexlify(etag)
+    except (binascii.Error, ValueError):
+        return None
+    if len(md5_bytes) != 16:
+        return None
+
+    return base64.b64encode(md5_bytes).decode('ascii')
+
+
+def _iterate_ranges(event, content_length):
+    '''
+    _iterate_ranges Reads the object in read_chunk_size byte ranges
+    with parallel ranged GETs, passing on each range in order once it and
+    the ranges before it have arrived. At most read_concurrency ranges
+    are held in memory at once.
+
+    :param event: The event passed to the staging step function
+    :type event: Python Dict
+    :param content_length: The size of the object
+    :type content_length: Python Integer
+    :return: Iterator over the content of the object
+    :rtype: Python Generator
+    '''
+    def get_range(start):
+        s3_object = s3ObjectHeader.get_object(
+            event,
+            Range='bytes={}-{}'.format(start, start + read_chunk_size - 1))
+        return s3_object['Body'].read()
+
+    starts = iter(range(0, content_length, read_chunk_size))
+    with ThreadPoolExecutor(max_workers=read_concurrency) as executor:
+        pending = [executor.submit(get_range, start)
+                   for start in itertools.islice(starts, read_concurrency)]
+        while pending:
+            chunk = pending.pop(0).result()
+            for start in itertools.islice(starts, 1):
+                pending.append(executor.submit(get_range, start))
+            yield chunk
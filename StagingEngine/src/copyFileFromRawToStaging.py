@@ -1,9 +1,15 @@
+import os
 import re
 import traceback
+from urllib.parse import urlencode
 
 import boto3
+from boto3.s3.transfer import TransferConfig, create_transfer_manager
 from dateutil import parser
 from dateutil.tz import gettz
+from s3transfer.subscribers import BaseSubscriber
+
+import s3ObjectHeader
 
 
 class CopyFileFromRawToStagingException(Exception):
@@ -12,6 +18,13 @@ class CopyFileFromRawToStagingException(Exception):
 
 s3 = boto3.client('s3')
 dynamodb = boto3.resource('dynamodb')
+# Default copy transfer settings, overridden per filetype by the
+# copyTransferConfig file setting.
+copy_multipart_threshold = int(os.environ.get(
+    'COPY_MULTIPART_THRESHOLD', str(8 * 1024 * 1024)))
+copy_multipart_chunksize = int(os.environ.get(
+    'COPY_MULTIPART_CHUNKSIZE', str(8 * 1024 * 1024)))
+copy_max_concurrency = int(os.environ.get('COPY_MAX_CONCURRENCY', '10'))
 
 
 def lambda_handler(event, context):
@@ -54,40 +67,110 @@ def copy_file_from_raw_to_staging(event, context):
         staging_bucket = event['settings']['stagingBucket']
         metadata = event['combinedMetadata']
 
-        staging_key = _get_staging_key(
-            event['fileDetails'],
-            event['fileSettings'],
-            metadata)
+        staging_key = get_staging_key(event)
 
         # Copy the object to staging and apply the specified tags and metadata.
         print('Copying object {} from bucket {} to key {} in bucket {}'.format(
             raw_key, raw_bucket, staging_key, staging_bucket))
+        file_header = s3ObjectHeader.get_object_header(event)
         copy_source = {'Bucket': raw_bucket, 'Key': raw_key}
-        s3.copy(
-            copy_source,
-            staging_bucket,
-            staging_key,
-            ExtraArgs={"Metadata": metadata, "MetadataDirective": "REPLACE"})
+        extra_args = {
+            "Metadata": metadata,
+            "MetadataDirective": "REPLACE",
+            "TaggingDirective": "REPLACE",
+            "CopySourceIfMatch": file_header['ETag']
+        }
+        tagging = get_tagging(event)
+        if tagging:
+            extra_args["Tagging"] = tagging
+
+        transfer_config = _get_transfer_config(event['fileSettings'])
+        with create_transfer_manager(s3, transfer_config) as manager:
+            future = manager.copy(
+                copy_source,
+                staging_bucket,
+                staging_key,
+                extra_args=extra_args,
+                subscribers=[_CopySourceHeaderSubscriber(file_header)])
+            future.result()
         event['fileDetails'].update({"stagingKey": staging_key})
 
-        # Generate the tag list.
-        tagList = []
-        for tagKey in event['requiredTags']:
-            tag = {'Key': tagKey, 'Value': event['requiredTags'][tagKey]}
-            tagList.append(tag)
-
-        # Apply the tag list.
-        s3.put_object_tagging(
-            Bucket=staging_bucket,
-            Key=staging_key,
-            Tagging={'TagSet': tagList})
-
         return event
     except Exception as e:
         traceback.print_exc()
         raise CopyFileFromRawToStagingException(e)
 
 
+def get_staging_key(event):
+    '''
+    get_staging_key Returns the staging key (folders + filename) of
+    the file, once its metadata has been calculated.
+
+    :param event: The event passed to the staging step function
+    :type event: Python Dict
+    :return: The staging key of this file
+    :rtype: Python String
+    '''
+    return _get_staging_key(
+        event['fileDetails'],
+        event['fileSettings'],
+        event['combinedMetadata'])
+
+
+def get_tagging(event):
+    '''
+    get_tagging Generates the tags applied to the staged file, in the
+    form the Tagging argument of copy and upload requests takes.
+
+    :param event: The event passed to the staging step function
+    :type event: Python Dict
+    :return: The tags, URL encoded
+    :rtype: Python String
+    '''
+    return urlencode([
+        (tagKey, event['requiredTags'][tagKey])
+        for tagKey in event['requiredTags']])
+
+
+def _get_transfer_config(file_settings):
+    '''
+    _get_transfer_config Returns the transfer settings used to copy the
+    filetype's files. A copyTransferConfig file setting can set the
+    multipartThreshold, multipartChunksize (both in bytes) and
+    maxConcurrency of the copy, to suit the filetype's file sizes.
+
+    :param file_settings: The filetype's file settings
+    :type file_settings: Python Dict
+    :return: The transfer settings
+    :rtype: boto3.s3.transfer.TransferConfig
+    '''
+    copy_settings = file_settings.get('copyTransferConfig', {})
+    return TransferConfig(
+        multipart_threshold=int(copy_settings.get(
+            'multipartThreshold', copy_multipart_threshold)),
+        multipart_chunksize=int(copy_settings.get(
+            'multipartChunksize', copy_multipart_chunksize)),
+        max_concurrency=int(copy_settings.get(
+            'maxConcurrency', copy_max_concurrency)))
+
+
+class _CopySourceHeaderSubscriber(BaseSubscriber):
+    '''
+    Gives the transfer manager the copy source's size and ETag from the
+    captured header, so it doesn't HEAD the source object again.
+    '''
+
+    def __init__(self, file_header):
+        self.size = file_header['ContentLength']
+        self.etag = file_header['ETag']
+
+    def on_queued(self, future, **kwargs):
+        future.meta.provide_transfer_size(self.size)
+        # Older s3transfer versions only need the size.
+        if hasattr(future.meta, 'provide_object_etag'):
+            future.meta.provide_object_etag(self.etag)
+
+
 def _get_staging_key(file_details, file_settings, metadata):
     '''
     _get_staging_key Given the supplied file details, settings and
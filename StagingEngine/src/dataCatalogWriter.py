@@ -0,0 +1,172 @@
+import os
+import random
+import time
+from contextlib import contextmanager
+
+import boto3
+from botocore.exceptions import ClientError
+
+
+class DataCatalogWriterException(Exception):
+    def __init__(self, message, unwritten_items=None):
+        super(DataCatalogWriterException, self).__init__(message)
+        # (table name, item) pairs that weren't written.
+        self.unwritten_items = unwritten_items or []
+
+
+dynamodb = boto3.resource('dynamodb')
+
+# Most items DynamoDB accepts in one BatchWriteItem request.
+batch_size = 25
+# Attempts made to write an item DynamoDB leaves unprocessed.
+max_attempts = int(os.environ.get('CATALOG_WRITE_MAX_ATTEMPTS', '8'))
+# Base and cap of the jittered exponential backoff between attempts.
+retry_base_seconds = float(
+    os.environ.get('CATALOG_WRITE_RETRY_BASE_SECONDS', '0.05'))
+retry_max_seconds = 5
+
+# The data catalog table's key. Only the last of several items with the
+# same key is written, as BatchWriteItem rejects duplicate keys.
+KEY_ATTRIBUTES = ('rawKey', 'catalogTime')
+
+# Errors for which the whole request is retried, as DynamoDB is busy.
+RETRYABLE_ERROR_CODES = (
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+    'InternalServerError'
+)
+
+# Module level so items can be buffered across calls. Map table name to
+# the items waiting to be written to it, and to the items already sent
+# that couldn't be written, to be reported when the buffer is flushed.
+_buffer = {}
+_unwritten = {}
+_buffering = 0
+
+
+def write_item(table_name, item):
+    '''
+    write_item Writes an item to a data catalog table. Inside a
+    buffered() block the item is only buffered, and written with others
+    once a full batch is waiting or the block ends.
+
+    :param table_name: The DynamoDB table name
+    :type table_name: Python String
+    :param item: The item to write
+    :type item: Python Dict
+    :raises DataCatalogWriterException: If not buffering, and the item
+        couldn't be written. Inside a buffered() block it never raises.
+    '''
+    items = _buffer.setdefault(table_name, [])
+    items.append(item)
+
+    if _buffering == 0:
+        flush(table_name)
+    elif len(items) >= batch_size:
+        # The batch leaves the buffer before it is sent, so it is never
+        # sent twice. Items it couldn't write are reported by flush().
+        batch = items[:batch_size]
+        del items[:batch_size]
+        _unwritten.setdefault(table_name, []).extend(
+            _write_batch(table_name, batch))
+
+
+def flush(table_name=None):
+    '''
+    flush Writes every buffered item. Every batch is attempted, even if
+    earlier ones couldn't be written, and items that still can't be
+    written after max_attempts are dropped from the buffer and reported.
+
+    :param table_name: The table to flush, defaults to all tables
+    :param table_name: Python String, optional
+    :raises DataCatalogWriterException: If any items couldn't be written,
+        with the items in its unwritten_items
+    '''
+    if table_name is None:
+        table_names = set(_buffer) | set(_unwritten)
+    else:
+        table_names = [table_name]
+
+    unwritten_items = []
+    for name in table_names:
+        items = _buffer.pop(name, [])
+        table_unwritten_items = _unwritten.pop(name, [])
+        for start in range(0, len(items), batch_size):
+            table_unwritten_items.extend(
+                _write_batch(name, items[start:start + batch_size]))
+        for unwritten_item in table_unwritten_items:
+            print('Failed to write item to {}: {}'.format(
+                name, unwritten_item))
+            unwritten_items.append((name, unwritten_item))
+
+    if len(unwritten_items) > 0:
+        raise DataCatalogWriterException(
+            'Failed to write {} items to the data catalog'
+            .format(len(unwritten_items)), unwritten_items)
+
+
+@contextmanager
+def buffered():
+    '''
+    buffered Buffers the items written in the block, so they are written
+    in batches, and flushes them when it ends. Used when staging many
+    files in one invocation.
+
+    :raises DataCatalogWriterException: If any items couldn't be written
+    '''
+    global _buffering
+    _buffering = _buffering + 1
+    try:
+        yield
+    finally:
+        _buffering = _buffering - 1
+        if _buffering == 0:
+            flush()
+
+
+def _write_batch(table_name, items):
+    '''
+    _write_batch Writes up to batch_size items with BatchWriteItem,
+    retrying the items DynamoDB leaves unprocessed with jittered
+    exponential backoff.
+
+    :param table_name: The DynamoDB table name
+    :type table_name: Python String
+    :param items: The items to write
+    :type items: Python List
+    :return: The items still unwritten after max_attempts, or all of
+        them if DynamoDB rejects the request
+    :rtype: Python List
+    '''
+    items_by_key = {}
+    for item in items:
+        items_by_key[tuple(item.get(name) for name in KEY_ATTRIBUTES)] = item
+    requests = [{'PutRequest': {'Item': item}}
+                for item in items_by_key.values()]
+
+    attempt = 1
+    while True:
+        try:
+            # The resource's client converts the items to DynamoDB types.
+            response = dynamodb.meta.client.batch_write_item(
+                RequestItems={table_name: requests})
+            requests = response.get(
+                'UnprocessedItems', {}).get(table_name, [])
+        except ClientError as e:
+            if e.response['Error']['Code'] not in RETRYABLE_ERROR_CODES:
+                # Retrying can't help, and raising would fail whichever
+                # file's write happened to fill the batch.
+                print('Failed to write {} items to {}: {}'.format(
+                    len(requests), table_name, e))
+                return [request['PutRequest']['Item']
+                        for request in requests]
+
+        if len(requests) == 0:
+            return []
+        if attempt >= max_attempts:
+            return [request['PutRequest']['Item'] for request in requests]
+
+        time.sleep(random.uniform(0, min(
+            retry_max_seconds, retry_base_seconds * 2 ** attempt)))
+        attempt = attempt + 1
@@ -0,0 +1,227 @@
+import copy
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import boto3
+
+
+dynamodb = boto3.resource('dynamodb')
+
+# How long a warm lambda container trusts its copy of the data source
+# table before checking for changes.
+cache_ttl_seconds = int(os.environ.get('DATA_SOURCE_CACHE_TTL_SECONDS', '60'))
+
+# The fileType of the optional item whose 'version' attribute is changed
+# whenever the data sources are edited. If it exists, an expired cache is
+# revalidated with a single get_item rather than a full table scan.
+DATA_SOURCE_VERSION_FILE_TYPE = '_dataSourceVersion'
+
+# The attributes of every data source loaded by a scan, for matching file
+# types. The rest of a data source, such as its schema, is only read once
+# it's needed.
+DATA_SOURCE_SUMMARY_PROJECTION = 'fileType, fileSettings.fileNamePattern'
+
+# Number of DynamoDB parallel scan segments used to load the data sources.
+# Increase for very large data source tables to keep cold starts fast.
+scan_segments = int(os.environ.get('DATA_SOURCE_SCAN_SEGMENTS', '1'))
+
+# Module level so it survives between invocations of a warm container.
+# Maps data source table name to its cached data sources.
+_cache = {}
+
+
+def get_all_data_sources(table_name):
+    '''
+    get_all_data_sources Returns the fileType and fileNamePattern of
+    every configured data source, served from the warm container cache
+    when it is still valid. The returned list is only replaced when the
+    data sources are reloaded, so callers can key their own derived
+    caches on its identity.
+
+    :param table_name: The DynamoDB data source table name
+    :type table_name: Python String
+    :return: The fileType and fileSettings.fileNamePattern of every item
+    :rtype: Python List
+    '''
+    return _get_cache_entry(table_name)['dataSources']
+
+
+def get_data_source(table_name, file_type):
+    '''
+    get_data_source Returns the data source config for the given
+    fileType. Each data source is read with strong consistency the first
+    time it's needed after the cache is loaded, and kept until the cache
+    is next reloaded. A copy is returned so callers can modify it without
+    changing the cache.
+
+    :param table_name: The DynamoDB data source table name
+    :type table_name: Python String
+    :param file_type: The fileType (partition key) of the data source
+    :type file_type: Python String
+    :return: The data source item, or None if it does not exist
+    :rtype: Python Dict
+    '''
+    cache_entry = _get_cache_entry(table_name)
+    data_source = cache_entry['dataSourcesByFileType'].get(file_type)
+    if data_source is None:
+        ddb_table = dynamodb.Table(table_name)
+        response = ddb_table.get_item(
+            Key={'fileType': file_type}, ConsistentRead=True)
+        data_source = response.get('Item')
+        if data_source is not None:
+            cache_entry['dataSourcesByFileType'][file_type] = data_source
+
+    return copy.deepcopy(data_source)
+
+
+def invalidate(table_name=None):
+    '''
+    invalidate Drops the cached data sources so the next lookup
+    reloads them from DynamoDB.
+
+    :param table_name: The table to drop, defaults to all tables
+    :param table_name: Python String, optional
+    '''
+    if table_name is None:
+        _cache.clear()
+    else:
+        _cache.pop(table_name, None)
+
+
+def _get_cache_entry(table_name):
+    '''
+    _get_cache_entry Returns the valid cache entry for the table.
+    Within the TTL the cached entry is used as is. After the TTL, if the
+    version item is unchanged the entry is kept for another TTL,
+    otherwise the data sources are reloaded.
+
+    :param table_name: The DynamoDB data source table name
+    :type table_name: Python String
+    :return: The cache entry for the table
+    :rtype: Python Dict
+    '''
+    now = time.time()
+    cache_entry = _cache.get(table_name)
+
+    if cache_entry is not None and now < cache_entry['expiresAt']:
+        return cache_entry
+
+    version = _get_data_source_version(table_name)
+    if cache_entry is not None \
+            and version is not None \
+            and version == cache_entry['version']:
+        cache_entry['expiresAt'] = now + cache_ttl_seconds
+        return cache_entry
+
+    data_sources = _load_data_sources(table_name)
+    cache_entry = {
+        'version': version,
+        'expiresAt': now + cache_ttl_seconds,
+        'dataSources': data_sources,
+        # Filled in as each data source is read whole.
+        'dataSourcesByFileType': {}
+    }
+    _cache[table_name] = cache_entry
+
+    print('Loaded {} data sources from {} at version {}'.format(
+        len(data_sources), table_name, version))
+
+    return cache_entry
+
+
+def _get_data_source_version(table_name):
+    '''
+    _get_data_source_version Reads the data source version item.
+
+    :param table_name: The DynamoDB data source table name
+    :type table_name: Python String
+    :return: The current version, or None if no version item exists
+    :rtype: Python String
+    '''
+    ddb_table = dynamodb.Table(table_name)
+    response = ddb_table.get_item(
+        Key={'fileType': DATA_SOURCE_VERSION_FILE_TYPE},
+        ConsistentRead=True)
+    if 'Item' not in response or 'version' not in response['Item']:
+        return None
+    return str(response['Item']['version'])
+
+
+def scan_data_sources(table_name, total_segments=None, projection=None):
+    '''
+    scan_data_sources Iterates over every item in the data source table,
+    following scan pagination so no items are missed once the table
+    exceeds one scan page. With more than one segment, the segments are
+    scanned in parallel and items are yielded as each page arrives.
+
+    :param table_name: The DynamoDB data source table name
+    :type table_name: Python String
+    :param total_segments: Parallel scan segments, defaults to scan_segments
+    :param total_segments: Python Integer, optional
+    :param projection: Only read these attributes, defaults to all
+    :type projection: Python String, optional
+    :return: Iterator over the data source table's items
+    :rtype: Python Generator
+    '''
+    if total_segments is None:
+        total_segments = scan_segments
+
+    base_scan_args = {'TableName': table_name}
+    if projection is not None:
+        base_scan_args['ProjectionExpression'] = projection
+
+    if total_segments <= 1:
+        scan_args = dict(base_scan_args)
+        while True:
+            response = dynamodb.meta.client.scan(**scan_args)
+            for item in response['Items']:
+                yield item
+            if 'LastEvaluatedKey' not in response:
+                break
+            scan_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        return
+
+    # The low level client is thread safe (the resource is not), and the
+    # resource's client still deserializes items into Python types.
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        pending = {}
+        for segment in range(total_segments):
+            scan_args = dict(
+                base_scan_args,
+                Segment=segment,
+                TotalSegments=total_segments)
+            future = executor.submit(dynamodb.meta.client.scan, **scan_args)
+            pending[future] = scan_args
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                scan_args = pending.pop(future)
+                response = future.result()
+                if 'LastEvaluatedKey' in response:
+                    scan_args = dict(
+                        scan_args,
+                        ExclusiveStartKey=response['LastEvaluatedKey'])
+                    next_future = executor.submit(
+                        dynamodb.meta.client.scan, **scan_args)
+                    pending[next_future] = scan_args
+                for item in response['Items']:
+                    yield item
+
+
+def _load_data_sources(table_name):
+    '''
+    _load_data_sources Scans and retrieves the fileType and
+    fileNamePattern of all data sources, ignoring the version item.
+
+    :param table_name: The DynamoDB data source table name
+    :type table_name: Python String
+    :return: The projected data source items in the table
+    :rtype: Python List
+    '''
+    return [
+        item for item in scan_data_sources(
+            table_name, projection=DATA_SOURCE_SUMMARY_PROJECTION)
+        if item['fileType'] != DATA_SOURCE_VERSION_FILE_TYPE
+        ]
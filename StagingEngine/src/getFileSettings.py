@@ -1,16 +1,13 @@
 import traceback
 
-import boto3
+import dataSourceCache
+import s3ObjectHeader
 
 
 class GetFileSettingsException(Exception):
     pass
 
 
-s3 = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb')
-
-
 def lambda_handler(event, context):
     '''
     lambda_handler Top level lambda handler ensuring all exceptions
@@ -61,14 +58,13 @@ def attach_file_settings_to_event(event, context):
     :type context: LambdaContext
     '''
     table = event["settings"]["dataSourceTableName"]
-    ddb_table = dynamodb.Table(table)
-    # Get the item. There can only be one or zero - it is the table's
-    # partition key - but use strong consistency so we respond instantly
-    # to any change. This can be revisited if we want to conserve RCUs
-    # by, say, caching this value and updating it every minute.
-    response = ddb_table.get_item(
-        Key={'fileType': event['fileType']}, ConsistentRead=True)
-    item = response['Item']
+    # Served from the warm container data source cache, which is
+    # revalidated against the data source version every TTL, to conserve
+    # RCUs. An uncached fileType is read with strong consistency.
+    item = dataSourceCache.get_data_source(table, event['fileType'])
+    if item is None:
+        raise GetFileSettingsException(
+            "No dataSource exists for fileType:{}".format(event['fileType']))
 
     schema = item['schema'] \
         if 'schema' in item \
@@ -84,17 +80,12 @@ def attach_existing_metadata_to_event(event, context):
     attach_existing_metadata_to_event Attach the S3 object's
     current metadata to the lambda event. This is because we
     need to apply it later when we copy the object to avoid
-    eventual consistency issues.
+    eventual consistency issues. The rest of the object's header is
+    attached to the fileDetails, for the later states to use.
 
     :param event: AWS Lambda uses this to pass in event data.
     :type event: Python type - Dict / list / int / string / float / None
     :param context: AWS Lambda uses this to pass in runtime information.
     :type context: LambdaContext
     '''
-    file_header = s3.head_object(
-        Bucket=event['fileDetails']['bucket'],
-        Key=event['fileDetails']['key']
-    )
-    event.update({'existingMetadata': file_header['Metadata']})
-    event['fileDetails'].update(
-        {'contentLength': file_header['ContentLength']})
+    s3ObjectHeader.capture_object_header(event)
@@ -1,14 +1,15 @@
 import re
 import traceback
 
-import boto3
+import dataSourceCache
 
 
 class GetFileTypeException(Exception):
     pass
 
 
-dynamodb = boto3.resource('dynamodb')
+# Trie of compiled fileNamePatterns, reused by warm lambda containers.
+_file_type_index = None
 
 
 def lambda_handler(event, context):
@@ -51,9 +52,10 @@ def get_file_type(event, context):
     key = event['fileDetails']['key']
 
     data_source_details = _get_all_data_source_details(event)
+    file_type_index = _get_file_type_index(data_source_details)
     matching_data_sources = _filter_matching_data_sources(
         key,
-        data_source_details)
+        file_type_index)
     filetype = _get_most_specific_filetype(
         key,
         matching_data_sources)
@@ -65,41 +67,156 @@ def get_file_type(event, context):
 
 def _get_all_data_source_details(event):
     '''
-    _get_all_data_source_details Scans and retrieves the fileType and
-    fileNamePattern of all datasources in DynamoDB.
+    _get_all_data_source_details Retrieves all datasources in DynamoDB,
+    served from the warm container data source cache when possible.
 
     :param event: AWS Lambda uses this to pass in event data.
     :type event: Python type - Dict / list / int / string / float / None
-    :return: Collection of fileType and pattern for each data source
+    :return: Collection of data sources, including fileType and pattern
     :rtype: Python List
     '''
     data_source_table = event["settings"]["dataSourceTableName"]
 
-    ddb_table = dynamodb.Table(data_source_table)
-    response = ddb_table.scan(
-        ProjectionExpression="fileType, fileSettings.fileNamePattern")
+    return dataSourceCache.get_all_data_sources(data_source_table)
 
-    return response['Items']
 
+def _get_file_type_index(data_source_details):
+    '''
+    _get_file_type_index Returns the file type index for the given
+    data sources. The index is held at module level so warm lambda
+    containers only rebuild it when the data source cache is reloaded.
+
+    :param data_source_details: Collection of fileType and pattern
+    :type data_source_details: Python List
+    :return: The root node of the file type index
+    :rtype: Python Dict
+    '''
+    global _file_type_index
+
+    # The data source cache replaces its list whenever it reloads.
+    if _file_type_index is None \
+            or _file_type_index['dataSources'] is not data_source_details:
+        _file_type_index = {
+            'dataSources': data_source_details,
+            'root': _build_file_type_index(data_source_details)
+        }
+
+    return _file_type_index['root']
+
+
+def _build_file_type_index(data_source_details):
+    '''
+    _build_file_type_index Compiles every data source's fileNamePattern
+    and stores it in a trie keyed on the pattern's literal leading
+    folders. Only patterns stored on the path of a key's folders can
+    possibly match that key, so the others are never regex tested.
+    The folder depth and first wildcard depth used to resolve
+    specificity are calculated once here rather than per key.
+
+    :param data_source_details: Collection of fileType and pattern
+    :type data_source_details: Python List
+    :return: The root node of the file type index
+    :rtype: Python Dict
+    '''
+    root = _new_index_node()
+
+    for data_source in data_source_details:
+        file_type = data_source['fileType']
+        pattern = data_source['fileSettings']['fileNamePattern']
+        folders = pattern.split('/')
+
+        try:
+            first_wildcard_depth = _get_first_wildcard_depth(
+                folders,
+                file_type)
+        except GetFileTypeException:
+            # Only an error if this data source is one of several matches.
+            first_wildcard_depth = None
+
+        entry = {
+            'fileType': file_type,
+            'fileNamePattern': pattern,
+            'regex': re.compile(pattern),
+            'folderDepth': len(folders),
+            'firstWildcardDepth': first_wildcard_depth
+        }
+
+        node = root
+        for folder in _get_literal_prefix_folders(pattern):
+            node = node['children'].setdefault(folder, _new_index_node())
+        node['entries'].append(entry)
+
+    return root
+
+
+def _new_index_node():
+    '''
+    _new_index_node Creates an empty file type index node.
+
+    :return: A node with no child folders and no data source entries
+    :rtype: Python Dict
+    '''
+    return {'children': {}, 'entries': []}
+
+
+def _get_literal_prefix_folders(pattern):
+    '''
+    _get_literal_prefix_folders Returns the leading folders of the
+    fileNamePattern that can only match themselves, so any key matched
+    by the pattern must start with exactly these folders.
+    Patterns using alternation are not split, as an alternative may
+    begin with a different folder.
+
+    :param pattern: The data source's fileNamePattern
+    :type pattern: Python String
+    :return: The literal leading folders of the pattern
+    :rtype: Python List
+    '''
+    if '|' in pattern:
+        return []
+
+    folders = pattern.split('/')
+    literal_folders = []
+    # The last item is never followed by a '/' so can't be a folder.
+    for depth in range(len(folders) - 1):
+        folder = folders[depth]
+        next_folder = folders[depth + 1]
+        if re.fullmatch(r"[a-zA-Z0-9_=-]+", folder) is None:
+            break
+        # A quantifier after the '/' makes the '/' itself optional.
+        if next_folder[:1] in ('?', '*', '+', '{'):
+            break
+        literal_folders.append(folder)
 
-def _filter_matching_data_sources(key, data_source_details):
+    return literal_folders
+
+
+def _filter_matching_data_sources(key, file_type_index):
     '''
-    _filter_matching_data_sources Filters the list of data sources
-    details and only returs those with a fileNamePattern that matches
-    the given key.
+    _filter_matching_data_sources Walks the file type index along the
+    key's folders and only returns the data sources found on the way
+    with a fileNamePattern that matches the given key.
 
-    :param key: [description]
-    :type key: [type]
-    :param data_source_details: [description]
-    :type data_source_details: [type]
-    :return: [description]
-    :rtype: [type]
+    :param key: The S3 object key
+    :type key: Python String
+    :param file_type_index: The root node of the file type index
+    :type file_type_index: Python Dict
+    :return: The index entries of data sources matching the key
+    :rtype: Python List
     '''
+    candidates = []
+    node = file_type_index
+    for folder in key.split('/'):
+        candidates.extend(node['entries'])
+        node = node['children'].get(folder)
+        if node is None:
+            break
+    else:
+        candidates.extend(node['entries'])
+
     matching_data_sources = [
-        data_source for data_source in data_source_details
-        if (re.fullmatch(
-            data_source['fileSettings']['fileNamePattern'],
-            key) is not None)
+        entry for entry in candidates
+        if entry['regex'].fullmatch(key) is not None
         ]
 
     return matching_data_sources
@@ -119,7 +236,7 @@ def _get_most_specific_filetype(key, matching_data_sources):
 
     :param key: The filename we wish to find the most specific filetype of.
     :type key: Python String
-    :param matching_data_sources: The datasources that match this filename
+    :param matching_data_sources: The index entries matching this filename
     :type matching_data_sources: Python List
     :raises GetFileTypeException: If a single specific filetype cannot be found
     :return: The name of the most specific filetype
@@ -138,11 +255,9 @@ def _get_most_specific_filetype(key, matching_data_sources):
     deepest_wildcard_filetype = None
 
     for data_source in matching_data_sources:
-        data_source_folders = data_source['fileSettings']['fileNamePattern']\
-            .split('/')
         data_source_filetype = data_source['fileType']
 
-        folder_depth = len(data_source_folders)
+        folder_depth = data_source['folderDepth']
 
         if deepest_folder_depth is None:
             deepest_folder_depth = folder_depth
@@ -150,9 +265,11 @@ def _get_most_specific_filetype(key, matching_data_sources):
             raise GetFileTypeException(
                 "Matching data sources have inconsistent folder depths")
 
-        first_wildcard_depth = _get_first_wildcard_depth(
-                data_source_folders,
-                data_source_filetype)
+        first_wildcard_depth = data_source['firstWildcardDepth']
+        if first_wildcard_depth is None:
+            raise GetFileTypeException(
+                "Filetype:{} fileNamePattern does not include wildcards"
+                .format(data_source_filetype))
 
         if deepest_wildcard is None or first_wildcard_depth > deepest_wildcard:
             deepest_wildcard = first_wildcard_depth
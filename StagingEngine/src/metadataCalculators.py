@@ -0,0 +1,262 @@
+import base64
+import codecs
+import csv
+import hashlib
+import itertools
+from datetime import datetime
+
+
+def get_metadata_calculators(file_settings):
+    '''
+    get_metadata_calculators Creates the metadata calculators selected
+    in the filetype's metadataCalculators file setting. Each entry is the
+    name of a calculator in METADATA_CALCULATORS, or a map with its name
+    and settings. The calculateMD5 setting also selects the md5
+    calculator.
+
+    :param file_settings: The filetype's file settings
+    :type file_settings: Python Dict
+    :raises ValueError: When a calculator is unknown or misconfigured
+    :return: New calculators, to be updated with the file's content
+    :rtype: Python List
+    '''
+    entries = list(file_settings.get('metadataCalculators', []))
+    names = [entry if isinstance(entry, str) else entry['name']
+             for entry in entries]
+    if 'calculateMD5' in file_settings \
+            and file_settings['calculateMD5'] == 'True' \
+            and 'md5' not in names:
+        entries.insert(0, 'md5')
+
+    calculators = []
+    for entry in entries:
+        if isinstance(entry, str):
+            name, calculator_settings = entry, {}
+        else:
+            name, calculator_settings = entry['name'], entry
+
+        if name not in METADATA_CALCULATORS:
+            raise ValueError('Unknown metadata calculator: {}'.format(name))
+
+        calculator = METADATA_CALCULATORS[name](
+            calculator_settings, file_settings)
+        calculator.name = name
+        calculators.append(calculator)
+
+    return calculators
+
+
+def get_calculated_metadata(calculators):
+    '''
+    get_calculated_metadata Returns the metadata calculated once the
+    whole file has been passed to the calculators.
+
+    :param calculators: The metadata calculators
+    :type calculators: Python List
+    :return: The metadata, as S3 metadata strings
+    :rtype: Python Dict
+    '''
+    metadata = {}
+    for calculator in calculators:
+        metadata.update(calculator.get_metadata())
+    return metadata
+
+
+class _HashCalculator(object):
+    '''
+    Calculates a hashlib style hash of the file.
+    '''
+
+    def __init__(self, metadata_key, hash_object, encode):
+        self.metadata_key = metadata_key
+        self.hash_object = hash_object
+        self.encode = encode
+
+    def update(self, chunk):
+        self.hash_object.update(chunk)
+
+    def get_metadata(self):
+        return {self.metadata_key: self.encode(self.hash_object)}
+
+
+class _ByteCountCalculator(object):
+    '''
+    Counts the bytes in the file.
+    '''
+
+    def __init__(self):
+        self.byte_count = 0
+
+    def update(self, chunk):
+        self.byte_count = self.byte_count + len(chunk)
+
+    def get_metadata(self):
+        return {'byte_count': str(self.byte_count)}
+
+
+class _RowCountCalculator(object):
+    '''
+    Counts the lines in the file, less the header row of csv/tsv files.
+    A final line without a line break is counted.
+    '''
+
+    def __init__(self, has_header_row):
+        self.has_header_row = has_header_row
+        self.line_breaks = 0
+        self.last_byte = b'\n'
+
+    def update(self, chunk):
+        if chunk:
+            self.line_breaks = self.line_breaks + chunk.count(b'\n')
+            self.last_byte = chunk[-1:]
+
+    def get_metadata(self):
+        row_count = self.line_breaks
+        if self.last_byte != b'\n':
+            row_count = row_count + 1
+        if self.has_header_row and row_count > 0:
+            row_count = row_count - 1
+        return {'row_count': str(row_count)}
+
+
+class _JsonDocumentCountCalculator(object):
+    '''
+    Counts the json objects and arrays at the top level of the file, as
+    its rows, however many lines each spans. Only the brackets outside
+    strings are counted, so the documents are not decoded or validated.
+    '''
+
+    # Every byte but the brackets and quotes.
+    other_bytes = bytes(byte for byte in range(256) if byte not in b'[]{}"')
+    # The change in depth at each bracket.
+    depth_changes = {ord('{'): 1, ord('['): 1, ord('}'): -1, ord(']'): -1}
+
+    def __init__(self):
+        self.document_count = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape_pending = False
+
+    def update(self, chunk):
+        if self.escape_pending and chunk:
+            # Escaped by a backslash that ended the last chunk.
+            chunk = chunk[1:]
+            self.escape_pending = False
+
+        if b'\\' in chunk:
+            # Escaped backslashes first, so what's left of each run of
+            # backslashes escapes the character after it.
+            chunk = chunk.replace(b'\\\\', b'').replace(b'\\"', b'')
+            if chunk.endswith(b'\\'):
+                self.escape_pending = True
+
+        # Every other part between quotes is outside strings.
+        parts = chunk.translate(None, self.other_bytes).split(b'"')
+        brackets = b''.join(parts[1 if self.in_string else 0::2])
+        if len(parts) % 2 == 0:
+            self.in_string = not self.in_string
+
+        depths = list(itertools.accumulate(itertools.chain(
+            [self.depth], map(self.depth_changes.__getitem__, brackets))))
+        # A document ends each time the depth goes back to 0.
+        self.document_count = self.document_count + depths.count(0) \
+            - (1 if self.depth == 0 else 0)
+        self.depth = depths[-1]
+
+    def get_metadata(self):
+        return {'row_count': str(self.document_count)}
+
+
+class _TimestampRangeCalculator(object):
+    '''
+    Finds the earliest and latest values of a timestamp column in a
+    csv/tsv file with a header row. Values are compared as datetimes if a
+    strptime format is given, otherwise as strings, which orders ISO 8601
+    timestamps with the same offset correctly. Empty values are ignored,
+    and values must not contain quoted line breaks.
+    '''
+
+    def __init__(self, column, time_format, delimiter):
+        self.column = column
+        self.time_format = time_format
+        self.delimiter = delimiter
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.partial_line = ''
+        self.column_index = None
+        self.minimum = None
+        self.maximum = None
+
+    def update(self, chunk):
+        lines = (self.partial_line + self.decoder.decode(chunk)).split('\n')
+        self.partial_line = lines.pop()
+        self._add_lines(lines)
+
+    def get_metadata(self):
+        self._add_lines(
+            [self.partial_line + self.decoder.decode(b'', final=True)])
+        self.partial_line = ''
+        if self.minimum is None:
+            return {}
+        return {'timestamp_min': self.minimum, 'timestamp_max': self.maximum}
+
+    def _add_lines(self, lines):
+        rows = csv.reader(lines, delimiter=self.delimiter)
+        if self.column_index is None:
+            header = next(rows, None)
+            if header is None:
+                return
+            if self.column not in header:
+                raise ValueError(
+                    'Timestamp column {} not in header'.format(self.column))
+            self.column_index = header.index(self.column)
+
+        column_index = self.column_index
+        # Timestamps repeat, so only parse each distinct value once.
+        values = {row[column_index] for row in rows
+                  if len(row) > column_index and row[column_index]}
+        if self.minimum is not None:
+            values.update([self.minimum, self.maximum])
+        if not values:
+            return
+
+        key = None
+        if self.time_format is not None:
+            time_format = self.time_format
+            key = lambda value: datetime.strptime(value, time_format)
+        self.minimum = min(values, key=key)
+        self.maximum = max(values, key=key)
+
+
+def _encode_base64(hash_object):
+    return base64.b64encode(hash_object.digest()).decode('ascii')
+
+
+def _new_row_count_calculator(calculator_settings, file_settings):
+    file_format = file_settings.get('fileFormat')
+    if file_format == 'json':
+        return _JsonDocumentCountCalculator()
+    return _RowCountCalculator(file_format in ('csv', 'tsv'))
+
+
+def _new_timestamp_range_calculator(calculator_settings, file_settings):
+    file_format = file_settings.get('fileFormat')
+    if file_format not in ('csv', 'tsv'):
+        raise ValueError('timestampRange needs a csv or tsv fileFormat')
+    return _TimestampRangeCalculator(
+        calculator_settings['column'],
+        calculator_settings.get('format'),
+        '\t' if file_format == 'tsv' else ',')
+
+
+# Factories for the metadata calculators a filetype can select, by name.
+# Each is passed the calculator's settings and the filetype's settings.
+METADATA_CALCULATORS = {
+    'md5': lambda calculator_settings, file_settings: _HashCalculator(
+        'staged_md5', hashlib.md5(), _encode_base64),
+    'sha256': lambda calculator_settings, file_settings: _HashCalculator(
+        'staged_sha256', hashlib.sha256(), _encode_base64),
+    'byteCount': lambda calculator_settings, file_settings:
+        _ByteCountCalculator(),
+    'rowCount': _new_row_count_calculator,
+    'timestampRange': _new_timestamp_range_calculator
+}
@@ -4,13 +4,14 @@ import traceback
 
 import boto3
 
+import dataCatalogWriter
+
 
 class RecordFailedStagingException(Exception):
     pass
 
 
 sns_client = boto3.client('sns')
-dynamodb = boto3.resource('dynamodb')
 
 
 def lambda_handler(event, context):
@@ -55,7 +56,8 @@ def record_failed_staging(event, context):
 def record_failed_staging_in_data_catalog(event, context):
     '''
     record_failed_staging_in_data_catalog Records the failed staging
-    in the data catalog.
+    in the data catalog. Inside a dataCatalogWriter.buffered() block
+    the item is written later, in a batch with others.
 
     :param event: AWS Lambda uses this to pass in event data.
     :type event: Python type - Dict / list / int / string / float / None
@@ -99,8 +101,7 @@ def record_failed_staging_in_data_catalog(event, context):
         dynamodb_item['stagingBucket'] = \
             event['settings']['stagingBucket']
 
-    dynamodb_table = dynamodb.Table(data_catalog_table)
-    dynamodb_table.put_item(Item=dynamodb_item)
+    dataCatalogWriter.write_item(data_catalog_table, dynamodb_item)
 
 
 def send_failed_staging_sns(event, context):
@@ -3,13 +3,14 @@ import traceback
 
 import boto3
 
+import dataCatalogWriter
+
 
 class RecordSuccessfulStagingException(Exception):
     pass
 
 
 sns_client = boto3.client('sns')
-dynamodb = boto3.resource('dynamodb')
 
 
 def lambda_handler(event, context):
@@ -54,7 +55,8 @@ def record_successfull_staging(event, context):
 def record_successful_staging_in_data_catalog(event, context):
     '''
     record_successful_staging_in_data_catalog Records the successful staging
-    in the data catalog.
+    in the data catalog. Inside a dataCatalogWriter.buffered() block
+    the item is written later, in a batch with others.
 
     :param event: AWS Lambda uses this to pass in event data.
     :type event: Python type - Dict / list / int / string / float / None
@@ -92,8 +94,7 @@ def record_successful_staging_in_data_catalog(event, context):
             'tags': tags,
             'metadata': metadata
         }
-        dynamodb_table = dynamodb.Table(data_catalog_table)
-        dynamodb_table.put_item(Item=dynamodb_item)
+        dataCatalogWriter.write_item(data_catalog_table, dynamodb_item)
 
     except Exception as e:
         traceback.print_exc()
@@ -0,0 +1,91 @@
+import boto3
+
+
+class S3ObjectHeaderException(Exception):
+    pass
+
+
+s3 = boto3.client('s3')
+
+# The head_object response fields kept in fileDetails, by fileDetails key.
+# LastModified is kept as the string the created_date metadata uses.
+CAPTURED_FIELDS = {
+    'contentLength': 'ContentLength',
+    'lastModified': 'LastModified',
+    'eTag': 'ETag',
+    'versionId': 'VersionId',
+    'serverSideEncryption': 'ServerSideEncryption',
+    'sseCustomerAlgorithm': 'SSECustomerAlgorithm'
+}
+
+
+def capture_object_header(event):
+    '''
+    capture_object_header Reads the new file's header from S3 and keeps
+    it in the event, so no later state needs to read it again. The
+    object's metadata is kept as existingMetadata, and the other fields
+    in fileDetails. This is the only head_object call made for a file.
+
+    :param event: The event passed to the staging step function
+    :type event: Python Dict
+    :return: The event, with the header captured
+    :rtype: Python Dict
+    '''
+    file_header = s3.head_object(
+        Bucket=event['fileDetails']['bucket'],
+        Key=event['fileDetails']['key']
+    )
+    event.update({'existingMetadata': file_header['Metadata']})
+    for field, header_field in CAPTURED_FIELDS.items():
+        if header_field in file_header:
+            value = file_header[header_field]
+            if header_field == 'LastModified':
+                value = str(value)
+            event['fileDetails'].update({field: value})
+
+    return event
+
+
+def get_object_header(event):
+    '''
+    get_object_header Returns the file's header, as captured by
+    capture_object_header, in the shape head_object returns it.
+
+    :param event: The event passed to the staging step function
+    :type event: Python Dict
+    :raises S3ObjectHeaderException: If the header hasn't been captured
+    :return: The captured head_object response fields
+    :rtype: Python Dict
+    '''
+    file_details = event['fileDetails']
+    if 'eTag' not in file_details:
+        raise S3ObjectHeaderException(
+            'The header of {} has not been captured'.format(
+                file_details['key']))
+
+    file_header = {'Metadata': event['existingMetadata']}
+    for field, header_field in CAPTURED_FIELDS.items():
+        if field in file_details:
+            file_header[header_field] = file_details[field]
+
+    return file_header
+
+
+def get_object(event, **kwargs):
+    '''
+    get_object Reads the file from S3, failing if it has changed since
+    its header was captured, so every state sees the same version.
+
+    :param event: The event passed to the staging step function
+    :type event: Python Dict
+    :param kwargs: Any other get_object arguments, such as Range
+    :raises S3ObjectHeaderException: If the header hasn't been captured
+    :return: The get_object response
+    :rtype: Python Dict
+    '''
+    file_header = get_object_header(event)
+    return s3.get_object(
+        Bucket=event['fileDetails']['bucket'],
+        Key=event['fileDetails']['key'],
+        IfMatch=file_header['ETag'],
+        **kwargs)
@@ -0,0 +1,156 @@
+import json
+import os
+import traceback
+
+import boto3
+
+import dataCatalogWriter
+import stageFileExpress
+
+
+class StageFileBatchException(Exception):
+    pass
+
+
+# Files left unstaged when less than this many seconds of the invocation
+# remain are returned to the queue, rather than risk a timeout mid file.
+min_remaining_seconds = int(os.environ.get('MIN_REMAINING_SECONDS', '60'))
+# Data catalog items that couldn't be written are sent here, as their
+# files have already been staged or moved to failed.
+catalog_write_failed_queue_url = os.environ.get(
+    'CATALOG_WRITE_FAILED_QUEUE_URL')
+# Most messages SQS accepts in one SendMessageBatch request.
+send_batch_size = 10
+
+sqs = boto3.client('sqs')
+
+
+def lambda_handler(event, context):
+    '''
+    lambda_handler Top level lambda handler ensuring all exceptions
+    are caught and logged.
+
+    :param event: AWS Lambda uses this to pass in event data.
+    :type event: Python type - Dict / list / int / string / float / None
+    :param context: AWS Lambda uses this to pass in runtime information.
+    :type context: LambdaContext
+    :return: The partial batch failures
+    :rtype: Python type - Dict / list / int / string / float / None
+    :raises StageFileBatchException: On any error or exception
+    '''
+    try:
+        return stage_file_batch(event, context)
+    except StageFileBatchException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise StageFileBatchException(e)
+
+
+def stage_file_batch(event, context):
+    '''
+    stage_file_batch Stages a batch of files queued by StartFileProcessing,
+    one after another, each as the express staging lambda would. A file
+    that fails staging is copied to the failed bucket and its failure
+    recorded in the data catalog, without failing the rest of the batch.
+    Data catalog items are written in batches as the files are staged,
+    and any that can't be written are sent to the catalog write failed
+    queue, as their files can't be staged again. Only files whose staging couldn't be run to the end, such as those
+    left when the invocation is short of time, are returned to the queue
+    as partial batch failures.
+
+    :param event: AWS Lambda uses this to pass in event data.
+    :type event: Python type - Dict / list / int / string / float / None
+    :param context: AWS Lambda uses this to pass in runtime information.
+    :type context: LambdaContext
+    :return: The partial batch failures
+    :rtype: Python type - Dict / list / int / string / float / None
+    '''
+    failed_record_ids = []
+    staged_count = 0
+    failed_count = 0
+
+    try:
+        with dataCatalogWriter.buffered():
+            for record in event['Records']:
+                if _is_out_of_time(context):
+                    failed_record_ids.append(record['messageId'])
+                    continue
+
+                try:
+                    staging_input = json.loads(record['body'])
+                    result = stageFileExpress.stage_file_express(
+                        staging_input, context)
+                except Exception:
+                    traceback.print_exc()
+                    failed_record_ids.append(record['messageId'])
+                    continue
+
+                if 'error-info' in result:
+                    failed_count = failed_count + 1
+                else:
+                    staged_count = staged_count + 1
+    except dataCatalogWriter.DataCatalogWriterException as e:
+        # The files have been staged or moved to failed, so returning
+        # them to the queue would stage them again from a missing file.
+        traceback.print_exc()
+        send_unwritten_items(e.unwritten_items)
+    except Exception:
+        traceback.print_exc()
+
+    print('Staged {} files, {} failed staging and {} returned to the queue'
+          .format(staged_count, failed_count, len(failed_record_ids)))
+
+    return {
+        'batchItemFailures': [
+            {'itemIdentifier': record_id}
+            for record_id in failed_record_ids]
+    }
+
+
+def send_unwritten_items(unwritten_items):
+    '''
+    send_unwritten_items Sends data catalog items that couldn't be
+    written to the catalog write failed queue, each in a message with
+    the name of its table. Items that can't be sent are logged.
+
+    :param unwritten_items: The (table name, item) pairs to send
+    :type unwritten_items: Python List
+    '''
+    for start in range(0, len(unwritten_items), send_batch_size):
+        batch = unwritten_items[start:start + send_batch_size]
+        entries = [
+            {
+                'Id': str(index),
+                'MessageBody': json.dumps(
+                    {'tableName': table_name, 'item': item}, default=str)
+            }
+            for index, (table_name, item) in enumerate(batch)]
+        try:
+            response = sqs.send_message_batch(
+                QueueUrl=catalog_write_failed_queue_url, Entries=entries)
+            failed_ids = [entry['Id'] for entry in response.get('Failed', [])]
+        except Exception:
+            traceback.print_exc()
+            failed_ids = [entry['Id'] for entry in entries]
+
+        for entry in entries:
+            if entry['Id'] in failed_ids:
+                print('Failed to send unwritten item: {}'
+                      .format(entry['MessageBody']))
+
+
+def _is_out_of_time(context):
+    '''
+    _is_out_of_time Checks whether the invocation is too close to its
+    timeout to stage another file.
+
+    :param context: AWS Lambda uses this to pass in runtime information.
+    :type context: LambdaContext
+    :return: True if no more files should be staged
+    :rtype: Python Boolean
+    '''
+    if context is None:
+        return False
+    return context.get_remaining_time_in_millis() \
+        < min_remaining_seconds * 1000
@@ -0,0 +1,207 @@
+import copy
+import json
+import os
+import sys
+import time
+import traceback
+
+import calculateMetaDataForFile
+import copyFileFromRawToFailed
+import copyFileFromRawToStaging
+import deleteRawFile
+import getFileSettings
+import getFileType
+import recordFailedStaging
+import recordSuccessfulStaging
+import stageFileInSinglePass
+
+# The schema validation modules import their vendored packages by name.
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'verifyFileSchema'))
+from verifyFileSchema import verifyFileSchema
+
+
+class StageFileExpressException(Exception):
+    pass
+
+
+# Seconds to wait before deleting a staged raw file. The step function
+# waits 10 seconds for clients reading from the raw bucket, which small
+# files staged this way usually don't need.
+raw_read_wait_seconds = float(
+    os.environ.get('RAW_READ_WAIT_SECONDS', '0'))
+# Attempts made at each staging step before the file fails staging.
+stage_max_attempts = int(os.environ.get('STAGE_MAX_ATTEMPTS', '3'))
+# Seconds before a failed step is retried, multiplied by
+# stage_retry_backoff_rate after every retry.
+stage_retry_interval_seconds = float(
+    os.environ.get('STAGE_RETRY_INTERVAL_SECONDS', '0.5'))
+stage_retry_backoff_rate = 1.5
+
+
+def lambda_handler(event, context):
+    '''
+    lambda_handler Top level lambda handler ensuring all exceptions
+    are caught and logged.
+
+    :param event: AWS Lambda uses this to pass in event data.
+    :type event: Python type - Dict / list / int / string / float / None
+    :param context: AWS Lambda uses this to pass in runtime information.
+    :type context: LambdaContext
+    :return: The event object passed into the method
+    :rtype: Python type - Dict / list / int / string / float / None
+    :raises StageFileExpressException: On any error or exception
+    '''
+    try:
+        return stage_file_express(event, context)
+    except StageFileExpressException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise StageFileExpressException(e)
+
+
+def stage_file_express(event, context):
+    '''
+    stage_file_express Stages a new file by running the staging step
+    function's steps one after another in this invocation, which avoids
+    a lambda invocation and state transition per step for small files.
+    Each step is passed a copy of the previous step's output, as it would
+    be by the step function. If a step fails after its retries, the file
+    goes through the step function's failure path: it is copied to the
+    failed bucket, deleted from raw and its failure recorded.
+
+    :param event: AWS Lambda uses this to pass in event data.
+    :type event: Python type - Dict / list / int / string / float / None
+    :param context: AWS Lambda uses this to pass in runtime information.
+    :type context: LambdaContext
+    :return: The final event, with error-info set if staging failed
+    :rtype: Python type - Dict / list / int / string / float / None
+    '''
+    try:
+        event = _run_step(getFileType.lambda_handler, event, context)
+        event = _run_step(getFileSettings.lambda_handler, event, context)
+
+        if is_fused_staging(event):
+            event = _run_step(
+                stageFileInSinglePass.lambda_handler, event, context)
+        else:
+            event = _run_step(
+                verifyFileSchema.lambda_handler, event, context)
+            event = _run_step(
+                calculateMetaDataForFile.lambda_handler, event, context)
+            event = _run_step(
+                copyFileFromRawToStaging.lambda_handler, event, context)
+
+        if raw_read_wait_seconds > 0:
+            time.sleep(raw_read_wait_seconds)
+
+        event = _run_step(deleteRawFile.lambda_handler, event, context)
+        event = _run_step(
+            recordSuccessfulStaging.lambda_handler, event, context)
+    except Exception as e:
+        return stage_failed_file(_add_error_info(event, e), context)
+
+    return event
+
+
+def stage_failed_file(event, context):
+    '''
+    stage_failed_file Runs the step function's failure path for a file
+    that failed staging. As in the step function, a failure to copy or
+    delete the file is recorded in place of the original error, and a
+    failure to record it is only logged.
+
+    :param event: The event of the failed step, with error-info set
+    :type event: Python Dict
+    :param context: AWS Lambda uses this to pass in runtime information.
+    :type context: LambdaContext
+    :return: The final event, with error-info set
+    :rtype: Python Dict
+    '''
+    try:
+        event = _run_step(
+            copyFileFromRawToFailed.lambda_handler, event, context)
+        try:
+            event = _run_step(deleteRawFile.lambda_handler, event, context)
+        except Exception as e:
+            event = _add_error_info(event, e)
+    except Exception as e:
+        event = _add_error_info(event, e)
+
+    try:
+        event = _run_step(recordFailedStaging.lambda_handler, event, context)
+    except Exception as e:
+        event = _add_error_info(event, e)
+
+    return event
+
+
+def is_fused_staging(event):
+    '''
+    is_fused_staging Checks whether the file's filetype stages it from
+    one read of the file, as the step function's ChooseStagingMode does.
+
+    :param event: The event passed to the staging step function
+    :type event: Python Dict
+    :return: True if fusedStaging is set for the filetype
+    :rtype: Python Boolean
+    '''
+    file_settings = event['fileSettings']
+    return 'fusedStaging' in file_settings \
+        and file_settings['fusedStaging'] == 'True'
+
+
+def _run_step(step, event, context):
+    '''
+    _run_step Runs a staging step's lambda handler, retrying it with
+    backoff if it fails, as the step function retries every error.
+
+    :param step: The lambda handler of the step
+    :type step: Python Function
+    :param event: The step's input, which is not changed
+    :type event: Python Dict
+    :param context: AWS Lambda uses this to pass in runtime information.
+    :type context: LambdaContext
+    :raises Exception: The step's exception, once out of attempts
+    :return: The step's output
+    :rtype: Python Dict
+    '''
+    retry_interval_seconds = stage_retry_interval_seconds
+    attempt = 1
+    while True:
+        try:
+            return step(copy.deepcopy(event), context)
+        except Exception:
+            if attempt >= stage_max_attempts:
+                raise
+        print('Retrying {} in {} seconds'.format(
+            step.__module__, retry_interval_seconds))
+        time.sleep(retry_interval_seconds)
+        retry_interval_seconds = \
+            retry_interval_seconds * stage_retry_backoff_rate
+        attempt = attempt + 1
+
+
+def _add_error_info(event, exception):
+    '''
+    _add_error_info Adds a step's exception to its input, as the step
+    function's Catch does, for the failure path to record.
+
+    :param event: The input to the step that failed
+    :type event: Python Dict
+    :param exception: The exception raised by the step
+    :type exception: Python Exception
+    :return: The event, with error-info set
+    :rtype: Python Dict
+    '''
+    error_type = type(exception).__name__
+    event = copy.deepcopy(event)
+    event.update({'error-info': {
+        'Error': error_type,
+        'Cause': json.dumps({
+            'errorMessage': str(exception),
+            'errorType': error_type
+        })
+    }})
+    return event
@@ -0,0 +1,234 @@
+import os
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+import calculateMetaDataForFile
+import copyFileFromRawToStaging
+import metadataCalculators
+import s3ObjectHeader
+
+# The schema validation modules import their vendored packages by name.
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'verifyFileSchema'))
+from verifyFileSchema import verifyFileSchema
+
+
+class StageFileInSinglePassException(Exception):
+    pass
+
+
+s3 = boto3.client('s3')
+# Bytes read from S3 at a time.
+read_chunk_size = int(os.environ.get('READ_CHUNK_SIZE', str(1024 * 1024)))
+# Size of the parts uploaded to staging. Smaller files use one put_object.
+# S3 rejects parts smaller than 5 MB other than the last, so this is the
+# least part size used.
+min_upload_part_size = 5 * 1024 * 1024
+upload_part_size = max(
+    int(os.environ.get('UPLOAD_PART_SIZE', str(8 * 1024 * 1024))),
+    min_upload_part_size)
+# Max parts being uploaded to staging at once while the file is read.
+upload_concurrency = int(os.environ.get('UPLOAD_CONCURRENCY', '4'))
+
+
+def lambda_handler(event, context):
+    '''
+    lambda_handler Top level lambda handler ensuring all exceptions
+    are caught and logged.
+
+    :param event: AWS Lambda uses this to pass in event data.
+    :type event: Python type - Dict / list / int / string / float / None
+    :param context: AWS Lambda uses this to pass in runtime information.
+    :type context: LambdaContext
+    :return: The event object passed into the method
+    :rtype: Python type - Dict / list / int / string / float / None
+    :raises StageFileInSinglePassException: On any error or exception
+    '''
+    try:
+        return stage_file_in_single_pass(event, context)
+    except (StageFileInSinglePassException,
+            verifyFileSchema.VerifyFileSchemaException):
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise StageFileInSinglePassException(e)
+
+
+def stage_file_in_single_pass(event, context):
+    '''
+    stage_file_in_single_pass Verifies the schema of the new file,
+    calculates its metadata and copies it to the staging bucket, reading
+    the object from S3 once. This replaces the VerifyFileSchema,
+    CalculateMetaDataForFile and CopyFileFromRawToStaging states for
+    filetypes with fusedStaging set.
+    If uploadInSinglePass is also set, the bytes read are uploaded to
+    staging as they are validated, rather than copied server side once
+    validation has finished. The metadata has to be known before an
+    upload starts, so files with metadata calculated from their content
+    (such as an MD5) are always copied server side.
+
+    :param event: AWS Lambda uses this to pass in event data.
+    :type event: Python type - Dict / list / int / string / float / None
+    :param context: AWS Lambda uses this to pass in runtime information.
+    :type context: LambdaContext
+    :return: The event object passed into the method
+    :rtype: Python type - Dict / list / int / string / float / None
+    :raises VerifyFileSchemaException: When the file schema is incorrect
+    '''
+    file_settings = event['fileSettings']
+
+    created_date = calculateMetaDataForFile.get_created_date(
+        s3ObjectHeader.get_object_header(event))
+    response = s3ObjectHeader.get_object(event)
+    calculators = metadataCalculators.get_metadata_calculators(file_settings)
+
+    upload = None
+    if 'uploadInSinglePass' in file_settings \
+            and file_settings['uploadInSinglePass'] == 'True' \
+            and not calculators:
+        calculateMetaDataForFile.add_metadata_to_event(event, created_date)
+        upload = _StagingUpload(
+            event['settings']['stagingBucket'],
+            copyFileFromRawToStaging.get_staging_key(event),
+            event['combinedMetadata'],
+            copyFileFromRawToStaging.get_tagging(event))
+
+    byte_chunks = _iterate_body_chunks(response['Body'], calculators, upload)
+    try:
+        verifyFileSchema.verify_content_schema(event, byte_chunks)
+        # Read any content validation didn't need.
+        for _ in byte_chunks:
+            pass
+        if upload is not None:
+            upload.complete()
+    except Exception:
+        if upload is not None:
+            upload.abort()
+        raise
+    finally:
+        response['Body'].close()
+
+    if upload is not None:
+        event['fileDetails'].update({"stagingKey": upload.key})
+    else:
+        calculateMetaDataForFile.add_metadata_to_event(
+            event,
+            created_date,
+            metadataCalculators.get_calculated_metadata(calculators))
+        copyFileFromRawToStaging.copy_file_from_raw_to_staging(event, context)
+
+    return event
+
+
+def _iterate_body_chunks(body, calculators, upload=None):
+    '''
+    _iterate_body_chunks Reads a streaming S3 object body
+    read_chunk_size bytes at a time, adding each chunk to the metadata
+    calculators and the upload to staging before passing it on.
+
+    :param body: The body of an S3 GetObject response
+    :type body: botocore StreamingBody
+    :param calculators: The metadata calculators to update
+    :type calculators: Python List
+    :param upload: The upload to staging, if uploading
+    :type upload: _StagingUpload, optional
+    :return: Iterator over the bytes of the body
+    :rtype: Python Generator
+    '''
+    while True:
+        chunk = body.read(read_chunk_size)
+        if not chunk:
+            break
+        for calculator in calculators:
+            calculator.update(chunk)
+        if upload is not None:
+            upload.write(chunk)
+        yield chunk
+
+
+class _StagingUpload(object):
+    '''
+    Uploads a file to the staging bucket as it is written. Once a part's
+    worth of bytes has been written it is uploaded in the background, so
+    reading and uploading overlap. A file smaller than one part is
+    uploaded with a single put_object when it is completed. Metadata and
+    tags are applied when the upload is created, so no further requests
+    are needed.
+    '''
+
+    def __init__(self, bucket, key, metadata, tagging):
+        self.bucket = bucket
+        self.key = key
+        self.metadata = metadata
+        self.tagging = tagging
+        self.buffer = []
+        self.buffer_length = 0
+        self.upload_id = None
+        self.parts = []
+        self.executor = None
+
+    def write(self, chunk):
+        self.buffer.append(chunk)
+        self.buffer_length = self.buffer_length + len(chunk)
+        if self.buffer_length >= upload_part_size:
+            self._upload_part()
+
+    def complete(self):
+        if self.upload_id is None:
+            print('Putting object {} in bucket {}'.format(
+                self.key, self.bucket))
+            s3.put_object(
+                Bucket=self.bucket,
+                Key=self.key,
+                Body=b''.join(self.buffer),
+                Metadata=self.metadata,
+                Tagging=self.tagging)
+            return
+
+        if self.buffer_length > 0:
+            self._upload_part()
+        self.executor.shutdown()
+        s3.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={'Parts': [
+                {'PartNumber': part_number, 'ETag': future.result()['ETag']}
+                for part_number, future in enumerate(self.parts, 1)]})
+
+    def abort(self):
+        if self.upload_id is None:
+            return
+        self.executor.shutdown()
+        s3.abort_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+    def _upload_part(self):
+        if self.upload_id is None:
+            print('Uploading object {} to bucket {}'.format(
+                self.key, self.bucket))
+            response = s3.create_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                Metadata=self.metadata,
+                Tagging=self.tagging)
+            self.upload_id = response['UploadId']
+            self.executor = ThreadPoolExecutor(max_workers=upload_concurrency)
+
+        # Bound the bytes held in memory by waiting for the oldest part.
+        if len(self.parts) >= upload_concurrency:
+            self.parts[-upload_concurrency].result()
+
+        part = b''.join(self.buffer)
+        self.buffer = []
+        self.buffer_length = 0
+        self.parts.append(self.executor.submit(
+            s3.upload_part,
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=len(self.parts) + 1,
+            Body=part))
@@ -6,6 +6,7 @@ import string
 import time
 import traceback
 import urllib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import boto3
@@ -18,10 +19,25 @@ class StartFileProcessingException(Exception):
 
 sns = boto3.client('sns')
 sfn = boto3.client('stepfunctions')
+lambda_client = boto3.client('lambda')
+sqs = boto3.client('sqs')
 dynamodb = boto3.resource('dynamodb')
 s3_cache_table = os.environ['S3_CACHE_TABLE_NAME']
 sns_failure_arn = os.environ['SNS_FAILURE_ARN']
 state_machine_arn = os.environ['STEP_FUNCTION']
+# How long an object's event is remembered, to drop duplicate deliveries.
+processing_cache_ttl_seconds = int(
+    os.environ.get('PROCESSING_CACHE_TTL_SECONDS', '86400'))
+# Maximum number of step functions started concurrently for a batch.
+start_execution_concurrency = int(
+    os.environ.get('START_EXECUTION_CONCURRENCY', '10'))
+# Files smaller than this are staged by the express staging lambda rather
+# than a step function. 0 stages every file with a step function.
+express_staging_max_bytes = int(
+    os.environ.get('EXPRESS_STAGING_MAX_BYTES', '0'))
+express_staging_function = os.environ.get('EXPRESS_STAGING_FUNCTION')
+# If set, express staging files are queued here to be staged in batches.
+staging_batch_queue_url = os.environ.get('STAGING_BATCH_QUEUE_URL')
 
 
 def lambda_handler(event, context):
@@ -48,31 +64,245 @@ def lambda_handler(event, context):
 
 def start_file_processing(event, context):
     '''
-    start_file_processing Confirm the lambda context request id is
-    not already being processed, check this is not just a folder being 
-    created, then start file processing.
+    start_file_processing Start file processing for every file in the
+    event that is not just a folder being created, and whose object event
+    is not already being processed.
+    The event can be an S3 notification, an SQS batch of S3 notifications
+    or an EventBridge S3 event. Step functions for the files are started
+    concurrently. Files smaller than EXPRESS_STAGING_MAX_BYTES are passed
+    to the express staging lambda instead, or queued to be staged in
+    batches if STAGING_BATCH_QUEUE_URL is set.
 
     :param event: AWS Lambda uses this to pass in event data.
     :type event: Python type - Dict / list / int / string / float / None
     :param context: AWS Lambda uses this to pass in runtime information.
     :type context: LambdaContext
-    :return: The event object passed into the method
+    :return: For SQS batches the partial batch failures, otherwise the event
     :rtype: Python type - Dict / list / int / string / float / None
+    :raises StartFileProcessingException: If any non SQS file fails to start
+    '''
+    file_records, failed_record_ids = get_file_records(event)
+    file_records = [
+        file_record for file_record in file_records
+        if file_record['key'].endswith('/') is False]
+
+    failed_file_count = 0
+    with ThreadPoolExecutor(
+            max_workers=start_execution_concurrency) as executor:
+        results = executor.map(start_step_function_for_record, file_records)
+        for file_record, started in zip(file_records, results):
+            if started is False:
+                failed_file_count = failed_file_count + 1
+                failed_record_ids.add(file_record['recordId'])
+
+    if is_sqs_event(event):
+        if len(failed_record_ids) > 0:
+            print('Failed to start file processing for {} of {} files, '
+                  'returning {} of {} messages to the queue'.format(
+                      failed_file_count, len(file_records),
+                      len(failed_record_ids), len(event['Records'])))
+        # Only the failed messages are returned to the queue for retry.
+        return {
+            'batchItemFailures': [
+                {'itemIdentifier': record_id}
+                for record_id in sorted(failed_record_ids)]
+        }
+
+    if failed_file_count > 0:
+        raise StartFileProcessingException(
+            'Failed to start file processing for {} of {} files'
+            .format(failed_file_count, len(file_records)))
+
+    return event
+
+
+def is_sqs_event(event):
+    '''
+    is_sqs_event Checks whether the event is a batch of SQS messages.
+
+    :param event: AWS Lambda uses this to pass in event data.
+    :type event: Python type - Dict / list / int / string / float / None
+    :return: True if the event records came from SQS
+    :rtype: Python Boolean
+    '''
+    records = event.get('Records', [])
+    return len(records) > 0 and records[0].get('eventSource') == 'aws:sqs'
+
+
+def get_file_records(event):
     '''
-    if is_request_in_processing_cache(
-            s3_cache_table, context.aws_request_id) is False:
+    get_file_records Extracts the bucket and key of every object in the
+    event. Each file is given the id of the record it came from, which for
+    SQS is the message id used to report partial batch failures.
 
+    :param event: AWS Lambda uses this to pass in event data.
+    :type event: Python type - Dict / list / int / string / float / None
+    :return: The file records, and the ids of records that could not be read
+    :rtype: Python Tuple - (List, Set)
+    '''
+    file_records = []
+    failed_record_ids = set()
+
+    if is_sqs_event(event):
         for record in event['Records']:
-            bucket = record['s3']['bucket']['name']
-            key = urllib.parse.unquote_plus(record['s3']['object']['key'], encoding='utf-8')
+            record_id = record['messageId']
+            try:
+                message = json.loads(record['body'])
+                file_records.extend(
+                    _get_file_records_from_message(message, record_id))
+            except Exception:
+                traceback.print_exc()
+                failed_record_ids.add(record_id)
+    else:
+        file_records.extend(_get_file_records_from_message(event, None))
 
-        if key.endswith('/') is False:
-            start_step_function_for_file(bucket, key)
+    return file_records, failed_record_ids
+
+
+def _get_file_records_from_message(message, record_id):
+    '''
+    _get_file_records_from_message Extracts the files from an S3
+    notification or an EventBridge S3 event. Other messages, such as
+    the S3 test event, contain no files.
+
+    :param message: The S3 notification or EventBridge event
+    :type message: Python Dict
+    :param record_id: The id of the record this message came from
+    :type record_id: Python String
+    :return: The file records in the message
+    :rtype: Python List
+    '''
+    file_records = []
+
+    if 'detail' in message and message.get('source') == 'aws.s3':
+        detail = message['detail']
+        file_records.append(
+            _new_file_record(
+                record_id,
+                detail['bucket']['name'],
+                detail['object']['key'],
+                detail['object'].get('version-id'),
+                detail['object'].get('sequencer'),
+                detail['object'].get('size')))
     else:
-        print('Request id {} is already in processing cache'
-              .format(context.aws_request_id))
+        for record in message.get('Records', []):
+            if 's3' not in record:
+                continue
+            s3_object = record['s3']['object']
+            file_records.append(
+                _new_file_record(
+                    record_id,
+                    record['s3']['bucket']['name'],
+                    s3_object['key'],
+                    s3_object.get('versionId'),
+                    s3_object.get('sequencer'),
+                    s3_object.get('size')))
+
+    return file_records
+
+
+def _new_file_record(record_id, bucket, encoded_key, version_id, sequencer,
+                     size):
+    '''
+    _new_file_record Creates the record of a file to be processed.
+    Its processing cache key identifies this particular object event,
+    so redelivery of the same event can be detected.
 
-    return event
+    :param record_id: The id of the record the file came from
+    :type record_id: Python String
+    :param bucket: The S3 bucket name
+    :type bucket: Python String
+    :param encoded_key: The URL encoded S3 object key from the event
+    :type encoded_key: Python String
+    :param version_id: The object version id, if versioning is enabled
+    :type version_id: Python String
+    :param sequencer: The S3 event sequencer for the object
+    :type sequencer: Python String
+    :param size: The object size in bytes, if the event includes it
+    :type size: Python Integer
+    :return: The file record
+    :rtype: Python Dict
+    '''
+    key = urllib.parse.unquote_plus(encoded_key, encoding='utf-8')
+
+    # The version id is unique per object write, otherwise the sequencer
+    # orders the events for a key. Without either, don't deduplicate.
+    event_id = version_id or sequencer
+    processing_cache_key = '{}/{}#{}'.format(bucket, key, event_id) \
+        if event_id \
+        else None
+
+    return {
+        'recordId': record_id,
+        'bucket': bucket,
+        'key': key,
+        'size': size,
+        'processingCacheKey': processing_cache_key
+    }
+
+
+def start_step_function_for_record(file_record):
+    '''
+    start_step_function_for_record Starts the step function for a file
+    record unless its object event is already in the processing cache,
+    catching any exception so one file can't fail the others. Small files
+    are passed to the express staging lambda, or queued for batch staging,
+    instead.
+    If staging can't be started, the file is removed from the
+    processing cache so a retry is not dropped as a duplicate.
+
+    :param file_record: The file record
+    :type file_record: Python Dict
+    :return: True if the step function was started or was a duplicate
+    :rtype: Python Boolean
+    '''
+    processing_cache_key = file_record['processingCacheKey']
+    try:
+        if processing_cache_key is not None \
+                and is_file_in_processing_cache(
+                    s3_cache_table, processing_cache_key) is True:
+            print('Object event {} is already in processing cache'
+                  .format(processing_cache_key))
+            return True
+    except Exception:
+        traceback.print_exc()
+        return False
+
+    try:
+        if is_express_staging_file(file_record) and staging_batch_queue_url:
+            queue_file_for_batch_staging(
+                file_record['bucket'], file_record['key'])
+        elif is_express_staging_file(file_record):
+            start_express_staging_for_file(
+                file_record['bucket'], file_record['key'])
+        else:
+            start_step_function_for_file(
+                file_record['bucket'], file_record['key'])
+        return True
+    except Exception:
+        traceback.print_exc()
+        if processing_cache_key is not None:
+            remove_file_from_processing_cache(
+                s3_cache_table, processing_cache_key)
+        return False
+
+
+def is_express_staging_file(file_record):
+    '''
+    is_express_staging_file Checks whether the file is small enough to
+    be staged by the express staging lambda. Files whose size isn't in
+    the event are always staged by a step function.
+
+    :param file_record: The file record
+    :type file_record: Python Dict
+    :return: True if the file should be staged by the express lambda
+    :rtype: Python Boolean
+    '''
+    size = file_record['size']
+    return express_staging_max_bytes > 0 \
+        and express_staging_function is not None \
+        and size is not None \
+        and size < express_staging_max_bytes
 
 
 def start_step_function_for_file(bucket, key):
@@ -86,35 +316,8 @@ def start_step_function_for_file(bucket, key):
     :type key: Python String
     '''
     try:
-        file_name = os.path.basename(key)
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S%f')
-        keystring = re.sub('\W+', '_', key)  # Remove special chars
-        step_function_name = timestamp + id_generator() + '_' + keystring
-
-        step_function_name = step_function_name[:80]
-
-        sfn_Input = {
-            'fileDetails': {
-                'bucket': bucket,
-                'key': key,
-                'fileName': file_name,
-                'stagingExecutionName': step_function_name
-            },
-            'settings': {
-                'dataSourceTableName':
-                    os.environ['DATA_SOURCE_TABLE_NAME'],
-                'dataCatalogTableName':
-                    os.environ['DATA_CATALOG_TABLE_NAME'],
-                'defaultSNSErrorArn':
-                    os.environ['SNS_FAILURE_ARN'],
-                's3_cache_table':
-                    os.environ['S3_CACHE_TABLE_NAME'],
-                'stagingBucket':
-                    os.environ['STAGING_BUCKET_NAME'],
-                'failedBucket':
-                    os.environ['FAILED_BUCKET_NAME']
-            }
-        }
+        sfn_Input = get_staging_input(bucket, key)
+        step_function_name = sfn_Input['fileDetails']['stagingExecutionName']
 
         # Start step function
         step_function_input = json.dumps(sfn_Input)
@@ -130,6 +333,100 @@ def start_step_function_for_file(bucket, key):
             raise
 
 
+def start_express_staging_for_file(bucket, key):
+    '''
+    start_express_staging_for_file Asynchronously invokes the express
+    staging lambda, which runs every staging step for this file in one
+    invocation.
+
+    :param bucket:  The S3 bucket name
+    :type bucket: Python String
+    :param key: The S3 object key
+    :type key: Python String
+    '''
+    try:
+        staging_input = json.dumps(get_staging_input(bucket, key))
+        lambda_client.invoke(
+            FunctionName=express_staging_function,
+            InvocationType='Event',
+            Payload=staging_input)
+
+        print('Started express staging with input:{}'
+              .format(staging_input))
+    except Exception as e:
+            record_failure_to_start_step_function(
+                bucket, key, e)
+            raise
+
+
+def queue_file_for_batch_staging(bucket, key):
+    '''
+    queue_file_for_batch_staging Sends the file's staging input to the
+    staging batch queue, from which the batch staging lambda stages many
+    files per invocation.
+
+    :param bucket:  The S3 bucket name
+    :type bucket: Python String
+    :param key: The S3 object key
+    :type key: Python String
+    '''
+    try:
+        staging_input = json.dumps(get_staging_input(bucket, key))
+        sqs.send_message(
+            QueueUrl=staging_batch_queue_url,
+            MessageBody=staging_input)
+
+        print('Queued file for batch staging with input:{}'
+              .format(staging_input))
+    except Exception as e:
+            record_failure_to_start_step_function(
+                bucket, key, e)
+            raise
+
+
+def get_staging_input(bucket, key):
+    '''
+    get_staging_input Creates the input passed to the staging engine
+    for this file, including a unique name for its staging execution.
+
+    :param bucket:  The S3 bucket name
+    :type bucket: Python String
+    :param key: The S3 object key
+    :type key: Python String
+    :return: The staging input
+    :rtype: Python Dict
+    '''
+    file_name = os.path.basename(key)
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S%f')
+    keystring = re.sub('\W+', '_', key)  # Remove special chars
+    step_function_name = timestamp + id_generator() + '_' + keystring
+
+    step_function_name = step_function_name[:80]
+
+    return {
+        'fileDetails': {
+            'bucket': bucket,
+            'key': key,
+            'fileName': file_name,
+            'stagingExecutionName': step_function_name
+        },
+        'settings': {
+            'dataSourceTableName':
+                os.environ['DATA_SOURCE_TABLE_NAME'],
+            'dataCatalogTableName':
+                os.environ['DATA_CATALOG_TABLE_NAME'],
+            'defaultSNSErrorArn':
+                os.environ['SNS_FAILURE_ARN'],
+            's3_cache_table':
+                os.environ['S3_CACHE_TABLE_NAME'],
+            'stagingBucket':
+                os.environ['STAGING_BUCKET_NAME'],
+            'failedBucket':
+                os.environ['FAILED_BUCKET_NAME']
+        }
+    }
+
+
 def id_generator(size=6, chars=string.ascii_uppercase + string.digits):
     '''
     id_generator Creates a random id to add to the step function
@@ -145,26 +442,34 @@ def id_generator(size=6, chars=string.ascii_uppercase + string.digits):
     return ''.join(random.choice(chars) for _ in range(size))
 
 
-def is_request_in_processing_cache(s3_cache_table, request_id):
+def is_file_in_processing_cache(s3_cache_table, processing_cache_key):
     '''
-    is_request_in_processing_cache Checks that the request id is
+    is_file_in_processing_cache Checks that the object event is
     not already in the cache by doing a write that is conditional
-    that the value does not already exist.
+    that the value does not already exist (or has expired). The item
+    has a TTL so DynamoDB removes it once redelivery is unlikely.
 
     :param s3_cache_table: The DynamnoDB table name for S3 caching
     :type s3_cache_table: Python String
-    :param request_id: The request id
-    :type request_id: Python String
-    :return: True if the request is already in the prccessing cache
-    :rtype: Python Boolean]
+    :param processing_cache_key: The bucket, key and version of the object
+    :type processing_cache_key: Python String
+    :return: True if the object is already in the prccessing cache
+    :rtype: Python Boolean
     '''
+    now = int(time.time())
     try:
-        # Add the request to the cache table, with
-        # the condition that it's not already present
-        ddb_cache_table = dynamodb.Table(s3_cache_table)
-        ddb_cache_table.put_item(
-            Item={'lastRequestId': request_id},
-            ConditionExpression="attribute_not_exists(lastRequestId)")
+        # Add the object to the cache table, with the condition that it's
+        # not already present. Use the thread safe client, as batches are
+        # started concurrently.
+        dynamodb.meta.client.put_item(
+            TableName=s3_cache_table,
+            Item={
+                'lastRequestId': processing_cache_key,
+                'expiresAt': now + processing_cache_ttl_seconds
+            },
+            ConditionExpression="attribute_not_exists(lastRequestId) "
+                                "OR expiresAt < :now",
+            ExpressionAttributeValues={':now': now})
         return False
     except ClientError as e:
         if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
@@ -173,6 +478,24 @@ def is_request_in_processing_cache(s3_cache_table, request_id):
             raise(e)
 
 
+def remove_file_from_processing_cache(s3_cache_table, processing_cache_key):
+    '''
+    remove_file_from_processing_cache Removes the object event from the
+    cache. Any exceptions raised by this method are caught.
+
+    :param s3_cache_table: The DynamnoDB table name for S3 caching
+    :type s3_cache_table: Python String
+    :param processing_cache_key: The bucket, key and version of the object
+    :type processing_cache_key: Python String
+    '''
+    try:
+        dynamodb.meta.client.delete_item(
+            TableName=s3_cache_table,
+            Key={'lastRequestId': processing_cache_key})
+    except Exception:
+        traceback.print_exc()
+
+
 def send_failure_sns_message(bucket, key):
     '''
     send_failure_sns_message Sends an SNS notification alerting subscribers
@@ -220,8 +543,9 @@ def record_failure_to_start_step_function(bucket, key, exception):
             }
         }
 
-        dynamodb_table = dynamodb.Table(data_catalog_table)
-        dynamodb_table.put_item(Item=dynamodb_item)
+        # Use the thread safe client, as batches are started concurrently.
+        dynamodb.meta.client.put_item(
+            TableName=data_catalog_table, Item=dynamodb_item)
 
     except Exception:
         traceback.print_exc()
@@ -0,0 +1,240 @@
+"""
+A column-oriented alternative to `csvvalidator.CSVValidator` for simple
+per-field type checks on large CSV/TSV files.
+
+Rows are read in blocks, the checked columns of each block are extracted,
+and each check runs over a whole column at once. Integer columns are matched with a
+single regular expression over the joined column, and enumeration columns
+with a set difference, so the common case of a valid block never calls
+Python code per cell. Only when a column check fails are its cells checked
+one at a time, to find the offending rows.
+
+Problems are reported in the same format and order as
+`CSVValidator.ivalidate` reports the equivalent value checks.
+
+Checks can be applied to a sample of the rows, either every nth row (as
+`CSVValidator`'s `modulus` does) or a random fraction of each block.
+
+"""
+
+
+import itertools
+import random
+import re
+from operator import itemgetter
+
+import csvvalidator
+
+
+DEFAULT_BLOCK_SIZE = 10000
+
+# Separates the cells of a column joined into one string.
+_CELL_SEPARATOR = '\n'
+# Cells int() accepts without needing int() to be called.
+_INTEGER_CELL = re.compile(r'[+-]?[0-9]+')
+_INTEGER_COLUMN = re.compile(r'(?:[+-]?[0-9]+\n)*[+-]?[0-9]+')
+
+
+def integer_column():
+    """
+    Return a column check function which returns the positions of the
+    values that `int` would reject.
+
+    """
+
+    def checker(values):
+        joined = _CELL_SEPARATOR.join(values)
+        # a cell containing the separator would hide a bad value
+        if joined.count(_CELL_SEPARATOR) == len(values) - 1 and \
+                _INTEGER_COLUMN.fullmatch(joined) is not None:
+            return []
+        invalid = []
+        for position, value in enumerate(values):
+            if _INTEGER_CELL.fullmatch(value) is None:
+                try:
+                    int(value)
+                except ValueError:
+                    invalid.append(position)
+        return invalid
+    return checker
+
+
+def enumeration_column(members):
+    """
+    Return a column check function which returns the positions of the
+    values not in `members`.
+
+    """
+
+    members = frozenset(members)
+    def checker(values):
+        if members.issuperset(values):
+            return []
+        return [position for position, value in enumerate(values)
+                if value not in members]
+    return checker
+
+
+class ColumnarCSVValidator(object):
+    """
+    Validates CSV-like data a block of rows at a time, applying column
+    checks to whole columns.
+
+    """
+
+
+    def __init__(self, field_names):
+        """
+        Instantiate a `ColumnarCSVValidator`, supplying expected
+        `field_names` as a sequence of strings.
+
+        """
+
+        self._field_names = tuple(field_names)
+        self._header_checks = []
+        self._column_checks = []
+        self._sample_rate = None
+
+
+    def add_header_check(self,
+                         code=csvvalidator.HEADER_CHECK_FAILED,
+                         message=csvvalidator.MESSAGES[
+                             csvvalidator.HEADER_CHECK_FAILED]):
+        """
+        Add a header check, i.e., check whether the header record is
+        consistent with the expected field names.
+
+        """
+
+        self._header_checks.append((code, message))
+
+
+    def add_column_check(self, field_name, column_check,
+                         code=csvvalidator.VALUE_CHECK_FAILED,
+                         message=csvvalidator.MESSAGES[
+                             csvvalidator.VALUE_CHECK_FAILED],
+                         modulus=1):
+        """
+        Add a column check function for the specified field. The function
+        accepts the field's values for a block of rows and returns the
+        positions of the values that are not valid.
+
+        `modulus` - apply the check to every nth record, defaults to 1 (check
+        every record)
+
+        """
+
+        assert field_name in self._field_names, \
+            'unexpected field name: %s' % field_name
+        assert callable(column_check), 'column check must be callable'
+
+        fi = self._field_names.index(field_name)
+        self._column_checks.append(
+            (fi, field_name, column_check, code, message, modulus))
+
+
+    def set_sample_rate(self, sample_rate):
+        """
+        Apply the column checks to a random `sample_rate` fraction of the
+        rows only, or to every row if `sample_rate` is None.
+
+        """
+
+        assert sample_rate is None or 0 <= sample_rate <= 1, \
+            'sample rate must be between 0 and 1'
+
+        self._sample_rate = sample_rate
+
+
+    def ivalidate(self, data, expect_header_row=True,
+                  block_size=DEFAULT_BLOCK_SIZE):
+        """
+        Validate `data` and return an iterator over the problems found.
+
+        `expect_header_row` - does the data start with a header row (i.e.,
+        the first record is a list of field names)? Defaults to True.
+
+        """
+
+        rows = iter(data)
+        first_row = 0
+        if expect_header_row:
+            header = next(rows, None)
+            if header is None:
+                return
+            for code, message in self._header_checks:
+                if tuple(header) != self._field_names:
+                    yield {
+                        'code': code,
+                        'message': message,
+                        'row': 1,
+                        'record': tuple(header),
+                        'missing': set(self._field_names) - set(header),
+                        'unexpected': set(header) - set(self._field_names)
+                    }
+            first_row = 1
+
+        while True:
+            block = list(itertools.islice(rows, block_size))
+            if not block:
+                break
+            for p in self._validate_block(block, first_row):
+                yield p
+            first_row = first_row + len(block)
+
+
+    def _validate_block(self, block, first_row):
+        """
+        Apply the column checks to a block of rows, where `first_row` is the
+        index of the block's first row in the data.
+
+        """
+
+        field_count = len(self._field_names)
+        is_rectangular = min(map(len, block)) >= field_count
+        block_size = len(block)
+
+        sampled = None
+        if self._sample_rate is not None:
+            # rounded at random, so small blocks are still sampled
+            sample_size = int(block_size * self._sample_rate + random.random())
+            sampled = sorted(random.sample(range(block_size),
+                                           min(sample_size, block_size)))
+
+        invalid = []
+        for check_index, column_check in enumerate(self._column_checks):
+            fi, modulus = column_check[0], column_check[5]
+            if sampled is not None:
+                positions = [position for position in sampled
+                             if (first_row + position) % modulus == 0]
+            else:
+                # the row index counts the header row, as in CSVValidator
+                positions = range((-first_row) % modulus, block_size, modulus)
+            if is_rectangular:
+                if sampled is None and modulus == 1:
+                    values = list(map(itemgetter(fi), block))
+                else:
+                    values = [block[position][fi] for position in positions]
+            else:
+                # only check values that are present, as CSVValidator does
+                positions = [position for position in positions
+                             if fi < len(block[position])]
+                values = [block[position][fi] for position in positions]
+            for value_position in column_check[2](values):
+                invalid.append(
+                    (positions[value_position], check_index))
+
+        # report in row order, then check order, as CSVValidator does
+        for position, check_index in sorted(invalid):
+            fi, field_name, _, code, message, _ = \
+                self._column_checks[check_index]
+            r = block[position]
+            yield {
+                'code': code,
+                'message': message,
+                'row': first_row + position + 1,
+                'column': fi + 1,
+                'field': field_name,
+                'value': r[fi],
+                'record': r
+            }
@@ -0,0 +1,397 @@
+"""
+A `csvvalidator.CSVValidator` that plans its checks once per validation.
+
+`CSVValidator` resolves the column index of every field check, and looks
+up its 'each', 'check' and 'assert' methods with `dir()`, on every row,
+and calls every family of checks whether or not any were added. The
+`PlannedCSVValidator` resolves them once in `ivalidate`, and applies only
+the families that have checks, so each row only runs its checks.
+
+Problems are reported in the same format and order as
+`CSVValidator.ivalidate` reports them. The vendored `csvvalidator` module
+is left as distributed.
+
+"""
+
+
+import csvvalidator
+
+
+class PlannedCSVValidator(csvvalidator.CSVValidator):
+    """
+    Validates CSV-like data as `CSVValidator` does, resolving its checks
+    once per validation rather than once per row.
+
+    """
+
+
+    def __init__(self, field_names):
+        """
+        Instantiate a `PlannedCSVValidator`, supplying expected
+        `field_names` as a sequence of strings.
+
+        """
+
+        super(PlannedCSVValidator, self).__init__(field_names)
+        self._plan = None
+
+
+    def add_unique_check(self, key,
+                         code=csvvalidator.UNIQUE_CHECK_FAILED,
+                         message=csvvalidator.MESSAGES[
+                             csvvalidator.UNIQUE_CHECK_FAILED]):
+        """
+        Add a unique check on a single column or combination of columns,
+        as `CSVValidator.add_unique_check` does. Field names are checked
+        against `str`, as `basestring` doesn't exist in Python 3.
+
+        """
+
+        if isinstance(key, str):
+            assert key in self._field_names, 'unexpected field name: %s' % key
+        else:
+            for f in key:
+                assert f in self._field_names, 'unexpected field name: %s' % key
+        t = key, code, message
+        self._unique_checks.append(t)
+
+
+    def ivalidate(self, data,
+                 expect_header_row=True,
+                 ignore_lines=0,
+                 summarize=False,
+                 context=None,
+                 report_unexpected_exceptions=True):
+        """
+        Validate `data` and return a iterator over problems found, as
+        `CSVValidator.ivalidate` does.
+
+        """
+
+        unique_sets = self._init_unique_sets() # used for unique checks
+        self._plan = self._init_plan() # resolved once, not on every row
+        row_checks = self._plan['row_checks']
+        skips = self._skips
+        for i, r in enumerate(data):
+            if expect_header_row and i == ignore_lines:
+                # r is the header row
+                for p in self._apply_header_checks(i, r, summarize, context):
+                    yield p
+            elif i >= ignore_lines:
+                # r is a data row
+                skip = False
+                if skips:
+                    for p in self._apply_skips(i, r, summarize,
+                                                      report_unexpected_exceptions,
+                                                      context):
+                        if p is True:
+                            skip = True
+                        else:
+                            yield p
+                if not skip:
+                    # may yield a problem if an exception is raised
+                    for apply_checks in row_checks:
+                        for p in apply_checks(i, r, unique_sets, summarize,
+                                              report_unexpected_exceptions,
+                                              context):
+                            yield p
+        for p in self._apply_finally_assert_methods(summarize,
+                                                    report_unexpected_exceptions,
+                                                    context):
+            yield p
+
+
+    def _init_plan(self):
+        """
+        Build the validation plan, i.e., resolve the column index of every
+        field check and find the 'each', 'check' and 'assert' methods once
+        per validation rather than on every row. The plan's `row_checks`
+        are the check families applied to each data row, in order, omitting
+        any family with no checks.
+
+        """
+
+        plan = dict()
+        plan['value_checks'] = [
+            (self._field_names.index(field_name), field_name, check, code,
+             message, modulus)
+            for field_name, check, code, message, modulus
+            in self._value_checks]
+        plan['value_predicates'] = [
+            (self._field_names.index(field_name), field_name, predicate, code,
+             message, modulus)
+            for field_name, predicate, code, message, modulus
+            in self._value_predicates]
+        plan['unique_checks'] = []
+        for key, code, message in self._unique_checks:
+            if isinstance(key, str): # assume key is a field name
+                fi = self._field_names.index(key)
+            else: # assume key is a list or tuple, i.e., compound key
+                fi = tuple(self._field_names.index(f) for f in key)
+            plan['unique_checks'].append((key, fi, code, message))
+        plan['each_methods'] = self._find_methods('each')
+        plan['check_methods'] = self._find_methods('check')
+        plan['assert_methods'] = self._find_methods('assert')
+
+        row_checks = []
+        if plan['each_methods']:
+            row_checks.append(
+                lambda i, r, u, s, x, c: self._apply_each_methods(i, r, s, x, c))
+        if plan['value_checks']:
+            row_checks.append(
+                lambda i, r, u, s, x, c: self._apply_value_checks(i, r, s, x, c))
+        if self._record_length_checks:
+            row_checks.append(
+                lambda i, r, u, s, x, c: self._apply_record_length_checks(i, r, s, c))
+        if plan['value_predicates']:
+            row_checks.append(
+                lambda i, r, u, s, x, c: self._apply_value_predicates(i, r, s, x, c))
+        if self._record_checks:
+            row_checks.append(
+                lambda i, r, u, s, x, c: self._apply_record_checks(i, r, s, x, c))
+        if self._record_predicates:
+            row_checks.append(
+                lambda i, r, u, s, x, c: self._apply_record_predicates(i, r, s, x, c))
+        if plan['unique_checks']:
+            row_checks.append(
+                lambda i, r, u, s, x, c: self._apply_unique_checks(i, r, u, s))
+        if plan['check_methods']:
+            row_checks.append(
+                lambda i, r, u, s, x, c: self._apply_check_methods(i, r, s, x, c))
+        if plan['assert_methods']:
+            row_checks.append(
+                lambda i, r, u, s, x, c: self._apply_assert_methods(i, r, s, x, c))
+        plan['row_checks'] = row_checks
+        return plan
+
+
+    def _get_plan(self):
+        """Return the validation plan, building it if not yet built."""
+
+        if self._plan is None:
+            self._plan = self._init_plan()
+        return self._plan
+
+
+    def _find_methods(self, prefix):
+        """Find the bound methods whose names start with `prefix`."""
+
+        return [getattr(self, a) for a in dir(self) if a.startswith(prefix)]
+
+
+    def _apply_value_checks(self, i, r,
+                            summarize=False,
+                            report_unexpected_exceptions=True,
+                            context=None):
+        """Apply value check functions on the given record `r`."""
+
+        n = len(r)
+        for fi, field_name, check, code, message, modulus in self._get_plan()['value_checks']:
+            if modulus == 1 or i % modulus == 0: # support sampling
+                if fi < n: # only apply checks if there is a value
+                    value = r[fi]
+                    try:
+                        check(value)
+                    except ValueError:
+                        p = {'code': code}
+                        if not summarize:
+                            p['message'] = message
+                            p['row'] = i + 1
+                            p['column'] = fi + 1
+                            p['field'] = field_name
+                            p['value'] = value
+                            p['record'] = r
+                            if context is not None: p['context'] = context
+                        yield p
+                    except Exception as e:
+                        if report_unexpected_exceptions:
+                            p = {'code': csvvalidator.UNEXPECTED_EXCEPTION}
+                            if not summarize:
+                                p['message'] = csvvalidator.MESSAGES[csvvalidator.UNEXPECTED_EXCEPTION] % (e.__class__.__name__, e)
+                                p['row'] = i + 1
+                                p['column'] = fi + 1
+                                p['field'] = field_name
+                                p['value'] = value
+                                p['record'] = r
+                                p['exception'] = e
+                                p['function'] = '%s: %s' % (check.__name__,
+                                                            check.__doc__)
+                                if context is not None: p['context'] = context
+                            yield p
+
+
+    def _apply_value_predicates(self, i, r,
+                                summarize=False,
+                                report_unexpected_exceptions=True,
+                                context=None):
+        """Apply value predicates on the given record `r`."""
+
+        n = len(r)
+        for fi, field_name, predicate, code, message, modulus in self._get_plan()['value_predicates']:
+            if modulus == 1 or i % modulus == 0: # support sampling
+                if fi < n: # only apply predicate if there is a value
+                    value = r[fi]
+                    try:
+                        valid = predicate(value)
+                        if not valid:
+                            p = {'code': code}
+                            if not summarize:
+                                p['message'] = message
+                                p['row'] = i + 1
+                                p['column'] = fi + 1
+                                p['field'] = field_name
+                                p['value'] = value
+                                p['record'] = r
+                                if context is not None: p['context'] = context
+                            yield p
+                    except Exception as e:
+                        if report_unexpected_exceptions:
+                            p = {'code': csvvalidator.UNEXPECTED_EXCEPTION}
+                            if not summarize:
+                                p['message'] = csvvalidator.MESSAGES[csvvalidator.UNEXPECTED_EXCEPTION] % (e.__class__.__name__, e)
+                                p['row'] = i + 1
+                                p['column'] = fi + 1
+                                p['field'] = field_name
+                                p['value'] = value
+                                p['record'] = r
+                                p['exception'] = e
+                                p['function'] = '%s: %s' % (predicate.__name__,
+                                                            predicate.__doc__)
+                                if context is not None: p['context'] = context
+                            yield p
+
+
+    def _apply_unique_checks(self, i, r, unique_sets,
+                             summarize=False,
+                             context=None):
+        """Apply unique checks on `r`."""
+
+        for key, key_fi, code, message in self._get_plan()['unique_checks']:
+            value = None
+            values = unique_sets[key]
+            if isinstance(key_fi, int): # key is a field name
+                if key_fi >= len(r):
+                    continue
+                value = r[key_fi]
+            else: # key is a list or tuple, i.e., compound key
+                value = []
+                for fi in key_fi:
+                    if fi >= len(r):
+                        break
+                    value.append(r[fi])
+                value = tuple(value) # enable hashing
+            if value in values:
+                p = {'code': code}
+                if not summarize:
+                    p['message'] = message
+                    p['row'] = i + 1
+                    p['record'] = r
+                    p['key'] = key
+                    p['value'] = value
+                    if context is not None: p['context'] = context
+                yield p
+            values.add(value)
+
+
+    def _apply_each_methods(self, i, r,
+                            summarize=False,
+                            report_unexpected_exceptions=True,
+                            context=None):
+        """Invoke 'each' methods on `r`."""
+
+        for f in self._get_plan()['each_methods']:
+            rdict = self._as_dict(r)
+            try:
+                f(rdict)
+            except Exception as e:
+                if report_unexpected_exceptions:
+                    p = {'code': csvvalidator.UNEXPECTED_EXCEPTION}
+                    if not summarize:
+                        p['message'] = csvvalidator.MESSAGES[csvvalidator.UNEXPECTED_EXCEPTION] % (e.__class__.__name__, e)
+                        p['row'] = i + 1
+                        p['record'] = r
+                        p['exception'] = e
+                        p['function'] = '%s: %s' % (f.__name__,
+                                                    f.__doc__)
+                        if context is not None: p['context'] = context
+                    yield p
+
+
+    def _apply_assert_methods(self, i, r,
+                              summarize=False,
+                              report_unexpected_exceptions=True,
+                              context=None):
+        """Apply 'assert' methods on `r`."""
+
+        for f in self._get_plan()['assert_methods']:
+            rdict = self._as_dict(r)
+            try:
+                f(rdict)
+            except AssertionError as e:
+                code = csvvalidator.ASSERT_CHECK_FAILED
+                message = csvvalidator.MESSAGES[csvvalidator.ASSERT_CHECK_FAILED]
+                if len(e.args) > 0:
+                    custom = e.args[0]
+                    if isinstance(custom, (list, tuple)):
+                        if len(custom) > 0:
+                            code = custom[0]
+                        if len(custom) > 1:
+                            message = custom[1]
+                    else:
+                        code = custom
+                p = {'code': code}
+                if not summarize:
+                    p['message'] = message
+                    p['row'] = i + 1
+                    p['record'] = r
+                    if context is not None: p['context'] = context
+                yield p
+            except Exception as e:
+                if report_unexpected_exceptions:
+                    p = {'code': csvvalidator.UNEXPECTED_EXCEPTION}
+                    if not summarize:
+                        p['message'] = csvvalidator.MESSAGES[csvvalidator.UNEXPECTED_EXCEPTION] % (e.__class__.__name__, e)
+                        p['row'] = i + 1
+                        p['record'] = r
+                        p['exception'] = e
+                        p['function'] = '%s: %s' % (f.__name__,
+                                                    f.__doc__)
+                        if context is not None: p['context'] = context
+                    yield p
+
+
+    def _apply_check_methods(self, i, r,
+                              summarize=False,
+                              report_unexpected_exceptions=True,
+                              context=None):
+        """Apply 'check' methods on `r`."""
+
+        for f in self._get_plan()['check_methods']:
+            rdict = self._as_dict(r)
+            try:
+                f(rdict)
+            except csvvalidator.RecordError as e:
+                code = e.code if e.code is not None else csvvalidator.RECORD_CHECK_FAILED
+                p = {'code': code}
+                if not summarize:
+                    message = e.message if e.message is not None else csvvalidator.MESSAGES[csvvalidator.RECORD_CHECK_FAILED]
+                    p['message'] = message
+                    p['row'] = i + 1
+                    p['record'] = r
+                    if context is not None: p['context'] = context
+                    if e.details is not None: p['details'] = e.details
+                yield p
+            except Exception as e:
+                if report_unexpected_exceptions:
+                    p = {'code': csvvalidator.UNEXPECTED_EXCEPTION}
+                    if not summarize:
+                        p['message'] = csvvalidator.MESSAGES[csvvalidator.UNEXPECTED_EXCEPTION] % (e.__class__.__name__, e)
+                        p['row'] = i + 1
+                        p['record'] = r
+                        p['exception'] = e
+                        p['function'] = '%s: %s' % (f.__name__,
+                                                    f.__doc__)
+                        if context is not None: p['context'] = context
+                    yield p
+
+
@@ -0,0 +1,270 @@
+import numbers
+import re
+
+from jsonschema.validators import Draft4Validator
+
+
+# Python expressions testing a value against each Draft 4 type. These
+# match the vendored jsonschema, where bools are not integers or numbers.
+TYPE_CHECKS = {
+    'array': 'isinstance({0}, list)',
+    'boolean': 'isinstance({0}, bool)',
+    'integer': '(isinstance({0}, int) and not isinstance({0}, bool))',
+    'null': '{0} is None',
+    'number': '(isinstance({0}, Number) and not isinstance({0}, bool))',
+    'object': 'isinstance({0}, dict)',
+    'string': 'isinstance({0}, str)'
+}
+
+# Keywords that never affect validation here. Format is only checked when
+# a format checker is supplied, which verifyFileSchema does not do.
+IGNORED_KEYWORDS = {
+    '$schema', 'title', 'description', 'default', 'definitions', 'format'
+}
+
+# Keywords the compiler generates code for. A subschema using any other
+# keyword (for example $ref, id, allOf or patternProperties) is validated
+# by the jsonschema interpreter instead.
+COMPILED_KEYWORDS = {
+    'type', 'required', 'properties', 'additionalProperties', 'items',
+    'enum', 'minimum', 'maximum', 'exclusiveMinimum', 'exclusiveMaximum',
+    'minLength', 'maxLength', 'minItems', 'maxItems', 'pattern'
+}
+
+# Subschemas nested deeper than this are left to the interpreter, to stay
+# well within Python's limits on indentation and nested loops.
+MAX_COMPILED_DEPTH = 16
+
+
+class CompiledValidator(object):
+    '''
+    A jsonschema validator whose common case is a generated Python
+    function with the schema's checks inlined. Only when that function
+    rejects an instance is the interpreter run, so the error raised is
+    exactly the one the interpreter would have raised.
+    '''
+
+    def __init__(self, validator, is_valid):
+        self.validator = validator
+        self.schema = validator.schema
+        self._is_valid = is_valid
+
+    def is_valid(self, instance):
+        return self._is_valid(instance)
+
+    def validate(self, instance):
+        if not self._is_valid(instance):
+            self.validator.validate(instance)
+
+
+def compile_validator(validator):
+    '''
+    compile_validator Generates a Python validation function for the
+    validator's Draft 4 schema, falling back to the interpreter for any
+    subschema using keywords the compiler does not support.
+
+    :param validator: The jsonschema validator for the schema
+    :type validator: jsonschema IValidator
+    :return: The compiled validator, or the original if it can't compile
+    :rtype: jsonschema IValidator
+    '''
+    if not isinstance(validator, Draft4Validator) \
+            or not _is_compilable(validator.schema):
+        return validator
+
+    generator = _CodeGenerator(validator)
+    return CompiledValidator(validator, generator.generate())
+
+
+def _is_compilable(schema):
+    '''
+    _is_compilable Checks whether the keywords of this subschema (but
+    not its children) can all be compiled.
+
+    :param schema: The subschema
+    :type schema: Python Dict
+    :return: True if code can be generated for the subschema
+    :rtype: Python Boolean
+    '''
+    if not isinstance(schema, dict):
+        return False
+
+    for keyword, value in schema.items():
+        if keyword in IGNORED_KEYWORDS:
+            continue
+        if keyword not in COMPILED_KEYWORDS:
+            return False
+        if keyword == 'type':
+            types = value if isinstance(value, list) else [value]
+            if not all(type_name in TYPE_CHECKS for type_name in types):
+                return False
+        elif keyword == 'additionalProperties':
+            if not isinstance(value, (bool, dict)):
+                return False
+        elif keyword == 'items':
+            if not isinstance(value, dict):
+                return False
+        elif keyword in ('required', 'enum'):
+            if not isinstance(value, list):
+                return False
+        elif keyword == 'properties':
+            if not isinstance(value, dict):
+                return False
+        elif keyword == 'pattern':
+            if not isinstance(value, str):
+                return False
+
+    return True
+
+
+class _CodeGenerator(object):
+    '''
+    Generates the source of a function returning whether an instance is
+    valid. Each check returns False as soon as it fails.
+    '''
+
+    def __init__(self, validator):
+        self.validator = validator
+        self.lines = []
+        self.constants = []
+        self.fallbacks = []
+        self.variable_count = 0
+
+    def generate(self):
+        self.lines.append('def is_valid(v0):')
+        self._add_schema(self.validator.schema, 'v0', 1)
+        self.lines.append('    return True')
+
+        namespace = {
+            'Number': numbers.Number,
+            'c': self.constants,
+            'fallbacks': self.fallbacks
+        }
+        exec(compile('\n'.join(self.lines), '<compiled schema>', 'exec'),
+             namespace)
+        return namespace['is_valid']
+
+    def _line(self, indent, line):
+        self.lines.append('    ' * indent + line)
+
+    def _constant(self, value):
+        self.constants.append(value)
+        return 'c[{}]'.format(len(self.constants) - 1)
+
+    def _variable(self):
+        self.variable_count = self.variable_count + 1
+        return 'v{}'.format(self.variable_count)
+
+    def _add_schema(self, schema, var, indent):
+        if not _is_compilable(schema) or indent > MAX_COMPILED_DEPTH:
+            self.fallbacks.append(
+                lambda instance, _schema=schema:
+                    self.validator.is_valid(instance, _schema))
+            self._line(indent, 'if not fallbacks[{}]({}):'.format(
+                len(self.fallbacks) - 1, var))
+            self._line(indent + 1, 'return False')
+            return
+
+        if 'type' in schema:
+            types = schema['type'] if isinstance(schema['type'], list) \
+                else [schema['type']]
+            checks = ' or '.join(
+                TYPE_CHECKS[type_name].format(var) for type_name in types)
+            self._line(indent, 'if not ({}):'.format(checks or 'False'))
+            self._line(indent + 1, 'return False')
+
+        if 'enum' in schema:
+            self._line(indent, 'if {} not in {}:'.format(
+                var, self._constant(schema['enum'])))
+            self._line(indent + 1, 'return False')
+
+        self._add_number_checks(schema, var, indent)
+        self._add_string_checks(schema, var, indent)
+        self._add_array_checks(schema, var, indent)
+        self._add_object_checks(schema, var, indent)
+
+    def _add_number_checks(self, schema, var, indent):
+        checks = []
+        if 'minimum' in schema:
+            operator = '<=' if schema.get('exclusiveMinimum', False) else '<'
+            checks.append('{} {} {}'.format(
+                var, operator, self._constant(schema['minimum'])))
+        if 'maximum' in schema:
+            operator = '>=' if schema.get('exclusiveMaximum', False) else '>'
+            checks.append('{} {} {}'.format(
+                var, operator, self._constant(schema['maximum'])))
+        if checks:
+            self._line(indent, 'if {}:'.format(TYPE_CHECKS['number'].format(var)))
+            self._line(indent + 1, 'if {}:'.format(' or '.join(checks)))
+            self._line(indent + 2, 'return False')
+
+    def _add_string_checks(self, schema, var, indent):
+        checks = []
+        if 'minLength' in schema:
+            checks.append('len({}) < {}'.format(
+                var, self._constant(schema['minLength'])))
+        if 'maxLength' in schema:
+            checks.append('len({}) > {}'.format(
+                var, self._constant(schema['maxLength'])))
+        if 'pattern' in schema:
+            checks.append('{}.search({}) is None'.format(
+                self._constant(re.compile(schema['pattern'])), var))
+        if checks:
+            self._line(indent, 'if {}:'.format(TYPE_CHECKS['string'].format(var)))
+            self._line(indent + 1, 'if {}:'.format(' or '.join(checks)))
+            self._line(indent + 2, 'return False')
+
+    def _add_array_checks(self, schema, var, indent):
+        if not any(keyword in schema
+                   for keyword in ('minItems', 'maxItems', 'items')):
+            return
+
+        self._line(indent, 'if {}:'.format(TYPE_CHECKS['array'].format(var)))
+        if 'minItems' in schema:
+            self._line(indent + 1, 'if len({}) < {}:'.format(
+                var, self._constant(schema['minItems'])))
+            self._line(indent + 2, 'return False')
+        if 'maxItems' in schema:
+            self._line(indent + 1, 'if len({}) > {}:'.format(
+                var, self._constant(schema['maxItems'])))
+            self._line(indent + 2, 'return False')
+        if 'items' in schema:
+            item_var = self._variable()
+            self._line(indent + 1, 'for {} in {}:'.format(item_var, var))
+            self._add_schema(schema['items'], item_var, indent + 2)
+        self._line(indent + 1, 'pass')
+
+    def _add_object_checks(self, schema, var, indent):
+        properties = schema.get('properties', {})
+        required = schema.get('required', [])
+        additional_properties = schema.get('additionalProperties', True)
+        if not properties and not required and additional_properties is True:
+            return
+
+        self._line(indent, 'if {}:'.format(TYPE_CHECKS['object'].format(var)))
+        for property_name in required:
+            self._line(indent + 1, 'if {} not in {}:'.format(
+                self._constant(property_name), var))
+            self._line(indent + 2, 'return False')
+
+        for property_name, subschema in properties.items():
+            name = self._constant(property_name)
+            property_var = self._variable()
+            self._line(indent + 1, 'if {} in {}:'.format(name, var))
+            self._line(indent + 2, '{} = {}[{}]'.format(
+                property_var, var, name))
+            self._add_schema(subschema, property_var, indent + 2)
+
+        if additional_properties is not True:
+            names = self._constant(frozenset(properties))
+            key_var = self._variable()
+            self._line(indent + 1, 'for {} in {}:'.format(key_var, var))
+            self._line(indent + 2, 'if {} not in {}:'.format(key_var, names))
+            if additional_properties is False:
+                self._line(indent + 3, 'return False')
+            else:
+                value_var = self._variable()
+                self._line(indent + 3, '{} = {}[{}]'.format(
+                    value_var, var, key_var))
+                self._add_schema(additional_properties, value_var, indent + 3)
+        self._line(indent + 1, 'pass')
@@ -1,13 +1,23 @@
+import codecs
 import csv
+import hashlib
+import itertools
 import json
+import multiprocessing
+import os
+import random
 import re
 import traceback
+from collections import OrderedDict
 
 import boto3
-from jsonschema import validate
 from jsonschema.exceptions import ValidationError
+from jsonschema.validators import validator_for
 
+import columnarValidator
 import csvvalidator
+import plannedValidator
+import schemaCompiler
 
 
 class VerifyFileSchemaException(Exception):
@@ -15,6 +25,34 @@ class VerifyFileSchemaException(Exception):
 
 
 s3 = boto3.resource('s3')
+# Bytes read from S3 at a time when streaming an object for validation.
+read_chunk_size = int(os.environ.get('READ_CHUNK_SIZE', str(1024 * 1024)))
+# Stop validating a csv file once this many problems have been found.
+max_problems = int(os.environ.get('MAX_PROBLEMS', '100'))
+# Max length of the problems reported in a validation failure message.
+max_message_length = 10240
+# Max number of prebuilt json schema validators kept by warm containers.
+schema_validator_cache_size = int(
+    os.environ.get('SCHEMA_VALIDATOR_CACHE_SIZE', '32'))
+# Prebuilt json schema validators, least recently used first.
+_schema_validators = OrderedDict()
+# Memory Lambda allocates per vCPU. A function's vCPUs are in proportion
+# to its memory, up to 6 at 10240 MB, whatever the host's cpu count.
+memory_mb_per_vcpu = 1769
+function_memory_mb = int(
+    os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', '128'))
+# Number of processes used to validate a file in shards. 0 for one per
+# vCPU of the function's memory.
+validation_processes = int(os.environ.get('VALIDATION_PROCESSES', '0')) \
+    or max(int(round(function_memory_mb / memory_mb_per_vcpu)), 1)
+# Files smaller than this are never validated in shards.
+sharded_validation_min_bytes = int(os.environ.get(
+    'SHARDED_VALIDATION_MIN_BYTES', str(64 * 1024 * 1024)))
+# The start of a json document in a file.
+json_document_start = re.compile(r'[{\[]')
+# The most characters of a cut short json token, other than a string, that
+# a decode error can be reported before, as in '-Infinit'.
+max_partial_token_length = len('-Infinity')
 
 
 def lambda_handler(event, context):
@@ -39,7 +77,26 @@ def lambda_handler(event, context):
         raise VerifyFileSchemaException(e)
 
 
-def _verify_file_schema(event, context):
+def verify_content_schema(event, byte_chunks):
+    '''
+    verify_content_schema Verifies the schema of the new file, as
+    verify_file_schema does, but from content the caller is already
+    reading, so one read of the object can serve several stages. Only as
+    much of the content as validation needs is consumed, and a file is
+    never validated in shards.
+
+    :param event: The event passed to the staging step function
+    :type event: Python Dict
+    :param byte_chunks: The content of the file, as consecutive bytes
+    :type byte_chunks: Python Iterator
+    :return: The event object passed into the method
+    :rtype: Python Dict
+    :raises VerifyFileSchemaException: When the file schema is incorrect
+    '''
+    return _verify_file_schema(event, None, byte_chunks)
+
+
+def _verify_file_schema(event, context, byte_chunks=None):
     '''
     verify_file_schema Verifies the schema of the new file if schema
     and format information has been added to the data source config.
@@ -48,6 +105,8 @@ def _verify_file_schema(event, context):
     :type event: Python type - Dict / list / int / string / float / None
     :param context: AWS Lambda uses this to pass in runtime information.
     :type context: LambdaContext
+    :param byte_chunks: The file's content, if already being read
+    :type byte_chunks: Python Iterator, optional
     :return: The event object passed into the method
     :rtype: Python type - Dict / list / int / string / float / None
     :raises VerifyFileSchemaException: When insufficient config information
@@ -59,13 +118,60 @@ def _verify_file_schema(event, context):
 
     if 'schema' in event and event['schema'] is not None:
         if 'fileFormat' in file_settings:
-            file_content = _load_object_content(bucket, key)
+            policy = _get_validation_policy(file_settings)
+            # Csv records are read to the end of the line containing the
+            # maxBytes'th byte. Json documents may span lines, so are
+            # limited to maxBytes as they are decoded.
+            line_max_bytes = policy['maxBytes']
             if file_settings['fileFormat'] == 'json':
-                _verify_json_schema(file_content, event['schema'])
+                line_max_bytes = None
+
+            if byte_chunks is not None:
+                if line_max_bytes is not None:
+                    byte_chunks = _iterate_line_range(
+                        byte_chunks, 0, 0, line_max_bytes)
+                text_chunks = _decode_chunks(byte_chunks)
+            elif _is_sharded(event['fileDetails'], file_settings, policy):
+                _verify_schema_in_shards(
+                    event['fileDetails'],
+                    file_settings,
+                    event['schema'],
+                    file_type,
+                    policy)
+                return event
+            else:
+                text_chunks = _iterate_object_text(
+                    bucket, key, line_max_bytes)
+
+            if file_settings['fileFormat'] == 'json':
+                compile_schema = 'compileSchema' in file_settings \
+                    and file_settings['compileSchema'] == 'True'
+                _verify_json_schema(
+                    text_chunks,
+                    event['schema'],
+                    file_type,
+                    compile_schema,
+                    sample_stride=policy['sampleStride'],
+                    sample_rate=policy['sampleRate'],
+                    max_length=policy['maxBytes'])
             elif file_settings['fileFormat'] == 'csv':
-                _verify_csv_schema(file_content, ',', event['schema'])
+                _verify_csv_schema(
+                    text_chunks,
+                    ',',
+                    event['schema'],
+                    problem_limit=policy['problemLimit'],
+                    columnar=_is_columnar(file_settings),
+                    sample_stride=policy['sampleStride'],
+                    sample_rate=policy['sampleRate'])
             elif file_settings['fileFormat'] == 'tsv':
-                _verify_csv_schema(file_content, '\t', event['schema'])
+                _verify_csv_schema(
+                    text_chunks,
+                    '\t',
+                    event['schema'],
+                    problem_limit=policy['problemLimit'],
+                    columnar=_is_columnar(file_settings),
+                    sample_stride=policy['sampleStride'],
+                    sample_rate=policy['sampleRate'])
             else:
                 raise VerifyFileSchemaException(
                     "Filetype: {} has a defined schema but no "
@@ -80,52 +186,317 @@ def _verify_file_schema(event, context):
     return event
 
 
-def _verify_json_schema(file_content, schema):
+def _get_validation_policy(file_settings):
     '''
-    _verify_json_schema Verifies the schema of json data. The while loop
-    is present to allow json documents batched into the same file by firehose
-    to be processed and verified.
-
-    :param file_content: The content of the file
-    :type file_content: Python String
+    _get_validation_policy Reads how thoroughly the filetype's files
+    are validated from its file settings, so trusted high volume feeds
+    can be validated in less time:
+    validationFailFast - 'True' to stop at the first problem
+    validationMaxProblems - stop once this many problems have been found
+    validationSampleStride - only validate every nth record
+    validationSampleRate - only validate this random fraction of records
+    validationMaxMegabytes - only validate the records starting in the
+    first N MB of the file
+
+    :param file_settings: The filetype's file settings
+    :type file_settings: Python Dict
+    :raises VerifyFileSchemaException: When a setting is out of range
+    :return: problemLimit, sampleStride, sampleRate and maxBytes
+    :rtype: Python Dict
+    '''
+    policy = {
+        'problemLimit': max_problems,
+        'sampleStride': 1,
+        'sampleRate': None,
+        'maxBytes': None
+    }
+
+    if 'validationFailFast' in file_settings \
+            and file_settings['validationFailFast'] == 'True':
+        policy['problemLimit'] = 1
+    elif 'validationMaxProblems' in file_settings:
+        policy['problemLimit'] = int(file_settings['validationMaxProblems'])
+
+    if 'validationSampleStride' in file_settings:
+        policy['sampleStride'] = int(file_settings['validationSampleStride'])
+
+    if 'validationSampleRate' in file_settings:
+        policy['sampleRate'] = float(file_settings['validationSampleRate'])
+
+    if 'validationMaxMegabytes' in file_settings:
+        policy['maxBytes'] = int(
+            float(file_settings['validationMaxMegabytes']) * 1024 * 1024)
+
+    if policy['problemLimit'] < 1 \
+            or policy['sampleStride'] < 1 \
+            or (policy['sampleRate'] is not None
+                and not 0 < policy['sampleRate'] <= 1) \
+            or (policy['maxBytes'] is not None and policy['maxBytes'] < 1):
+        raise VerifyFileSchemaException(
+            "Invalid validation settings: {}".format(policy))
+
+    return policy
+
+
+def _verify_json_schema(text_chunks, schema, file_type,
+                        compile_schema=False, sample_stride=1,
+                        sample_rate=None, max_length=None):
+    '''
+    _verify_json_schema Verifies the schema of json data. Each json
+    document is validated as soon as it has been read, to allow json
+    documents batched into the same file by firehose to be processed and
+    verified without holding the whole file in memory. Every document is
+    still decoded when only a sample of them is validated.
+
+    :param text_chunks: The content of the file, as consecutive strings
+    :type text_chunks: Python Iterable
     :param schema: The jsonschema we are expecting
     :type schema: Python String
+    :param file_type: The name of the filetype
+    :type file_type: Python String
+    :param compile_schema: Generate Python code for the schema's checks
+    :type compile_schema: Python Boolean
+    :param sample_stride: Only validate every nth document
+    :type sample_stride: Python Integer
+    :param sample_rate: Only validate this random fraction of documents
+    :type sample_rate: Python Float
+    :param max_length: Only validate the documents starting in the first
+        max_length characters
+    :type max_length: Python Integer, optional
     :raises Exception: When file_content schema is incorrect
     '''
+    validator = _get_schema_validator(schema, file_type, compile_schema)
+    json_objects = _iterate_json_documents(text_chunks, max_length)
+    if sample_stride > 1:
+        json_objects = itertools.islice(json_objects, 0, None, sample_stride)
+    if sample_rate is not None:
+        json_objects = (
+            json_object for json_object in json_objects
+            if random.random() < sample_rate)
+
+    for json_object in json_objects:
+        try:
+            validator.validate(json_object)
+        except ValidationError as ve:
+            raise VerifyFileSchemaException(ve.message[:max_message_length])
+
+
+def _get_schema_validator(schema, file_type, compile_schema=False):
+    '''
+    _get_schema_validator Returns a validator for the jsonschema. The
+    schema is only checked against its meta-schema when the validator is
+    built, and the validator is reused for every document and by later
+    invocations of a warm container until the filetype's schema changes.
+    If compile_schema is set, the schema's checks are compiled to Python.
+
+    :param schema: The jsonschema we are expecting
+    :type schema: Python String
+    :param file_type: The name of the filetype
+    :type file_type: Python String
+    :param compile_schema: Generate Python code for the schema's checks
+    :type compile_schema: Python Boolean
+    :raises SchemaError: When the schema itself is invalid
+    :return: The validator for the schema
+    :rtype: jsonschema IValidator
+    '''
+    # DynamoDB returns numbers as Decimals, which json can't serialize.
+    schema_json = json.dumps(schema, sort_keys=True, default=str)
+    cache_key = (
+        file_type,
+        hashlib.sha256(schema_json.encode('utf-8')).hexdigest(),
+        compile_schema)
+
+    validator = _schema_validators.get(cache_key)
+    if validator is not None:
+        _schema_validators.move_to_end(cache_key)
+        return validator
+
+    validator_class = validator_for(schema)
+    validator_class.check_schema(schema)
+    validator = validator_class(schema)
+    if compile_schema:
+        validator = schemaCompiler.compile_validator(validator)
+
+    _schema_validators[cache_key] = validator
+    while len(_schema_validators) > schema_validator_cache_size:
+        _schema_validators.popitem(last=False)
+
+    return validator
+
+
+def _iterate_json_documents(text_chunks, max_length=None):
+    '''
+    _iterate_json_documents Decodes the json documents in the text as
+    it arrives. Only the unread remainder of the text is kept in the
+    buffer. A document that has not fully arrived is not decoded again
+    until the buffer has doubled in size, so large documents that span
+    many chunks are still decoded in linear time.
+    If max_length is given, decoding stops at the first document starting
+    after the first max_length characters, so a document that spans that
+    position, over however many lines, is still decoded whole.
+
+    :param text_chunks: The content of the file, as consecutive strings
+    :type text_chunks: Python Iterable
+    :param max_length: Only decode the documents starting in the first
+        max_length characters
+    :type max_length: Python Integer, optional
+    :raises ValueError: When the file contains invalid json
+    :return: Iterator over the json documents in the text
+    :rtype: Python Generator
+    '''
     decoder = json.JSONDecoder()
-    start_position = 0
-    while True:
-        match = re.search('[{\[]', file_content[start_position:])
-        if not match:
-            break
-        start_position = match.start() + start_position
+    buffer = ''
+    unread_chunks = []
+    unread_length = 0
+    required_length = 0
+    # The length of the text before the buffer.
+    buffer_position = 0
+
+    # None marks the end of the text.
+    for chunk in itertools.chain(text_chunks, [None]):
+        is_last_chunk = chunk is None
+        if not is_last_chunk:
+            unread_chunks.append(chunk)
+            unread_length = unread_length + len(chunk)
+            if len(buffer) + unread_length < required_length:
+                continue
+
+        buffer = buffer + ''.join(unread_chunks)
+        unread_chunks = []
+        unread_length = 0
+        required_length = 0
+
+        position = 0
+        while True:
+            match = json_document_start.search(buffer, position)
+            if not match:
+                position = len(buffer)
+                break
+            position = match.start()
+            if max_length is not None \
+                    and buffer_position + position >= max_length:
+                return
+
+            try:
+                json_object, position_after = decoder.raw_decode(
+                    buffer, position)
+            except ValueError as e:
+                # Either invalid, or the rest hasn't been read yet.
+                if is_last_chunk or not _is_cut_short_json(buffer, e):
+                    raise
+                required_length = 2 * (len(buffer) - position)
+                break
+
+            yield json_object
+            position = position_after
+
+        buffer = buffer[position:]
+        buffer_position = buffer_position + position
+
+
+def _is_cut_short_json(buffer, decode_error):
+    '''
+    _is_cut_short_json Checks whether a json decode error could be
+    caused by the buffer ending before the document does, rather than by
+    invalid json. If the rest of the text can't fix the error, it is
+    raised without reading any more of the file.
+
+    :param buffer: The text that failed to decode
+    :type buffer: Python String
+    :param decode_error: The error raised decoding it
+    :type decode_error: json JSONDecodeError
+    :return: True if more text might complete the document
+    :rtype: Python Boolean
+    '''
+    if not isinstance(decode_error, json.JSONDecodeError):
+        return True
+    # Only a string that is still open is reported from where it started.
+    return decode_error.msg.startswith('Unterminated string') \
+        or len(buffer) - decode_error.pos <= max_partial_token_length
 
-        json_object, end_position = decoder.raw_decode(
-            file_content[start_position:])
 
-        try:
-            validate(json_object, schema)
-        except ValidationError as ve:
-            raise VerifyFileSchemaException(ve.message[:10240])
+def _is_columnar(file_settings):
+    '''
+    _is_columnar Checks whether the filetype's csv/tsv files should be
+    validated a column at a time rather than a row at a time.
 
-        start_position = start_position + end_position
+    :param file_settings: The filetype's file settings
+    :type file_settings: Python Dict
+    :return: True if the columnar validation engine is configured
+    :rtype: Python Boolean
+    '''
+    return 'csvValidationEngine' in file_settings \
+        and file_settings['csvValidationEngine'] == 'columnar'
 
 
-def _verify_csv_schema(file_content, separator, schema):
+def _verify_csv_schema(text_chunks, separator, schema,
+                       problem_limit=None, columnar=False, sample_stride=1,
+                       sample_rate=None):
     '''
     _verify_csv_schema Verifies the schema of csv data. Only required
-    column names are confirmed
+    column names are confirmed. Rows are validated as they are read, and
+    reading stops once problem_limit problems have been found.
+    The columnar engine reads blocks of rows and checks whole columns at
+    once, reporting problems in the same format.
 
-    :param file_content: The content of the file
-    :type file_content: Python String
+    :param text_chunks: The content of the file, as consecutive strings
+    :type text_chunks: Python Iterable
     :param separator: The delimeter character used in the file
     :type separator: Python Character
     :param schema: The csv schema we are expecting
     :type schema: Python String
+    :param problem_limit: Max problems to find, defaults to max_problems
+    :param problem_limit: Python Integer, optional
+    :param columnar: Use the columnar validation engine
+    :type columnar: Python Boolean
+    :param sample_stride: Only validate every nth record
+    :type sample_stride: Python Integer
+    :param sample_rate: Only validate this random fraction of records
+    :type sample_rate: Python Float
     :raises Exception: When file_content schema is incorrect
     '''
-    file_content_lines = file_content.splitlines()
-    csv_reader = csv.reader(file_content_lines, delimiter=separator)
+    problems = _find_csv_problems(
+        text_chunks, separator, schema, problem_limit, columnar,
+        sample_stride=sample_stride, sample_rate=sample_rate)
+
+    if len(problems) > 0:
+        raise VerifyFileSchemaException(str(problems)[:max_message_length])
+
+
+def _find_csv_problems(text_chunks, separator, schema,
+                       problem_limit=None, columnar=False,
+                       expect_header_row=True, record_counter=None,
+                       sample_stride=1, sample_rate=None):
+    '''
+    _find_csv_problems Validates csv data, returning the problems found.
+
+    :param text_chunks: The content of the file, as consecutive strings
+    :type text_chunks: Python Iterable
+    :param separator: The delimeter character used in the file
+    :type separator: Python Character
+    :param schema: The csv schema we are expecting
+    :type schema: Python String
+    :param problem_limit: Max problems to find, defaults to max_problems
+    :param problem_limit: Python Integer, optional
+    :param columnar: Use the columnar validation engine
+    :type columnar: Python Boolean
+    :param expect_header_row: The data starts with a header row
+    :type expect_header_row: Python Boolean
+    :param record_counter: If supplied, counts the records read
+    :type record_counter: itertools.count
+    :param sample_stride: Only validate every nth record
+    :type sample_stride: Python Integer
+    :param sample_rate: Only validate this random fraction of records
+    :type sample_rate: Python Float
+    :return: The problems found
+    :rtype: Python List
+    '''
+    if problem_limit is None:
+        problem_limit = max_problems
+
+    csv_reader = csv.reader(_iterate_lines(text_chunks), delimiter=separator)
+    if record_counter is not None:
+        csv_reader = _count_records(csv_reader, record_counter)
 
     field_names = []
     schema_properties = schema['properties']
@@ -134,37 +505,480 @@ def _verify_csv_schema(file_content, separator, schema):
 
     # field_names = tuple(schema['properties'])
 
-    validator = csvvalidator.CSVValidator(tuple(field_names))
+    if columnar:
+        validator = _get_columnar_csv_validator(
+            field_names, schema_properties, sample_stride, sample_rate)
+    else:
+        validator = _get_csv_validator(
+            field_names, schema_properties, sample_stride, sample_rate)
+
+    problems = list(itertools.islice(
+        validator.ivalidate(csv_reader, expect_header_row=expect_header_row),
+        problem_limit))
+
+    return problems
+
+
+def _count_records(records, record_counter):
+    '''
+    _count_records Passes on the records, counting each one.
+
+    :param records: The records
+    :type records: Python Iterable
+    :param record_counter: Counts the records read
+    :type record_counter: itertools.count
+    :return: Iterator over the records
+    :rtype: Python Generator
+    '''
+    for record in records:
+        next(record_counter)
+        yield record
+
+
+def _get_csv_validator(field_names, schema_properties, sample_stride=1,
+                       sample_rate=None):
+    '''
+    _get_csv_validator Creates a validator checking each row in turn.
+
+    :param field_names: The expected column names
+    :type field_names: Python List
+    :param schema_properties: The csv schema's properties
+    :type schema_properties: Python List
+    :param sample_stride: Only validate every nth record
+    :type sample_stride: Python Integer
+    :param sample_rate: Only validate this random fraction of records
+    :type sample_rate: Python Float
+    :return: The validator
+    :rtype: plannedValidator.PlannedCSVValidator
+    '''
+    validator = plannedValidator.PlannedCSVValidator(tuple(field_names))
     validator.add_header_check('EX1', 'bad header')
+    if sample_rate is not None:
+        validator.add_skip(lambda r: random.random() >= sample_rate)
 
     for prop in schema_properties:
         prop_field = prop['field']
         prop_type = prop['type']
         if prop_type == 'int':
-            validator.add_value_check(prop_field, int, 'EX_INT', prop_field + ' must be an integer')
+            validator.add_value_check(prop_field, int, 'EX_INT', prop_field + ' must be an integer', sample_stride)
         elif prop_type == 'string':
-            validator.add_value_check(prop_field, str, 'EX_STR', prop_field + ' must be a string')
+            validator.add_value_check(prop_field, str, 'EX_STR', prop_field + ' must be a string', sample_stride)
         elif prop_type == 'enum':
             enum_values = tuple(prop['values'])
-            validator.add_value_check(prop_field, csvvalidator.enumeration(enum_values), 'EX_ENUM', prop_field + ' must have value from enum')
+            validator.add_value_check(prop_field, csvvalidator.enumeration(enum_values), 'EX_ENUM', prop_field + ' must have value from enum', sample_stride)
 
-    problems = validator.validate(csv_reader)
+    return validator
 
-    if len(problems) > 0:
-        raise VerifyFileSchemaException(str(problems))
+
+def _get_columnar_csv_validator(field_names, schema_properties,
+                                sample_stride=1, sample_rate=None):
+    '''
+    _get_columnar_csv_validator Creates a validator checking a column
+    of a block of rows at a time. String columns need no check, as every
+    csv value is a string.
+
+    :param field_names: The expected column names
+    :type field_names: Python List
+    :param schema_properties: The csv schema's properties
+    :type schema_properties: Python List
+    :param sample_stride: Only validate every nth record
+    :type sample_stride: Python Integer
+    :param sample_rate: Only validate this random fraction of records
+    :type sample_rate: Python Float
+    :return: The validator
+    :rtype: columnarValidator.ColumnarCSVValidator
+    '''
+    validator = columnarValidator.ColumnarCSVValidator(tuple(field_names))
+    validator.add_header_check('EX1', 'bad header')
+    validator.set_sample_rate(sample_rate)
+
+    for prop in schema_properties:
+        prop_field = prop['field']
+        prop_type = prop['type']
+        if prop_type == 'int':
+            validator.add_column_check(prop_field, columnarValidator.integer_column(), 'EX_INT', prop_field + ' must be an integer', sample_stride)
+        elif prop_type == 'enum':
+            enum_values = tuple(prop['values'])
+            validator.add_column_check(prop_field, columnarValidator.enumeration_column(enum_values), 'EX_ENUM', prop_field + ' must have value from enum', sample_stride)
+
+    return validator
+
+
+def _iterate_lines(text_chunks):
+    '''
+    _iterate_lines Splits the text into lines as it arrives, keeping
+    the line endings so the csv reader can handle quoted line breaks.
+
+    :param text_chunks: The content of the file, as consecutive strings
+    :type text_chunks: Python Iterable
+    :return: Iterator over the lines in the text
+    :rtype: Python Generator
+    '''
+    partial_line = ''
+    for chunk in text_chunks:
+        lines = (partial_line + chunk).splitlines(True)
+        partial_line = ''
+        # The last line may continue in the next chunk. Keep a trailing
+        # carriage return too, in case its line feed is in the next chunk.
+        if lines and (not lines[-1].endswith(('\n', '\r'))
+                      or lines[-1].endswith('\r')):
+            partial_line = lines.pop()
+        for line in lines:
+            yield line
+    if partial_line:
+        yield partial_line
+
+
+def _iterate_object_text(bucket, key, max_bytes=None):
+    '''
+    _iterate_object_text Streams the given object (identified by
+    bucket and key) from S3, decoding it read_chunk_size bytes at a time.
+    If max_bytes is given, reading stops at the end of the line that
+    contains the max_bytes'th byte, so no csv record is cut short. Json
+    documents may span lines, so json is read without max_bytes and
+    limited as it is decoded.
+
+    :param bucket:  The S3 bucket name
+    :type bucket: Python String
+    :param key: The S3 object key
+    :type key: Python String
+    :param max_bytes: Only read the lines starting in the first max_bytes
+    :param max_bytes: Python Integer, optional
+    :return: Iterator over the decoded contents of the S3 object
+    :rtype: Python Generator
+    '''
+    if max_bytes is not None:
+        for text in _iterate_shard_text(bucket, key, 0, max_bytes):
+            yield text
+        return
+
+    s3_object = s3.Object(bucket, key)
+    body = s3_object.get()["Body"]
+    try:
+        for text in _decode_chunks(_iterate_body_chunks(body)):
+            yield text
+    finally:
+        body.close()
+
+
+def _iterate_body_chunks(body):
+    '''
+    _iterate_body_chunks Reads a streaming S3 object body
+    read_chunk_size bytes at a time.
+
+    :param body: The body of an S3 GetObject response
+    :type body: botocore StreamingBody
+    :return: Iterator over the bytes of the body
+    :rtype: Python Generator
+    '''
+    while True:
+        chunk = body.read(read_chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def _decode_chunks(byte_chunks):
+    '''
+    _decode_chunks Decodes utf-8 content as it arrives. Handles
+    multi-byte characters split across chunks.
+
+    :param byte_chunks: The content, as consecutive bytes
+    :type byte_chunks: Python Iterable
+    :return: Iterator over the decoded content
+    :rtype: Python Generator
+    '''
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for chunk in byte_chunks:
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+
+def _is_sharded(file_details, file_settings, policy):
+    '''
+    _is_sharded Checks whether the file should be validated in shards,
+    in parallel processes. This must be enabled for the filetype, and the
+    part of the file to validate must be large enough to be worth it.
+
+    :param file_details: The fileDetails from the input event
+    :type file_details: Python Dict
+    :param file_settings: The filetype's file settings
+    :type file_settings: Python Dict
+    :param policy: The filetype's validation policy
+    :type policy: Python Dict
+    :return: True if the file should be validated in shards
+    :rtype: Python Boolean
+    '''
+    return 'shardedValidation' in file_settings \
+        and file_settings['shardedValidation'] == 'True' \
+        and validation_processes > 1 \
+        and _get_validated_length(file_details, policy) \
+        >= sharded_validation_min_bytes
+
+
+def _get_validated_length(file_details, policy):
+    '''
+    _get_validated_length Returns the number of bytes of the file in
+    which validated records start.
+
+    :param file_details: The fileDetails from the input event
+    :type file_details: Python Dict
+    :param policy: The filetype's validation policy
+    :type policy: Python Dict
+    :return: The length of the file to validate
+    :rtype: Python Integer
+    '''
+    content_length = int(file_details.get('contentLength', 0))
+    if policy['maxBytes'] is not None:
+        return min(content_length, policy['maxBytes'])
+    return content_length
+
+
+def _verify_schema_in_shards(file_details, file_settings, schema, file_type,
+                             policy):
+    '''
+    _verify_schema_in_shards Splits the file into byte ranges aligned to
+    line breaks and validates each in its own process, reading it with a
+    ranged GET. The file's records must not contain line breaks, so json
+    files must be newline delimited and csv values must not contain
+    quoted line breaks.
+    Processes and pipes are used directly, as lambda doesn't support the
+    shared memory needed by multiprocessing pools and queues.
+
+    :param file_details: The fileDetails from the input event
+    :type file_details: Python Dict
+    :param file_settings: The filetype's file settings
+    :type file_settings: Python Dict
+    :param schema: The schema we are expecting
+    :type schema: Python Dict
+    :param file_type: The name of the filetype
+    :type file_type: Python String
+    :param policy: The filetype's validation policy
+    :type policy: Python Dict
+    :raises VerifyFileSchemaException: When the file schema is incorrect
+    '''
+    content_length = _get_validated_length(file_details, policy)
+    shard_size = -(-content_length // validation_processes)
+    shard_ranges = [
+        (start, min(start + shard_size, content_length))
+        for start in range(0, content_length, shard_size)]
+
+    print('Validating {} bytes in {} shards'.format(
+        content_length, len(shard_ranges)))
+
+    connections = []
+    processes = []
+    for start, end in shard_ranges:
+        receive_connection, send_connection = multiprocessing.Pipe(False)
+        process = multiprocessing.Process(
+            target=_validate_shard,
+            args=(send_connection, file_details['bucket'],
+                  file_details['key'], start, end, file_settings, schema,
+                  file_type, policy))
+        process.start()
+        # Only the child holds the send end, so a crash is seen as EOF.
+        send_connection.close()
+        connections.append(receive_connection)
+        processes.append(process)
+
+    try:
+        results = [connection.recv() for connection in connections]
+    except EOFError:
+        raise VerifyFileSchemaException(
+            'A schema validation process exited unexpectedly')
+    finally:
+        for process in processes:
+            process.join()
+
+    for result in results:
+        if 'exception' in result:
+            raise VerifyFileSchemaException(result['exception'])
+
+    if file_settings['fileFormat'] == 'json':
+        for result in results:
+            if 'error' in result:
+                raise VerifyFileSchemaException(result['error'])
+    else:
+        problems = _merge_shard_problems(results, policy['problemLimit'])
+        if len(problems) > 0:
+            raise VerifyFileSchemaException(
+                str(problems)[:max_message_length])
 
 
-def _load_object_content(bucket, key):
+def _merge_shard_problems(results, problem_limit):
     '''
-    load_object_content Loads the given object (identified by
-    bucket and key) from S3
+    _merge_shard_problems Merges the problems found in each shard into
+    one list in row order, renumbering each shard's rows to follow on
+    from the records in the shards before it.
+    A shard only stops before its end once it has found problem_limit
+    problems, so every shard before it has been fully counted.
+
+    :param results: The records read and problems found in each shard
+    :type results: Python List
+    :param problem_limit: Max problems to return
+    :type problem_limit: Python Integer
+    :return: The problems found
+    :rtype: Python List
+    '''
+    problems = []
+    records_before = 0
+    for result in results:
+        for problem in result['problems']:
+            if 'row' in problem:
+                problem['row'] = problem['row'] + records_before
+            problems.append(problem)
+        if len(problems) >= problem_limit:
+            break
+        records_before = records_before + result['records']
+
+    return problems[:problem_limit]
 
+
+def _validate_shard(connection, bucket, key, start, end, file_settings,
+                    schema, file_type, policy):
+    '''
+    _validate_shard Validates the records starting between the start and
+    end byte positions, in a child process, and sends the outcome back.
+    Csv shards send the records read and the problems found, json shards
+    send the first validation error if there is one.
+
+    :param connection: The pipe connection to send the outcome on
+    :type connection: multiprocessing Connection
     :param bucket:  The S3 bucket name
     :type bucket: Python String
     :param key: The S3 object key
     :type key: Python String
-    :return: Contents of S3 object as a string
-    :rtype: Python String
+    :param start: The first byte position of the shard
+    :type start: Python Integer
+    :param end: The byte position after the shard
+    :type end: Python Integer
+    :param file_settings: The filetype's file settings
+    :type file_settings: Python Dict
+    :param schema: The schema we are expecting
+    :type schema: Python Dict
+    :param file_type: The name of the filetype
+    :type file_type: Python String
+    :param policy: The filetype's validation policy
+    :type policy: Python Dict
     '''
+    global s3
+    result = {}
+    try:
+        # Don't share the parent's connection pool with the parent.
+        s3 = boto3.resource('s3')
+        # Sample different records to the other shards. A sample stride
+        # starts again at each shard's first record.
+        random.seed()
+        text_chunks = _iterate_shard_text(bucket, key, start, end)
+        if file_settings['fileFormat'] == 'json':
+            compile_schema = 'compileSchema' in file_settings \
+                and file_settings['compileSchema'] == 'True'
+            try:
+                _verify_json_schema(
+                    text_chunks, schema, file_type, compile_schema,
+                    sample_stride=policy['sampleStride'],
+                    sample_rate=policy['sampleRate'])
+            except VerifyFileSchemaException as e:
+                result['error'] = str(e)
+        else:
+            separator = '\t' if file_settings['fileFormat'] == 'tsv' else ','
+            record_counter = itertools.count()
+            result['problems'] = _find_csv_problems(
+                text_chunks,
+                separator,
+                schema,
+                problem_limit=policy['problemLimit'],
+                columnar=_is_columnar(file_settings),
+                expect_header_row=start == 0,
+                record_counter=record_counter,
+                sample_stride=policy['sampleStride'],
+                sample_rate=policy['sampleRate'])
+            result['records'] = next(record_counter)
+    except Exception as e:
+        traceback.print_exc()
+        result = {'exception': '{}: {}'.format(type(e).__name__, e)}
+
+    connection.send(result)
+    connection.close()
+
+
+def _iterate_shard_text(bucket, key, start, end):
+    '''
+    _iterate_shard_text Streams the lines of the object that start
+    between the start and end byte positions, using a ranged GET.
+    A line starting before the end position is read to its end, and a
+    line that started before the start position is skipped, as it belongs
+    to the previous shard.
+
+    :param bucket:  The S3 bucket name
+    :type bucket: Python String
+    :param key: The S3 object key
+    :type key: Python String
+    :param start: The first byte position of the shard
+    :type start: Python Integer
+    :param end: The byte position after the shard
+    :type end: Python Integer
+    :return: Iterator over the decoded contents of the shard
+    :rtype: Python Generator
+    '''
+    # Read from the byte before the start, to see if a line starts there.
+    position = start - 1 if start > 0 else 0
     s3_object = s3.Object(bucket, key)
-    return s3_object.get()["Body"].read().decode('utf-8')
+    body = s3_object.get(Range='bytes={}-'.format(position))["Body"]
+    # The range runs to the end of the object, as the shard's last line
+    # may end anywhere after it, so the body is closed as soon as the
+    # shard has been read, or its reader stops early, rather than left
+    # streaming the rest of the object.
+    try:
+        # Line breaks are always character boundaries in utf-8.
+        byte_chunks = _iterate_line_range(
+            _iterate_body_chunks(body), position, start, end)
+        for text in _decode_chunks(byte_chunks):
+            yield text
+    finally:
+        body.close()
+
+
+def _iterate_line_range(byte_chunks, position, start, end):
+    '''
+    _iterate_line_range Passes on the bytes of the lines that start
+    between the start and end byte positions. A line starting before the
+    end position is passed on to its end, and a line that started before
+    the start position is skipped. To tell whether a line starts at the
+    start position, the content must begin before it.
+
+    :param byte_chunks: The content, as consecutive bytes
+    :type byte_chunks: Python Iterable
+    :param position: The byte position of the start of the content
+    :type position: Python Integer
+    :param start: The first byte position of the range
+    :type start: Python Integer
+    :param end: The byte position after the range
+    :type end: Python Integer
+    :return: Iterator over the bytes of the lines in the range
+    :rtype: Python Generator
+    '''
+    in_previous_range = start > 0
+
+    for chunk in byte_chunks:
+        chunk_position = position
+        position = position + len(chunk)
+
+        if in_previous_range:
+            line_break = chunk.find(b'\n')
+            if line_break == -1:
+                continue
+            in_previous_range = False
+            chunk = chunk[line_break + 1:]
+            chunk_position = chunk_position + line_break + 1
+            if chunk_position >= end:
+                # The first line starting in this range is after its end.
+                break
+
+        # The line break ending the line that contains the range's last byte.
+        search_from = max(end - 1 - chunk_position, 0)
+        line_break = chunk.find(b'\n', search_from)
+        if line_break != -1:
+            yield chunk[:line_break + 1]
+            break
+        yield chunk
@@ -0,0 +1,149 @@
+import os
+import sys
+import unittest
+
+from botocore.exceptions import ClientError
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import dataCatalogWriter  # noqa: E402
+
+
+def make_item(number):
+    return {'rawKey': 'raw/{}.csv'.format(number), 'catalogTime': number}
+
+
+class FakeDynamoDBClient(object):
+    def __init__(self, error_code=None, unprocessed_count=0):
+        self.error_code = error_code
+        self.unprocessed_count = unprocessed_count
+        self.requests = []
+
+    def batch_write_item(self, RequestItems):
+        self.requests.append(RequestItems)
+        if self.error_code is not None:
+            raise ClientError(
+                {'Error': {'Code': self.error_code, 'Message': 'error'}},
+                'BatchWriteItem')
+        unprocessed = {}
+        for table_name, requests in RequestItems.items():
+            if self.unprocessed_count > 0:
+                unprocessed[table_name] = requests[:self.unprocessed_count]
+        return {'UnprocessedItems': unprocessed}
+
+    def written_items(self):
+        return [request['PutRequest']['Item']
+                for request_items in self.requests
+                for requests in request_items.values()
+                for request in requests]
+
+
+class FakeDynamoDB(object):
+    def __init__(self, client):
+        self.meta = type('Meta', (object,), {'client': client})
+
+
+class DataCatalogWriterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.original = (dataCatalogWriter.dynamodb,
+                         dataCatalogWriter.max_attempts,
+                         dataCatalogWriter.retry_base_seconds)
+        dataCatalogWriter.max_attempts = 2
+        dataCatalogWriter.retry_base_seconds = 0
+        dataCatalogWriter._buffer.clear()
+        dataCatalogWriter._unwritten.clear()
+
+    def tearDown(self):
+        (dataCatalogWriter.dynamodb,
+         dataCatalogWriter.max_attempts,
+         dataCatalogWriter.retry_base_seconds) = self.original
+
+    def use_client(self, client):
+        dataCatalogWriter.dynamodb = FakeDynamoDB(client)
+        return client
+
+
+class TestWriteItem(DataCatalogWriterTestCase):
+
+    def test_unbuffered_write_is_sent_at_once(self):
+        client = self.use_client(FakeDynamoDBClient())
+        dataCatalogWriter.write_item('catalog', make_item(1))
+        self.assertEqual(client.written_items(), [make_item(1)])
+
+    def test_unbuffered_write_raises_if_rejected(self):
+        self.use_client(FakeDynamoDBClient(error_code='ValidationException'))
+        with self.assertRaises(
+                dataCatalogWriter.DataCatalogWriterException) as raised:
+            dataCatalogWriter.write_item('catalog', make_item(1))
+        self.assertEqual(
+            raised.exception.unwritten_items, [('catalog', make_item(1))])
+
+    def test_buffered_writes_are_sent_in_batches(self):
+        client = self.use_client(FakeDynamoDBClient())
+        with dataCatalogWriter.buffered():
+            for number in range(30):
+                dataCatalogWriter.write_item('catalog', make_item(number))
+            self.assertEqual(len(client.requests), 1)
+        self.assertEqual(
+            [len(request['catalog']) for request in client.requests], [25, 5])
+        self.assertEqual(
+            client.written_items(), [make_item(n) for n in range(30)])
+
+    def test_buffered_write_never_raises_for_a_rejected_batch(self):
+        client = self.use_client(
+            FakeDynamoDBClient(error_code='ValidationException'))
+        with self.assertRaises(
+                dataCatalogWriter.DataCatalogWriterException) as raised:
+            with dataCatalogWriter.buffered():
+                for number in range(30):
+                    dataCatalogWriter.write_item('catalog', make_item(number))
+                # The rejected batch isn't left buffered to be sent again.
+                self.assertEqual(len(dataCatalogWriter._buffer['catalog']), 5)
+        self.assertEqual(len(client.requests), 2)
+        self.assertEqual(
+            raised.exception.unwritten_items,
+            [('catalog', make_item(n)) for n in range(30)])
+        self.assertEqual(dataCatalogWriter._buffer, {})
+        self.assertEqual(dataCatalogWriter._unwritten, {})
+
+    def test_unprocessed_items_are_retried_then_reported(self):
+        client = self.use_client(FakeDynamoDBClient(unprocessed_count=1))
+        with self.assertRaises(
+                dataCatalogWriter.DataCatalogWriterException) as raised:
+            with dataCatalogWriter.buffered():
+                for number in range(3):
+                    dataCatalogWriter.write_item('catalog', make_item(number))
+        self.assertEqual(len(client.requests), 2)
+        self.assertEqual(
+            raised.exception.unwritten_items, [('catalog', make_item(0))])
+
+    def test_flush_writes_every_table_after_a_rejected_batch(self):
+        client = self.use_client(
+            FakeDynamoDBClient(error_code='ValidationException'))
+        with dataCatalogWriter.buffered():
+            dataCatalogWriter.write_item('catalog', make_item(1))
+            dataCatalogWriter.write_item('other', make_item(2))
+            with self.assertRaises(
+                    dataCatalogWriter.DataCatalogWriterException) as raised:
+                dataCatalogWriter.flush()
+        self.assertEqual(len(client.requests), 2)
+        self.assertEqual(
+            sorted(raised.exception.unwritten_items),
+            [('catalog', make_item(1)), ('other', make_item(2))])
+
+    def test_duplicate_keys_are_written_once(self):
+        client = self.use_client(FakeDynamoDBClient())
+        with dataCatalogWriter.buffered():
+            dataCatalogWriter.write_item('catalog', make_item(1))
+            dataCatalogWriter.write_item(
+                'catalog', dict(make_item(1), stagingKey='staging/1.csv'))
+        self.assertEqual(
+            client.written_items(),
+            [dict(make_item(1), stagingKey='staging/1.csv')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import os
+import sys
+import unittest
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import dataSourceCache  # noqa: E402
+
+
+def make_data_source(file_type, pattern):
+    return {
+        'fileType': file_type,
+        'fileSettings': {'fileNamePattern': pattern, 'fileFormat': 'csv'},
+        'schema': {'columns': ['id']}}
+
+
+class FakeDynamoDB(object):
+    '''
+    A data source table, scanned a page of one item at a time.
+    '''
+    def __init__(self, items):
+        self.items = {item['fileType']: item for item in items}
+        self.scans = []
+        self.get_items = []
+        self.meta = type('Meta', (object,), {'client': self})
+
+    def Table(self, table_name):
+        return self
+
+    def get_item(self, Key, ConsistentRead=False):
+        self.get_items.append(Key['fileType'])
+        item = self.items.get(Key['fileType'])
+        return {} if item is None else {'Item': dict(item)}
+
+    def scan(self, TableName, ProjectionExpression=None,
+             ExclusiveStartKey=None, Segment=0, TotalSegments=1):
+        self.scans.append(ProjectionExpression)
+        file_types = sorted(self.items)[Segment::TotalSegments]
+        if ExclusiveStartKey is not None:
+            file_types = file_types[
+                file_types.index(ExclusiveStartKey['fileType']) + 1:]
+        response = {'Items': [self.project(self.items[file_type])
+                              for file_type in file_types[:1]]}
+        if len(file_types) > 1:
+            response['LastEvaluatedKey'] = {'fileType': file_types[0]}
+        return response
+
+    def project(self, item):
+        # Supports the data source summary projection only.
+        projected = {'fileType': item['fileType']}
+        if 'fileSettings' in item:
+            projected['fileSettings'] = {
+                'fileNamePattern': item['fileSettings']['fileNamePattern']}
+        return projected
+
+
+class DataSourceCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.original = (dataSourceCache.dynamodb,
+                         dataSourceCache.cache_ttl_seconds)
+        dataSourceCache.invalidate()
+        self.dynamodb = dataSourceCache.dynamodb = FakeDynamoDB([
+            make_data_source('bookings', 'bookings/.*'),
+            make_data_source('drivers', 'drivers/.*'),
+            make_data_source('rides', 'rides/.*'),
+            {'fileType': dataSourceCache.DATA_SOURCE_VERSION_FILE_TYPE,
+             'version': 1}])
+
+    def tearDown(self):
+        (dataSourceCache.dynamodb,
+         dataSourceCache.cache_ttl_seconds) = self.original
+        dataSourceCache.invalidate()
+
+    def expire_cache(self):
+        for cache_entry in dataSourceCache._cache.values():
+            cache_entry['expiresAt'] = 0
+
+
+class TestDataSourceCache(DataSourceCacheTestCase):
+
+    def test_scan_loads_only_the_summary_of_every_page(self):
+        for total_segments in (1, 2):
+            dataSourceCache.invalidate()
+            dataSourceCache.scan_segments = total_segments
+            try:
+                data_sources = dataSourceCache.get_all_data_sources('sources')
+            finally:
+                dataSourceCache.scan_segments = 1
+            self.assertEqual(
+                sorted(data_source['fileType']
+                       for data_source in data_sources),
+                ['bookings', 'drivers', 'rides'])
+            self.assertEqual(data_sources[0]['fileSettings'].keys(),
+                             {'fileNamePattern'})
+        self.assertEqual(
+            set(self.dynamodb.scans),
+            {dataSourceCache.DATA_SOURCE_SUMMARY_PROJECTION})
+
+    def test_data_source_is_read_whole_once(self):
+        dataSourceCache.get_all_data_sources('sources')
+        data_source = dataSourceCache.get_data_source('sources', 'rides')
+        self.assertEqual(data_source, make_data_source('rides', 'rides/.*'))
+        data_source['schema'] = None
+        self.assertEqual(
+            dataSourceCache.get_data_source('sources', 'rides'),
+            make_data_source('rides', 'rides/.*'))
+        self.assertEqual(self.dynamodb.get_items.count('rides'), 1)
+
+    def test_unchanged_version_keeps_the_cache(self):
+        data_sources = dataSourceCache.get_all_data_sources('sources')
+        dataSourceCache.get_data_source('sources', 'rides')
+        scan_count = len(self.dynamodb.scans)
+        self.expire_cache()
+
+        self.assertIs(
+            dataSourceCache.get_all_data_sources('sources'), data_sources)
+        dataSourceCache.get_data_source('sources', 'rides')
+        self.assertEqual(len(self.dynamodb.scans), scan_count)
+        self.assertEqual(self.dynamodb.get_items.count('rides'), 1)
+
+    def test_changed_version_reloads_the_data_sources(self):
+        data_sources = dataSourceCache.get_all_data_sources('sources')
+        dataSourceCache.get_data_source('sources', 'rides')
+        self.dynamodb.items['rides'] = make_data_source('rides', 'trips/.*')
+        self.dynamodb.items[
+            dataSourceCache.DATA_SOURCE_VERSION_FILE_TYPE]['version'] = 2
+
+        # The version is only checked once the cache has expired.
+        self.assertIs(
+            dataSourceCache.get_all_data_sources('sources'), data_sources)
+        self.expire_cache()
+
+        reloaded = dataSourceCache.get_all_data_sources('sources')
+        self.assertIsNot(reloaded, data_sources)
+        self.assertIn(
+            {'fileType': 'rides', 'fileSettings': {
+                'fileNamePattern': 'trips/.*'}},
+            reloaded)
+        self.assertEqual(
+            dataSourceCache.get_data_source('sources', 'rides'),
+            make_data_source('rides', 'trips/.*'))
+        self.assertEqual(self.dynamodb.get_items.count('rides'), 2)
+
+    def test_cache_without_version_item_reloads_once_expired(self):
+        del self.dynamodb.items[dataSourceCache.DATA_SOURCE_VERSION_FILE_TYPE]
+        data_sources = dataSourceCache.get_all_data_sources('sources')
+        self.expire_cache()
+        self.assertIsNot(
+            dataSourceCache.get_all_data_sources('sources'), data_sources)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import metadataCalculators  # noqa: E402
+
+
+def count_rows(content, file_format, chunk_size):
+    calculators = metadataCalculators.get_metadata_calculators(
+        {'fileFormat': file_format, 'metadataCalculators': ['rowCount']})
+    for start in range(0, len(content), chunk_size):
+        for calculator in calculators:
+            calculator.update(content[start:start + chunk_size])
+    return metadataCalculators.get_calculated_metadata(calculators)
+
+
+class TestRowCount(unittest.TestCase):
+
+    def test_csv_rows_exclude_header(self):
+        content = b'id,name\n1,a\n2,b\n3,c'
+        for chunk_size in (1, 4, len(content)):
+            self.assertEqual(
+                count_rows(content, 'csv', chunk_size), {'row_count': '3'})
+
+    def test_json_counts_multi_line_documents(self):
+        documents = [
+            {'text': 'a "quoted" } string ]', 'list': [1, {'b': []}]},
+            ['ends with a backslash \\', {}],
+            {'escaped': '\\\\"{['}]
+        content = '\n'.join(
+            json.dumps(document, indent=4) for document in documents) \
+            .encode('utf-8')
+        for chunk_size in (1, 2, 3, 7, len(content)):
+            self.assertEqual(
+                count_rows(content, 'json', chunk_size), {'row_count': '3'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'src',
+    'verifyFileSchema'))
+
+import csvvalidator  # noqa: E402
+import plannedValidator  # noqa: E402
+
+
+FIELD_NAMES = ('id', 'name', 'colour')
+ROWS = [
+    ['id', 'name', 'colour'],
+    ['1', 'a', 'red'],
+    ['x', 'b', 'blue'],
+    ['3', 'c', 'green'],
+    ['4'],
+    ['5', 'e', 'red', 'extra'],
+    ['x', 'f', 'pink'],
+    ['1', 'g', 'red']]
+
+
+class RowChecks(object):
+    def each_count(self, r):
+        if r['name'] == 'f':
+            raise RuntimeError('each failed')
+
+    def check_name(self, r):
+        if r['name'] == 'c':
+            raise csvvalidator.RecordError('EX_NAME', 'bad name')
+
+    def assert_colour(self, r):
+        assert r['colour'] != 'blue', ('EX_BLUE', 'no blue')
+
+
+class PlannedRowChecksValidator(RowChecks, plannedValidator.PlannedCSVValidator):
+    pass
+
+
+class RowChecksValidator(RowChecks, csvvalidator.CSVValidator):
+    pass
+
+
+def add_checks(validator, unique_checks=True):
+    validator.add_header_check('EX1', 'bad header')
+    validator.add_record_length_check('EX_LEN', 'bad length')
+    validator.add_value_check('id', int, 'EX_INT', 'id must be an integer')
+    validator.add_value_check(
+        'colour', csvvalidator.enumeration('red', 'green', 'blue'),
+        'EX_ENUM', 'bad colour', 2)
+    validator.add_value_predicate(
+        'name', lambda value: value != 'b', 'EX_PRED', 'not b')
+    validator.add_record_predicate(
+        lambda r: r[0] != '3', 'EX_REC', 'not 3')
+    if unique_checks:
+        validator.add_unique_check('id', 'EX_UNIQUE', 'duplicate id')
+    return validator
+
+
+def problems(validator):
+    found = validator.validate(ROWS, context={'file': 'test.csv'})
+    for problem in found:
+        problem.pop('exception', None)
+        problem.pop('function', None)
+    return found
+
+
+class TestPlannedCSVValidator(unittest.TestCase):
+
+    def test_problems_match_csvvalidator(self):
+        expected = problems(add_checks(
+            RowChecksValidator(FIELD_NAMES), unique_checks=False))
+        found = problems(add_checks(
+            PlannedRowChecksValidator(FIELD_NAMES), unique_checks=False))
+        self.assertTrue(len(expected) > 5)
+        self.assertEqual(found, expected)
+
+    def test_unique_checks(self):
+        found = problems(add_checks(
+            plannedValidator.PlannedCSVValidator(FIELD_NAMES)))
+        self.assertEqual(
+            [(p['row'], p['value']) for p in found
+             if p['code'] == 'EX_UNIQUE'],
+            [(7, 'x'), (8, '1')])
+
+
+if __name__ == '__main__':
+    unittest.main()
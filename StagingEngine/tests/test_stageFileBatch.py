@@ -0,0 +1,128 @@
+import json
+import os
+import sys
+import unittest
+
+from botocore.exceptions import ClientError
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import dataCatalogWriter  # noqa: E402
+import stageFileBatch  # noqa: E402
+import stageFileExpress  # noqa: E402
+
+
+class FakeDynamoDBClient(object):
+    def __init__(self, error_code=None):
+        self.error_code = error_code
+        self.request_count = 0
+
+    def batch_write_item(self, RequestItems):
+        self.request_count = self.request_count + 1
+        if self.error_code is not None:
+            raise ClientError(
+                {'Error': {'Code': self.error_code, 'Message': 'error'}},
+                'BatchWriteItem')
+        return {'UnprocessedItems': {}}
+
+
+class FakeDynamoDB(object):
+    def __init__(self, client):
+        self.meta = type('Meta', (object,), {'client': client})
+
+
+class FakeSQS(object):
+    def __init__(self):
+        self.messages = []
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self.messages.extend(
+            json.loads(entry['MessageBody']) for entry in Entries)
+        return {'Successful': [{'Id': entry['Id']} for entry in Entries]}
+
+
+class FakeContext(object):
+    def __init__(self, remaining_millis):
+        self.remaining_millis = remaining_millis
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_millis
+
+
+def fake_stage_file_express(event, context):
+    # Stages the file, and records it in the data catalog as the
+    # recordSuccessfulStaging step would.
+    if event.get('fail'):
+        raise RuntimeError('Unexpected error')
+    dataCatalogWriter.write_item(
+        'catalog', {'rawKey': event['key'], 'catalogTime': 1})
+    return event
+
+
+def make_event(*staging_inputs):
+    return {'Records': [
+        {'messageId': 'message-{}'.format(index),
+         'body': json.dumps(staging_input)}
+        for index, staging_input in enumerate(staging_inputs)]}
+
+
+class TestStageFileBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.original = (dataCatalogWriter.dynamodb,
+                         stageFileExpress.stage_file_express,
+                         stageFileBatch.sqs)
+        dataCatalogWriter._buffer.clear()
+        dataCatalogWriter._unwritten.clear()
+        stageFileExpress.stage_file_express = fake_stage_file_express
+        self.sqs = stageFileBatch.sqs = FakeSQS()
+
+    def tearDown(self):
+        (dataCatalogWriter.dynamodb,
+         stageFileExpress.stage_file_express,
+         stageFileBatch.sqs) = self.original
+
+    def use_dynamodb(self, client):
+        dataCatalogWriter.dynamodb = FakeDynamoDB(client)
+        return client
+
+    def test_catalog_items_are_written_in_one_batch(self):
+        client = self.use_dynamodb(FakeDynamoDBClient())
+        result = stageFileBatch.stage_file_batch(
+            make_event({'key': 'a.csv'}, {'key': 'b.csv'}), None)
+        self.assertEqual(result, {'batchItemFailures': []})
+        self.assertEqual(client.request_count, 1)
+        self.assertEqual(self.sqs.messages, [])
+
+    def test_unexpected_errors_return_only_that_file_to_the_queue(self):
+        self.use_dynamodb(FakeDynamoDBClient())
+        result = stageFileBatch.stage_file_batch(
+            make_event({'key': 'a.csv'}, {'key': 'b.csv', 'fail': True}),
+            None)
+        self.assertEqual(
+            result, {'batchItemFailures': [{'itemIdentifier': 'message-1'}]})
+
+    def test_files_are_returned_to_the_queue_when_out_of_time(self):
+        self.use_dynamodb(FakeDynamoDBClient())
+        result = stageFileBatch.stage_file_batch(
+            make_event({'key': 'a.csv'}), FakeContext(1000))
+        self.assertEqual(
+            result, {'batchItemFailures': [{'itemIdentifier': 'message-0'}]})
+
+    def test_unwritten_catalog_items_are_sent_to_the_failed_queue(self):
+        self.use_dynamodb(FakeDynamoDBClient(error_code='ValidationException'))
+        result = stageFileBatch.stage_file_batch(
+            make_event({'key': 'a.csv'}, {'key': 'b.csv'}), None)
+        # The files are staged, so they aren't returned to the queue.
+        self.assertEqual(result, {'batchItemFailures': []})
+        self.assertEqual(self.sqs.messages, [
+            {'tableName': 'catalog',
+             'item': {'rawKey': 'a.csv', 'catalogTime': 1}},
+            {'tableName': 'catalog',
+             'item': {'rawKey': 'b.csv', 'catalogTime': 1}}])
+
+
+if __name__ == '__main__':
+    unittest.main()
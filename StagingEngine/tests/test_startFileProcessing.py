@@ -0,0 +1,204 @@
+import json
+import os
+import sys
+import time
+import unittest
+
+from botocore.exceptions import ClientError
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+for name in ('S3_CACHE_TABLE_NAME', 'SNS_FAILURE_ARN', 'STEP_FUNCTION',
+             'DATA_SOURCE_TABLE_NAME', 'DATA_CATALOG_TABLE_NAME',
+             'STAGING_BUCKET_NAME', 'FAILED_BUCKET_NAME'):
+    os.environ.setdefault(name, name.lower())
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import startFileProcessing  # noqa: E402
+
+
+class FakeDynamoDBClient(object):
+    def __init__(self):
+        self.cache = {}
+        self.catalog_items = []
+
+    def put_item(self, TableName, Item, ConditionExpression=None,
+                 ExpressionAttributeValues=None):
+        if TableName != startFileProcessing.s3_cache_table:
+            self.catalog_items.append(Item)
+            return
+        cached = self.cache.get(Item['lastRequestId'])
+        if cached is not None \
+                and cached['expiresAt'] >= ExpressionAttributeValues[':now']:
+            raise ClientError(
+                {'Error': {'Code': 'ConditionalCheckFailedException',
+                           'Message': 'The conditional request failed'}},
+                'PutItem')
+        self.cache[Item['lastRequestId']] = Item
+
+    def delete_item(self, TableName, Key):
+        self.cache.pop(Key['lastRequestId'], None)
+
+
+class FakeDynamoDB(object):
+    def __init__(self, client):
+        self.meta = type('Meta', (object,), {'client': client})
+
+
+class FakeStepFunctions(object):
+    def __init__(self, failing_keys=()):
+        self.failing_keys = failing_keys
+        self.started_keys = []
+
+    def start_execution(self, stateMachineArn, name, input):
+        key = json.loads(input)['fileDetails']['key']
+        if key in self.failing_keys:
+            raise ClientError(
+                {'Error': {'Code': 'ExecutionLimitExceeded',
+                           'Message': 'Too many executions'}},
+                'StartExecution')
+        self.started_keys.append(key)
+
+
+def s3_record(key, version_id='1'):
+    return {'s3': {
+        'bucket': {'name': 'raw'},
+        'object': {'key': key, 'versionId': version_id, 'size': 100}}}
+
+
+def sqs_record(message_id, body):
+    return {'eventSource': 'aws:sqs', 'messageId': message_id,
+            'body': body if isinstance(body, str) else json.dumps(body)}
+
+
+class StartFileProcessingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.original = (startFileProcessing.dynamodb,
+                         startFileProcessing.sfn)
+        self.dynamodb_client = FakeDynamoDBClient()
+        startFileProcessing.dynamodb = FakeDynamoDB(self.dynamodb_client)
+        self.use_step_functions()
+
+    def tearDown(self):
+        (startFileProcessing.dynamodb,
+         startFileProcessing.sfn) = self.original
+
+    def use_step_functions(self, failing_keys=()):
+        self.sfn = startFileProcessing.sfn = FakeStepFunctions(failing_keys)
+
+
+class TestGetFileRecords(StartFileProcessingTestCase):
+
+    def test_s3_notification(self):
+        file_records, failed_record_ids = \
+            startFileProcessing.get_file_records(
+                {'Records': [s3_record('data/a+b%2B.csv')]})
+        self.assertEqual(failed_record_ids, set())
+        self.assertEqual(file_records, [{
+            'recordId': None,
+            'bucket': 'raw',
+            'key': 'data/a b+.csv',
+            'size': 100,
+            'processingCacheKey': 'raw/data/a b+.csv#1'}])
+
+    def test_eventbridge_event(self):
+        event = {
+            'source': 'aws.s3',
+            'detail': {
+                'bucket': {'name': 'raw'},
+                'object': {'key': 'data/a.csv', 'sequencer': '0A1B',
+                           'size': 5}}}
+        file_records, _ = startFileProcessing.get_file_records(event)
+        self.assertEqual(
+            [(r['key'], r['size'], r['processingCacheKey'])
+             for r in file_records],
+            [('data/a.csv', 5, 'raw/data/a.csv#0A1B')])
+
+    def test_sqs_batch_reports_unreadable_messages(self):
+        event = {'Records': [
+            sqs_record('m1', {'Records': [s3_record('a.csv'),
+                                          s3_record('b.csv')]}),
+            sqs_record('m2', '{not json'),
+            sqs_record('m3', {'Event': 's3:TestEvent'})]}
+        file_records, failed_record_ids = \
+            startFileProcessing.get_file_records(event)
+        self.assertEqual(
+            [(r['recordId'], r['key']) for r in file_records],
+            [('m1', 'a.csv'), ('m1', 'b.csv')])
+        self.assertEqual(failed_record_ids, {'m2'})
+
+    def test_event_without_version_or_sequencer_is_not_deduplicated(self):
+        file_records, _ = startFileProcessing.get_file_records(
+            {'Records': [s3_record('a.csv', version_id=None)]})
+        self.assertIsNone(file_records[0]['processingCacheKey'])
+
+
+class TestProcessingCache(StartFileProcessingTestCase):
+
+    def test_claim_expires_after_ttl(self):
+        self.assertFalse(startFileProcessing.is_file_in_processing_cache(
+            startFileProcessing.s3_cache_table, 'raw/a.csv#1'))
+        item = self.dynamodb_client.cache['raw/a.csv#1']
+        self.assertAlmostEqual(
+            item['expiresAt'],
+            time.time() + startFileProcessing.processing_cache_ttl_seconds,
+            delta=5)
+        self.assertTrue(startFileProcessing.is_file_in_processing_cache(
+            startFileProcessing.s3_cache_table, 'raw/a.csv#1'))
+
+        item['expiresAt'] = int(time.time()) - 1
+        self.assertFalse(startFileProcessing.is_file_in_processing_cache(
+            startFileProcessing.s3_cache_table, 'raw/a.csv#1'))
+
+    def test_duplicate_event_is_started_once(self):
+        event = {'Records': [s3_record('a.csv')]}
+        startFileProcessing.start_file_processing(event, None)
+        startFileProcessing.start_file_processing(event, None)
+        self.assertEqual(self.sfn.started_keys, ['a.csv'])
+
+    def test_claim_is_released_when_staging_fails_to_start(self):
+        self.use_step_functions(failing_keys=['a.csv'])
+        event = {'Records': [s3_record('a.csv')]}
+        with self.assertRaises(
+                startFileProcessing.StartFileProcessingException):
+            startFileProcessing.start_file_processing(event, None)
+        self.assertEqual(self.dynamodb_client.cache, {})
+        self.assertEqual(
+            [item['rawKey'] for item in self.dynamodb_client.catalog_items],
+            ['a.csv'])
+
+        # The retry isn't dropped as a duplicate.
+        self.use_step_functions()
+        startFileProcessing.start_file_processing(event, None)
+        self.assertEqual(self.sfn.started_keys, ['a.csv'])
+
+
+class TestBatchItemFailures(StartFileProcessingTestCase):
+
+    def test_only_messages_with_failed_files_are_returned(self):
+        self.use_step_functions(failing_keys=['b.csv', 'c.csv'])
+        event = {'Records': [
+            sqs_record('m1', {'Records': [s3_record('a.csv'),
+                                          s3_record('b.csv'),
+                                          s3_record('c.csv')]}),
+            sqs_record('m2', {'Records': [s3_record('d.csv')]}),
+            sqs_record('m3', '{not json'),
+            sqs_record('m4', {'Records': [s3_record('folder/')]})]}
+        result = startFileProcessing.start_file_processing(event, None)
+        self.assertEqual(result, {'batchItemFailures': [
+            {'itemIdentifier': 'm1'}, {'itemIdentifier': 'm3'}]})
+        self.assertEqual(
+            sorted(self.sfn.started_keys), ['a.csv', 'd.csv'])
+
+    def test_non_sqs_event_raises_on_failure(self):
+        self.use_step_functions(failing_keys=['b.csv'])
+        event = {'Records': [s3_record('a.csv'), s3_record('b.csv')]}
+        with self.assertRaisesRegex(
+                startFileProcessing.StartFileProcessingException,
+                '1 of 2 files'):
+            startFileProcessing.start_file_processing(event, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
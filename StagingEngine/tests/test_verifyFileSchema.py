@@ -0,0 +1,165 @@
+import io
+import json
+import os
+import sys
+import unittest
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+repo_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.insert(0, os.path.join(repo_path, 'StagingEngine', 'src'))
+# The schema validation modules import their vendored packages by name.
+sys.path.append(os.path.join(
+    repo_path, 'StagingEngine', 'src', 'verifyFileSchema'))
+
+from verifyFileSchema import verifyFileSchema  # noqa: E402
+
+
+sample_path = os.path.join(repo_path, 'DataSources', 'RydeBookings')
+
+
+def read_sample(file_name):
+    with open(os.path.join(sample_path, file_name), 'rb') as sample_file:
+        return sample_file.read()
+
+
+class FakeS3Object(object):
+    def __init__(self, content, bodies):
+        self.content = content
+        self.bodies = bodies
+
+    def get(self, Range=None):
+        start = 0
+        if Range is not None:
+            start = int(Range[len('bytes='):].rstrip('-'))
+        body = io.BytesIO(self.content[start:])
+        self.bodies.append(body)
+        return {'Body': body}
+
+
+class FakeS3(object):
+    def __init__(self, content):
+        self.content = content
+        self.bodies = []
+
+    def Object(self, bucket, key):
+        return FakeS3Object(self.content, self.bodies)
+
+
+class TestJsonValidationMaxMegabytes(unittest.TestCase):
+
+    def setUp(self):
+        with open(os.path.join(sample_path, 'ddbDataSourceConfig.json')) \
+                as config_file:
+            self.data_source = json.load(config_file)
+        # Several pretty-printed documents, each spanning many lines. The
+        # second sample has a string totalPassengers, so is invalid.
+        self.valid_document = read_sample('rydebooking-1234567890.json')
+        self.invalid_document = read_sample('rydebooking-2000000000.json')
+        self.content = b'\n'.join([self.valid_document] * 4)
+        self.s3 = verifyFileSchema.s3
+
+    def tearDown(self):
+        verifyFileSchema.s3 = self.s3
+
+    def verify(self, content, max_bytes, single_pass=False):
+        verifyFileSchema.s3 = FakeS3(content)
+        file_settings = dict(self.data_source['fileSettings'])
+        file_settings['validationMaxMegabytes'] = str(
+            max_bytes / (1024.0 * 1024.0))
+        event = {
+            'fileDetails': {
+                'bucket': 'raw',
+                'key': 'rydebookings/rydebooking-1234567890.json',
+                'contentLength': len(content)},
+            'fileSettings': file_settings,
+            'fileType': self.data_source['fileType'],
+            'schema': self.data_source['schema']}
+        if single_pass:
+            byte_chunks = (content[start:start + 64]
+                           for start in range(0, len(content), 64))
+            return verifyFileSchema.verify_content_schema(event, byte_chunks)
+        return verifyFileSchema.lambda_handler(event, None)
+
+    def test_sample_ending_mid_document_is_valid(self):
+        self.assertTrue(len(self.content) > 1000)
+        for max_bytes in (1, 100, 500, 900, len(self.content)):
+            self.verify(self.content, max_bytes)
+
+    def test_single_pass_sample_ending_mid_document_is_valid(self):
+        for max_bytes in (1, 100, 500, 900, len(self.content)):
+            self.verify(self.content, max_bytes, single_pass=True)
+
+    def test_single_pass_documents_after_sample_are_not_validated(self):
+        content = b'\n'.join([self.content, self.invalid_document])
+        self.verify(content, 100, single_pass=True)
+        with self.assertRaises(verifyFileSchema.VerifyFileSchemaException):
+            self.verify(content, len(self.content) + 10, single_pass=True)
+
+    def test_invalid_document_spanning_sample_end_is_found(self):
+        content = b'\n'.join([self.invalid_document, self.content])
+        with self.assertRaises(verifyFileSchema.VerifyFileSchemaException):
+            self.verify(content, 100)
+
+    def test_documents_after_sample_are_not_validated(self):
+        content = b'\n'.join([self.content, self.invalid_document])
+        self.verify(content, 100)
+        with self.assertRaises(verifyFileSchema.VerifyFileSchemaException):
+            self.verify(content, len(self.content) + 10)
+
+
+class TestIterateShardText(unittest.TestCase):
+
+    def setUp(self):
+        self.s3 = verifyFileSchema.s3
+        self.content = b''.join(
+            'line {}\n'.format(number).encode('utf-8')
+            for number in range(100))
+        verifyFileSchema.s3 = FakeS3(self.content)
+
+    def tearDown(self):
+        verifyFileSchema.s3 = self.s3
+
+    def test_shard_reads_lines_starting_in_its_range(self):
+        text = ''.join(verifyFileSchema._iterate_shard_text(
+            'raw', 'key', 9, 30))
+        self.assertEqual(text, 'line 2\nline 3\nline 4\n')
+        self.assertTrue(verifyFileSchema.s3.bodies[0].closed)
+
+    def test_body_is_closed_when_reading_stops_early(self):
+        text_chunks = verifyFileSchema._iterate_shard_text(
+            'raw', 'key', 0, len(self.content))
+        next(text_chunks)
+        text_chunks.close()
+        self.assertTrue(verifyFileSchema.s3.bodies[0].closed)
+
+
+class TestIterateJsonDocuments(unittest.TestCase):
+
+    def test_invalid_json_raises_without_reading_the_rest(self):
+        document = read_sample('rydebooking-1234567890.json').decode('utf-8')
+        chunks_read = []
+
+        def text_chunks():
+            yield document + '\n{"totalPassengers": 1 2, "bookingDetails": {}}\n'
+            for _ in range(1000):
+                chunks_read.append(document)
+                yield document
+
+        with self.assertRaises(ValueError):
+            for _ in verifyFileSchema._iterate_json_documents(text_chunks()):
+                pass
+        self.assertEqual(chunks_read, [])
+
+    def test_documents_split_anywhere_are_decoded(self):
+        document = read_sample('rydebooking-1234567890.json').decode('utf-8')
+        text = '\n'.join([document] * 3)
+        for chunk_size in (1, 2, 5, 13):
+            chunks = [text[start:start + chunk_size]
+                      for start in range(0, len(text), chunk_size)]
+            self.assertEqual(
+                len(list(verifyFileSchema._iterate_json_documents(chunks))),
+                3)
+
+
+if __name__ == '__main__':
+    unittest.main()
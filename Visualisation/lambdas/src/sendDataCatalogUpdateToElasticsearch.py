@@ -2,8 +2,10 @@ import datetime
 import json
 import logging
 import os
+import random
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 from botocore.auth import SigV4Auth
 from botocore.awsrequest import AWSRequest
@@ -14,19 +16,51 @@ from boto3.dynamodb.types import TypeDeserializer
 
 
 elasticsearch_endpoint = os.environ['ELASTICSEARCH_ENDPOINT']
+es_region = os.environ['AWS_REGION']
 # Python formatter to generate index name from the DynamoDB
 # table name
 DOC_TABLE_FORMAT = '{}'
 # Python formatter to generate type name from the DynamoDB
 # tablename, default is to add '_type' suffix
 DOC_TYPE_FORMAT = '{}_type'
+# Low bits of a document's external version taken from its record's sequence
+# number, and the largest version ES accepts
+VERSION_SEQUENCE_BITS = 32
+VERSION_SEQUENCE_MASK = 2 ** VERSION_SEQUENCE_BITS - 1
+MAX_DOC_VERSION = 2 ** 63 - 1
 # Max number of retries for exponential backoff
-ES_MAX_RETRIES = 3
-# Set verbose debugging information
-DEBUG = True
+ES_MAX_RETRIES = int(os.environ.get('ES_MAX_RETRIES', '5'))
+# Base and cap in seconds of the jittered exponential backoff
+ES_RETRY_BASE_SECONDS = 0.1
+ES_RETRY_MAX_SECONDS = 10
+# Max size in bytes and max number of actions of a bulk request. Larger
+# batches are split.
+ES_BULK_MAX_BYTES = int(
+    os.environ.get('ES_BULK_MAX_BYTES', str(5 * 1024 * 1024)))
+ES_BULK_MAX_ACTIONS = int(os.environ.get('ES_BULK_MAX_ACTIONS', '1000'))
+# Max number of bulk requests sent to ES at once
+ES_BULK_CONCURRENCY = int(os.environ.get('ES_BULK_CONCURRENCY', '4'))
+# Log level, DEBUG logs a preview of every bulk request and response
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# Fraction of invocations that log their previews at INFO, whatever the
+# log level
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '0'))
+# Max size in bytes of a request or response preview
+LOG_PREVIEW_BYTES = int(os.environ.get('LOG_PREVIEW_BYTES', '1024'))
 
 logger = logging.getLogger()
-logger.setLevel(logging.DEBUG if DEBUG else logging.INFO)
+logger.setLevel(LOG_LEVEL)
+# botocore's debug logs include whole requests, so are never enabled
+logging.getLogger('botocore').setLevel(
+    max(logger.getEffectiveLevel(), logging.INFO))
+# Whether this invocation logs its previews, set per invocation
+log_sampled = False
+
+# Reused by warm lambda containers, so connections to ES are kept alive
+# between requests and invocations.
+http_session = BotocoreHTTPSession(max_pool_connections=ES_BULK_CONCURRENCY)
+# The lambda's credentials, resolved once per container
+es_credentials = None
 
 
 class SendDataCatalogUpdateToElasticsearch(Exception):
@@ -43,7 +77,7 @@ class ES_Exception(Exception):
         Exception.__init__(
             self,
             'ES_Exception: status_code={}, payload={}'.format(
-                status_code, payload))
+                status_code, get_preview(payload)))
 
 
 # Subclass of boto's TypeDeserializer for DynamoDB to adjust
@@ -56,21 +90,35 @@ class StreamTypeDeserializer(TypeDeserializer):
         return value  # Already in Base64
 
 
-# Global lambda handler - catches all exceptions to avoid
-# dead letter in the DynamoDB Stream
+# Global lambda handler - catches all exceptions to log them. Records whose
+# documents couldn't be sent to ES are returned as partial batch failures,
+# to be retried. After an unexpected exception every record is returned, as
+# any of them may not have been sent.
 def lambda_handler(event, context):
     try:
         return _lambda_handler(event, context)
     except Exception:
         logger.error(traceback.format_exc())
+        return {
+            'batchItemFailures': [
+                {'itemIdentifier': record['dynamodb']['SequenceNumber']}
+                for record in event['Records']]
+        }
 
 
 def _lambda_handler(event, context):
+    global log_sampled
+    log_sampled = random.random() < LOG_SAMPLE_RATE
+    start_time = time.time()
     records = event['Records']
     now = datetime.datetime.utcnow()
 
     ddb_deserializer = StreamTypeDeserializer()
-    es_actions = []  # Items to be added/updated/removed from ES - for bulk API
+    # Items to be added/updated/removed from ES - for bulk API. Keyed by
+    # document, as only the action of its latest record in the batch needs
+    # to be sent. Each keeps the sequence number of its record, to report
+    # failures.
+    es_actions = {}
     for record in records:
         ddb = record['dynamodb']
         ddb_table_name = get_table_name_from_arn(record['eventSourceARN'])
@@ -81,9 +129,25 @@ def _lambda_handler(event, context):
         doc_type = DOC_TYPE_FORMAT.format(ddb_table_name.lower())
         doc_index = compute_doc_index(ddb['Keys'], ddb_deserializer)
 
+        # Skip the record if a later one for the same document is queued
+        doc_key = (doc_table, doc_index)
+        if doc_key in es_actions \
+                and int(es_actions[doc_key]['sequenceNumber']) > int(doc_seq):
+            continue
+
         # Get the event type
         event_name = record['eventName'].upper()  # INSERT, MODIFY, REMOVE
 
+        action_metadata = {
+            '_index': doc_table,
+            '_type': doc_type,
+            '_id': doc_index}
+        # Stop ES applying a record older than the one it already has
+        doc_version = get_doc_version(ddb)
+        if doc_version is not None:
+            action_metadata['version'] = doc_version
+            action_metadata['version_type'] = 'external'
+
         # If DynamoDB INSERT or MODIFY, send 'index' to ES
         if (event_name == 'INSERT') or (event_name == 'MODIFY'):
             if 'NewImage' not in ddb:
@@ -101,37 +165,107 @@ def _lambda_handler(event, context):
             doc_json = json.dumps(doc_fields)
 
             # Generate ES payload for item
-            action = {
-                'index': {
-                    '_index': doc_table,
-                    '_type': doc_type,
-                    '_id': doc_index}}
-            es_actions.append(json.dumps(action))
-            es_actions.append(doc_json)
-
-    # Prepare bulk payload
-    es_actions.append('')  # Add one empty line to force final \n
-    es_payload = '\n'.join(es_actions)
-    print("PAYLOAD:{}".format(es_payload))
-
-    post_to_es(es_payload)  # Post to ES with exponential backoff
-
-
-# High-level POST data to Amazon Elasticsearch Service with exponential backoff
-def post_to_es(payload):
+            action = {'index': action_metadata}
+            es_actions[doc_key] = {
+                'action': 'index',
+                'payload': '{}\n{}\n'.format(json.dumps(action), doc_json),
+                'sequenceNumber': doc_seq}
+
+        # If DynamoDB REMOVE, send 'delete' to ES
+        elif event_name == 'REMOVE':
+            action = {'delete': action_metadata}
+            es_actions[doc_key] = {
+                'action': 'delete',
+                'payload': '{}\n'.format(json.dumps(action)),
+                'sequenceNumber': doc_seq}
+
+    # Post the bulk chunks to ES concurrently, each retrying its failed items
+    # with exponential backoff. Each document has one action, so its updates
+    # can't be reordered.
+    es_chunks = get_bulk_chunks(list(es_actions.values()))
+    failed_actions = []
+    metrics = {
+        'records': len(records),
+        'docs': sum(1 for es_action in es_actions.values()
+                    if es_action['action'] == 'index'),
+        'deletes': sum(1 for es_action in es_actions.values()
+                       if es_action['action'] == 'delete'),
+        'requests': 0,
+        'retries': 0,
+        'bytes': 0,
+        'took': 0,
+        'errors': 0}
+    with ThreadPoolExecutor(max_workers=ES_BULK_CONCURRENCY) as executor:
+        for chunk_failed_actions, chunk_metrics in executor.map(
+                post_to_es, es_chunks):
+            failed_actions.extend(chunk_failed_actions)
+            for name, value in chunk_metrics.items():
+                metrics[name] += value
+
+    # One line per batch, for CloudWatch Logs Insights to aggregate
+    metrics['failed'] = len(failed_actions)
+    metrics['duration'] = int((time.time() - start_time) * 1000)
+    logger.info('Batch metrics: %s', json.dumps(metrics))
+
+    # The stream is retried from the earliest failed record
+    return {
+        'batchItemFailures': [
+            {'itemIdentifier': es_action['sequenceNumber']}
+            for es_action in failed_actions]
+    }
+
+
+# Splits the bulk actions into chunks of at most ES_BULK_MAX_BYTES and
+# ES_BULK_MAX_ACTIONS, keeping their order. An action larger than
+# ES_BULK_MAX_BYTES is sent on its own.
+def get_bulk_chunks(es_actions):
+    es_chunks = []
+    chunk_actions = []
+    chunk_bytes = 0
+    for es_action in es_actions:
+        action_bytes = len(es_action['payload'].encode('utf-8'))
+        if chunk_actions \
+                and (chunk_bytes + action_bytes > ES_BULK_MAX_BYTES
+                     or len(chunk_actions) >= ES_BULK_MAX_ACTIONS):
+            es_chunks.append(chunk_actions)
+            chunk_actions = []
+            chunk_bytes = 0
+        chunk_actions.append(es_action)
+        chunk_bytes += action_bytes
+
+    if chunk_actions:
+        es_chunks.append(chunk_actions)
+    return es_chunks
+
+
+# Returns the credentials used to sign requests to ES. They're resolved once
+# per container; refreshable credentials refresh themselves on expiry.
+def get_es_credentials():
+    global es_credentials
+    if es_credentials is None:
+        es_credentials = get_credentials(Session())
+    return es_credentials
+
+
+# High-level POST of a chunk of bulk actions to Amazon Elasticsearch Service.
+# Only the items that failed with a retryable status are retried, with
+# jittered exponential backoff. Items that failed with another status are
+# logged and dropped, as retrying can't help them. Returns the actions that
+# still failed after ES_MAX_RETRIES, or all of them if ES rejected the request,
+# and the chunk's metrics.
+def post_to_es(es_actions):
+    metrics = {'requests': 0, 'retries': 0, 'bytes': 0, 'took': 0, 'errors': 0}
+
+    # Get credentials to post signed URL to ES
+    creds = get_es_credentials()
 
-    # Get aws_region and credentials to post signed URL to ES
-    es_region = os.environ['AWS_REGION']
-    session = Session({'region': es_region})
-    creds = get_credentials(session)
-
-    # Post data with exponential backoff
     retries = 0
-    while retries < ES_MAX_RETRIES:
-        if retries > 0:
-            seconds = (2 ** retries) * .1
-            time.sleep(seconds)
-
+    while True:
+        payload = ''.join(
+            es_action['payload'] for es_action in es_actions).encode('utf-8')
+        log_preview('Bulk request', payload)
+        metrics['requests'] += 1
+        metrics['bytes'] += len(payload)
         try:
             es_ret_str = post_data_to_es(
                 payload,
@@ -139,45 +273,86 @@ def post_to_es(payload):
                 creds,
                 elasticsearch_endpoint,
                 '/_bulk')
+            log_preview('Bulk response', es_ret_str)
             es_ret = json.loads(es_ret_str)
+            metrics['took'] += es_ret['took']
+            logger.debug('ES post took=%sms', es_ret['took'])
 
             if es_ret['errors']:
-                logger.error(
-                    'ES post unsuccessful, errors present, took=%sms',
-                    es_ret['took'])
-                # Filter errors
-                es_errors = \
-                    [item for item in es_ret['items'] if
-                        item.get('index').get('error')]
-                logger.error(
-                    'List of items with errors: %s',
-                    json.dumps(es_errors))
+                metrics['errors'] += sum(
+                    1 for item in es_ret['items']
+                    if 'error' in list(item.values())[0])
+                es_actions = get_retryable_actions(es_actions, es_ret)
             else:
-                logger.info('ES post successful, took=%sms', es_ret['took'])
-            break  # Sending to ES was ok, break retry loop
+                es_actions = []
         except ES_Exception as e:
-            if (e.status_code >= 500) and (e.status_code <= 599):
-                retries += 1  # Candidate for retry
+            metrics['errors'] += 1
+            if not is_retryable_status(e.status_code):
+                logger.error('ES post rejected: %s', e)
+                return es_actions, metrics
+            logger.warning('ES post failed: %s', e)
+        except Exception:
+            # Connection errors are retried
+            metrics['errors'] += 1
+            logger.warning(traceback.format_exc())
+
+        if not es_actions:
+            return [], metrics
+        if retries >= ES_MAX_RETRIES:
+            logger.error(
+                '%s items failed after %s retries',
+                len(es_actions), retries)
+            return es_actions, metrics
+
+        retries += 1
+        metrics['retries'] += 1
+        time.sleep(random.uniform(0, min(
+            ES_RETRY_MAX_SECONDS, ES_RETRY_BASE_SECONDS * 2 ** retries)))
+
+
+# Returns the actions whose items failed with a retryable status, from a bulk
+# response listing an item for each action in order. Other failed items are
+# logged.
+def get_retryable_actions(es_actions, es_ret):
+    retryable_actions = []
+    for es_action, item in zip(es_actions, es_ret['items']):
+        item_result = list(item.values())[0]
+        if 'error' not in item_result:
+            continue
+        if item_result.get('status') == 409:
+            # ES already has this or a later version of the document
+            logger.info('Item superseded: %s', json.dumps(item))
+            continue
+        if is_retryable_status(item_result.get('status', 0)):
+            retryable_actions.append(es_action)
         else:
-            raise  # Stop retrying, re-raise exception
+            logger.error('Item failed: %s', json.dumps(item))
+
+    if retryable_actions:
+        logger.warning(
+            '%s items failed with retryable errors', len(retryable_actions))
+    return retryable_actions
+
+
+# ES is overloaded (429) or failing (5xx), so the request may succeed later
+def is_retryable_status(status_code):
+    return status_code == 429 or 500 <= status_code <= 599
 
 
 def post_data_to_es(
         payload, region, creds, host,
         path, method='POST', proto='https://'):
 
-    print("URL:{}".format(proto+host+path))
     req = AWSRequest(
         method=method,
         url=proto+host+path,
         data=payload,
         headers={'Host': host, 'Content-Type': 'application/json'})
-    SigV4Auth(creds, 'es', region).add_auth(req)
-    http_session = BotocoreHTTPSession()
+    # Sign with a snapshot of the credentials, as they may be refreshed by
+    # another thread while signing.
+    SigV4Auth(creds.get_frozen_credentials(), 'es', region).add_auth(req)
     res = http_session.send(req.prepare())
-    print("STATUS_CODE:{}".format(res.status_code))
-    print("CONTENT:{}".format(res._content))
-    print("ALL:{}".format(res))
+    logger.debug('ES %s %s status=%s', method, path, res.status_code)
 
     if res.status_code >= 200 and res.status_code <= 299:
         return res._content
@@ -185,6 +360,43 @@ def post_data_to_es(
         raise ES_Exception(res.status_code, res._content)
 
 
+# Logs a preview of a bulk request or response. Previews are debug logs,
+# logged at INFO by sampled invocations.
+def log_preview(label, data):
+    level = logging.INFO if log_sampled else logging.DEBUG
+    if logger.isEnabledFor(level):
+        logger.log(level, '%s (%s bytes): %s',
+                   label, len(data), get_preview(data))
+
+
+# First LOG_PREVIEW_BYTES of a request or response, marked if cut short
+def get_preview(data):
+    preview = data[:LOG_PREVIEW_BYTES]
+    if isinstance(preview, bytes):
+        preview = preview.decode('utf-8', 'replace')
+    if len(data) > LOG_PREVIEW_BYTES:
+        preview += '...'
+    return preview
+
+
+# External version of a record's document. DynamoDB sequence numbers are too
+# long for ES's versions, which must fit in 63 bits, so the version is the
+# second the record was written in the high bits and the low
+# VERSION_SEQUENCE_BITS of its sequence number below. A document's records are
+# all in one shard, whose sequence numbers increase, so records written in the
+# same second are still ordered. Versions are compared with external, so a
+# record is only applied if it is later than the one ES has.
+def get_doc_version(ddb):
+    if 'ApproximateCreationDateTime' not in ddb:
+        return None
+    creation_seconds = int(ddb['ApproximateCreationDateTime'])
+    version = (creation_seconds << VERSION_SEQUENCE_BITS) \
+        | (int(ddb['SequenceNumber']) & VERSION_SEQUENCE_MASK)
+    if version > MAX_DOC_VERSION:
+        return None
+    return version
+
+
 # Extracts the DynamoDB table from an ARN
 def get_table_name_from_arn(arn):
     return arn.split(':')[5].split('/')[1]
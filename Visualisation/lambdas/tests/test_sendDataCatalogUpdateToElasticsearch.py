@@ -0,0 +1,201 @@
+import json
+import os
+import sys
+import unittest
+
+import botocore.endpoint
+import botocore.httpsession
+
+os.environ.setdefault('AWS_REGION', 'us-east-1')
+os.environ.setdefault('ELASTICSEARCH_ENDPOINT', 'search.example.com')
+# Later botocore releases moved the lambda's HTTP session class.
+if not hasattr(botocore.endpoint, 'BotocoreHTTPSession'):
+    botocore.endpoint.BotocoreHTTPSession = \
+        botocore.httpsession.URLLib3Session
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import sendDataCatalogUpdateToElasticsearch as indexer  # noqa: E402
+
+
+TABLE_ARN = 'arn:aws:dynamodb:us-east-1:123456789012:table/DataCatalog/' \
+    'stream/2020-01-01T00:00:00.000'
+
+
+def make_record(raw_key, sequence_number, event_name='INSERT',
+                created=1600000000):
+    keys = {'rawKey': {'S': raw_key}, 'catalogTime': {'N': '1'}}
+    ddb = {
+        'SequenceNumber': str(sequence_number),
+        'ApproximateCreationDateTime': created,
+        'Keys': keys}
+    if event_name != 'REMOVE':
+        ddb['NewImage'] = dict(keys, stagingKey={'S': raw_key})
+    return {'eventName': event_name, 'eventSourceARN': TABLE_ARN,
+            'dynamodb': ddb}
+
+
+def make_action(doc_id, size=10):
+    return {'action': 'index',
+            'payload': '{}\n{}\n'.format(
+                json.dumps({'index': {'_id': doc_id}}), 'x' * size),
+            'sequenceNumber': doc_id}
+
+
+class FakeES(object):
+    '''
+    Answers bulk requests, failing the items of the documents in
+    statuses with their status.
+    '''
+    def __init__(self, statuses=None):
+        self.statuses = statuses or {}
+        self.requests = []
+
+    def post(self, payload, region, creds, host, path):
+        lines = payload.decode('utf-8').splitlines()
+        actions = []
+        while lines:
+            action = json.loads(lines.pop(0))
+            (name, metadata), = action.items()
+            if name != 'delete':
+                lines.pop(0)
+            actions.append((name, metadata))
+        self.requests.append(actions)
+
+        items = []
+        for name, metadata in actions:
+            status = self.statuses.get(metadata['_id'], 200)
+            item = {'_id': metadata['_id'], 'status': status}
+            if status >= 300:
+                item['error'] = {'type': 'error'}
+            items.append({name: item})
+        return json.dumps({
+            'took': 1,
+            'errors': any('error' in list(item.values())[0]
+                          for item in items),
+            'items': items}).encode('utf-8')
+
+
+class IndexerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.original = (indexer.post_data_to_es,
+                         indexer.get_es_credentials,
+                         indexer.ES_RETRY_BASE_SECONDS,
+                         indexer.ES_BULK_MAX_BYTES,
+                         indexer.ES_BULK_MAX_ACTIONS)
+        indexer.get_es_credentials = lambda: None
+        indexer.ES_RETRY_BASE_SECONDS = 0
+        self.use_es()
+
+    def tearDown(self):
+        (indexer.post_data_to_es,
+         indexer.get_es_credentials,
+         indexer.ES_RETRY_BASE_SECONDS,
+         indexer.ES_BULK_MAX_BYTES,
+         indexer.ES_BULK_MAX_ACTIONS) = self.original
+
+    def use_es(self, statuses=None):
+        self.es = FakeES(statuses)
+        indexer.post_data_to_es = self.es.post
+
+    def sent_actions(self):
+        return [(name, metadata['_id'])
+                for request in self.es.requests
+                for name, metadata in request]
+
+
+class TestGetRetryableActions(IndexerTestCase):
+
+    def test_only_retryable_failures_are_returned(self):
+        es_actions = [make_action(str(n)) for n in range(5)]
+        es_ret = {'items': [
+            {'index': {'status': 201}},
+            {'index': {'status': 409, 'error': {}}},
+            {'index': {'status': 429, 'error': {}}},
+            {'index': {'status': 400, 'error': {}}},
+            {'delete': {'status': 503, 'error': {}}}]}
+        self.assertEqual(
+            indexer.get_retryable_actions(es_actions, es_ret),
+            [es_actions[2], es_actions[4]])
+
+
+class TestGetBulkChunks(IndexerTestCase):
+
+    def test_chunks_are_limited_by_actions_and_bytes(self):
+        indexer.ES_BULK_MAX_ACTIONS = 3
+        indexer.ES_BULK_MAX_BYTES = \
+            3 * len(make_action('0')['payload']) - 1
+        es_actions = [make_action(str(n)) for n in range(5)]
+        self.assertEqual(
+            indexer.get_bulk_chunks(es_actions),
+            [es_actions[0:2], es_actions[2:4], es_actions[4:5]])
+
+        indexer.ES_BULK_MAX_BYTES = 10 ** 6
+        self.assertEqual(
+            indexer.get_bulk_chunks(es_actions),
+            [es_actions[0:3], es_actions[3:5]])
+
+    def test_oversized_action_is_sent_alone(self):
+        indexer.ES_BULK_MAX_BYTES = 100
+        es_actions = [make_action('0'), make_action('1', size=200),
+                      make_action('2')]
+        self.assertEqual(
+            indexer.get_bulk_chunks(es_actions),
+            [[es_actions[0]], [es_actions[1]], [es_actions[2]]])
+
+
+class TestLambdaHandler(IndexerTestCase):
+
+    def test_only_the_latest_record_of_a_document_is_sent(self):
+        result = indexer.lambda_handler({'Records': [
+            make_record('a.csv', 101),
+            make_record('b.csv', 102),
+            make_record('a.csv', 103, 'MODIFY'),
+            make_record('a.csv', 104, 'REMOVE'),
+            make_record('b.csv', 100, 'MODIFY')]}, None)
+        self.assertEqual(result, {'batchItemFailures': []})
+        self.assertEqual(self.sent_actions(), [
+            ('delete', 'catalogTime=1.0|rawKey=a.csv'),
+            ('index', 'catalogTime=1.0|rawKey=b.csv')])
+
+    def test_versions_order_records_created_in_the_same_second(self):
+        indexer.lambda_handler({'Records': [
+            make_record('a.csv', 10 ** 30 + 1),
+            make_record('b.csv', 10 ** 30 + 2),
+            make_record('c.csv', 10 ** 30 + 3, created=1600000001)]}, None)
+        versions = [metadata['version']
+                    for name, metadata in self.es.requests[0]]
+        self.assertEqual(versions, sorted(set(versions)))
+        self.assertTrue(all(version < 2 ** 63 for version in versions))
+        self.assertEqual(
+            {metadata['version_type']
+             for name, metadata in self.es.requests[0]},
+            {'external'})
+
+    def test_superseded_documents_are_not_retried(self):
+        self.use_es({'catalogTime=1.0|rawKey=a.csv': 409})
+        result = indexer.lambda_handler(
+            {'Records': [make_record('a.csv', 101)]}, None)
+        self.assertEqual(result, {'batchItemFailures': []})
+        self.assertEqual(len(self.es.requests), 1)
+
+    def test_failed_documents_are_returned_as_batch_item_failures(self):
+        indexer.ES_MAX_RETRIES, max_retries = 1, indexer.ES_MAX_RETRIES
+        try:
+            self.use_es({'catalogTime=1.0|rawKey=b.csv': 503,
+                         'catalogTime=1.0|rawKey=c.csv': 400})
+            result = indexer.lambda_handler({'Records': [
+                make_record('a.csv', 101),
+                make_record('b.csv', 102),
+                make_record('c.csv', 103)]}, None)
+        finally:
+            indexer.ES_MAX_RETRIES = max_retries
+        self.assertEqual(
+            result, {'batchItemFailures': [{'itemIdentifier': '102'}]})
+        self.assertEqual(
+            [len(request) for request in self.es.requests], [3, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()